@@ -14,23 +14,23 @@ cd "$GITHUB_PAGES_DIR"
 echo "📦 Copiando base de dados atualizada..."
 cp /home/diogo/Desktop/assiduidade_parlamento/database/base.db database/base.db
 
-# 2. Exportar dados para JSON
+# 2. Exportar dados para JSON (incremental: estado em data/.export_estado.json)
 echo "📊 Exportando dados para JSON..."
-python3 export_to_json.py
+python3 export_to_json.py --compacto
 
 if [ $? -ne 0 ]; then
   echo "❌ Erro ao exportar dados!"
   exit 1
 fi
 
-# 3. Verificar se há mudanças
-if ! git diff --quiet data/; then
+# 3. Verificar se há mudanças (inclui ficheiros por deputado novos/removidos em data/deputados/)
+if [ -n "$(git status --porcelain data/)" ]; then
   echo "✅ Mudanças detectadas nos dados JSON"
   
   # 4. Fazer commit das mudanças
   DATA_ATUAL=$(date '+%Y-%m-%d %H:%M:%S')
   echo "💾 Fazendo commit das alterações..."
-  git add data/*.json
+  git add -A data/
   git commit -m "📊 Atualização automática de dados - $DATA_ATUAL"
   
   # 5. Push para GitHub
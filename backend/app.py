@@ -1,24 +1,181 @@
-from flask import Flask, request, jsonify
+import json
+
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func, case
+from sqlalchemy import func
 from datetime import datetime
 # Imports absolutos (sem o ".")
 from processador import validar_e_preparar
-from processador_atividade import process_atividade, process_agenda
+from processador_atividade import detetar_tipo, ingerir_ficheiro
+from ingestao import Cronometro, ingerir_sessao
+from historico_ingestao import hash_stream, registar_ingestao, concluir_ingestao
+from cache import em_cache, cache_respostas, geracao_dados
+from fluxo_json import resposta_json, LOTE_LINHAS
+from paginacao import Listagem, PedidoInvalido, iso
+from resumos import somas_resumo_deputado, reconstruir_se_vazio
+from mandatos import movimentos, reconstruir_intervalos_se_vazio
+from nomes import resolver_nome, indexar_em_falta
+from classificacoes import CRITERIOS, TODAS, reconstruir_classificacoes_se_vazio
+from series import GRANULARIDADES, TODOS, reconstruir_series_se_vazio
+from pesquisa import tabela_fts, corresponde, trecho
+from estatisticas import (
+    somas_por_estado,
+    agregados_por_sessao,
+    resumo_sessoes,
+    resumo_periodos,
+    resumo_analise_avancada,
+    sessoes_por_dia_semana,
+)
 from models import (
     get_engine_and_session,
+    inicializar_bd,
     Deputado,
     Sessao,
     Assiduidade,
     DeputadoAtividade,
     AgendaItem,
+    ResumoDeputado,
+    ResumoPeriodo,
+    Classificacao,
+    MediaPartido,
+    Ingestao,
+    fts_disponivel,
 )
 
 app = Flask(__name__)
 CORS(app)
 
 
+def _inicializar():
+    """Arranque: tabelas/migrações e, em BDs anteriores às tabelas de resumo/séries/intervalos/nomes/classificações, preenchê-las."""
+    inicializar_bd()
+    _, SessionLocal = get_engine_and_session()
+    s = SessionLocal()
+    try:
+        reconstruiu = reconstruir_se_vazio(s)
+        reconstruiu = reconstruir_series_se_vazio(s) or reconstruiu
+        reconstruiu = reconstruir_intervalos_se_vazio(s) or reconstruiu
+        reconstruiu = reconstruir_classificacoes_se_vazio(s) or reconstruiu
+        if indexar_em_falta(s) or reconstruiu:
+            s.commit()
+    finally:
+        s.close()
+
+
+_inicializar()
+
+
+def get_session():
+    """Sessão da BD do pedido atual (uma por pedido, fechada no teardown)."""
+    if "db" not in g:
+        _, SessionLocal = get_engine_and_session()
+        g.db = SessionLocal()
+    return g.db
+
+
+@app.teardown_appcontext
+def fechar_sessao(exc):
+    s = g.pop("db", None)
+    if s is not None:
+        if exc is not None:
+            s.rollback()
+        s.close()
+
+
+@app.errorhandler(PedidoInvalido)
+def pedido_invalido(e):
+    return jsonify({"ok": False, "mensagem": str(e)}), 400
+
+
+# Listagens paginadas (paginacao.py): campo da resposta → (coluna, conversão), chave de ordenação
+LISTAGEM_ATIVIDADES = Listagem("atividades", {
+    "deputado": (Deputado.nome_original_ultimo, None),
+    "partido": (Deputado.partido_atual, None),
+    "tipo": (DeputadoAtividade.tipo, None),
+    "total": (DeputadoAtividade.total, None),
+    "legislatura": (DeputadoAtividade.legislatura, None),
+    "detalhes": (DeputadoAtividade.detalhes, lambda v: v or ""),
+    "ultima_data": (DeputadoAtividade.ultima_data, iso),
+}, DeputadoAtividade.total, DeputadoAtividade.id, descendente=True)
+
+LISTAGEM_AGENDA = Listagem("agenda", {
+    "titulo": (AgendaItem.titulo, None),
+    "tema": (AgendaItem.tema, None),
+    "secao": (AgendaItem.secao, None),
+    "local": (AgendaItem.local, None),
+    "legislatura": (AgendaItem.leg_des, None),
+    "inicio": (AgendaItem.inicio, iso),
+    "fim": (AgendaItem.fim, iso),
+    "link": (AgendaItem.link, None),
+    "texto": (AgendaItem.texto, None),
+}, AgendaItem.inicio, AgendaItem.id)
+
+# Pesquisa de texto (pesquisa.py): ordenada por relevância (bm25), com trecho das palavras encontradas
+AGENDA_FTS = tabela_fts("agenda_fts")
+ATIVIDADES_FTS = tabela_fts("atividades_fts")
+
+LISTAGEM_PESQUISA_AGENDA = Listagem("pesquisa_agenda", {
+    "titulo": (AgendaItem.titulo, None),
+    "tema": (AgendaItem.tema, None),
+    "secao": (AgendaItem.secao, None),
+    "legislatura": (AgendaItem.leg_des, None),
+    "inicio": (AgendaItem.inicio, iso),
+    "link": (AgendaItem.link, None),
+    "trecho": (trecho(AGENDA_FTS), None),
+}, AGENDA_FTS.c.rank, AgendaItem.id, anulavel=False)
+
+LISTAGEM_PESQUISA_ATIVIDADES = Listagem("pesquisa_atividades", {
+    "deputado": (Deputado.nome_original_ultimo, None),
+    "partido": (Deputado.partido_atual, None),
+    "tipo": (DeputadoAtividade.tipo, None),
+    "total": (DeputadoAtividade.total, None),
+    "legislatura": (DeputadoAtividade.legislatura, None),
+    "trecho": (trecho(ATIVIDADES_FTS), None),
+}, ATIVIDADES_FTS.c.rank, DeputadoAtividade.id, anulavel=False)
+
+LISTAGEM_SESSOES = Listagem("sessoes", {
+    "id_legis_sessao": (Sessao.id_legis_sessao, None),
+    "legislatura": (Sessao.legislatura, None),
+    "numero": (Sessao.numero, None),
+    "tipo": (Sessao.tipo, None),
+    "data": (Sessao.data, iso),
+}, Sessao.data, Sessao.id, descendente=True)
+
+LISTAGEM_INGESTOES = Listagem("ingestoes", {
+    "id": (Ingestao.id, None),
+    "tipo": (Ingestao.tipo, None),
+    "ficheiro": (Ingestao.ficheiro, None),
+    "hash": (Ingestao.hash, None),
+    "bytes": (Ingestao.bytes, None),
+    "recebido_em": (Ingestao.recebido_em, iso),
+    "estado": (Ingestao.estado, None),
+    "unidades": (Ingestao.unidades, None),
+    "unidades_alteradas": (Ingestao.unidades_alteradas, None),
+    "geracao": (Ingestao.geracao, None),
+    "estatisticas": (Ingestao.estatisticas, lambda v: json.loads(v) if v else None),
+}, Ingestao.id, Ingestao.id, descendente=True)
+
+
+
+def _listagem_classificacao(nome: str, coluna, descendente: bool) -> Listagem:
+    return Listagem(nome, {
+        "posicao": (Classificacao.posicao, None),
+        "posicao_partido": (Classificacao.posicao_partido, None),
+        "nome": (Deputado.nome_original_ultimo, None),
+        "partido": (Classificacao.partido, None),
+        "valor": (Classificacao.valor, None),
+    }, coluna, Classificacao.deputado_id, descendente=descendente, anulavel=False)
+
+
+# Classificações (classificacoes.py), chave (por partido, inversa): intervalos do índice da posição
+LISTAGENS_CLASSIFICACAO = {
+    (False, False): _listagem_classificacao("classificacao", Classificacao.posicao, False),
+    (False, True): _listagem_classificacao("classificacao_inversa", Classificacao.posicao, True),
+    (True, False): _listagem_classificacao("classificacao_partido", Classificacao.posicao_partido, False),
+    (True, True): _listagem_classificacao("classificacao_partido_inversa", Classificacao.posicao_partido, True),
+}
+
+
 def parse_iso_date(value):
     if not value:
         return None
@@ -27,6 +184,22 @@ def parse_iso_date(value):
     except ValueError:
         return None
 
+def linha_deputado(reg) -> dict:
+    """Converte uma linha agregada (nome, partido, somas por estado) no contrato da API."""
+    presencas = reg.presencas or 0
+    faltas_penalizadoras = reg.faltas_penalizadoras or 0
+    denom = presencas + faltas_penalizadoras
+    assiduidade_pct = (presencas / denom * 100) if denom else 0.0
+    return {
+        "nome": reg.nome,
+        "partido": reg.partido,
+        "presencas": presencas,
+        "faltas_justificadas": reg.faltas_justificadas or 0,
+        "missao_parlamentar_amp": reg.missao_parlamentar_amp or 0,
+        "faltas_penalizadoras": faltas_penalizadoras,
+        "assiduidade_pct": round(assiduidade_pct, 2)
+    }
+
 @app.route("/upload", methods=["POST"])
 def upload():
     if "file" not in request.files:
@@ -41,55 +214,46 @@ def upload():
     if filename.lower().endswith(".json"):
         try:
             from pathlib import Path
-            import json
             uploads_dir = Path(__file__).resolve().parent.parent / "uploads"
             uploads_dir.mkdir(parents=True, exist_ok=True)
             destino = uploads_dir / filename
             file.save(str(destino))
 
-            # Inspecionar para decidir o processador
-            with destino.open() as fh:
-                payload = json.load(fh)
-            if isinstance(payload, list) and payload:
-                item0 = payload[0]
-                engine, SessionLocal = get_engine_and_session()
-                s = SessionLocal()
-                try:
-                    if isinstance(item0, dict) and "AtividadeDeputadoList" in item0 and "Deputado" in item0:
-                        process_atividade(destino, s)
-                        s.commit()
-                        total = len(payload)
-                        return jsonify({
-                            "ok": True,
-                            "mensagem": f"Atividade carregada com sucesso ({total} deputados).",
-                            "tipo": "atividade",
-                            "ficheiro": filename
-                        })
-                    elif isinstance(item0, dict) and "EventStartDate" in item0 and "Title" in item0:
-                        process_agenda(destino, s)
-                        s.commit()
-                        total = len(payload)
-                        return jsonify({
-                            "ok": True,
-                            "mensagem": f"Agenda carregada com sucesso ({total} eventos).",
-                            "tipo": "agenda",
-                            "ficheiro": filename
-                        })
-                finally:
-                    s.close()
+            # Decidir o processador só pelo primeiro elemento; o ficheiro é lido em fluxo
+            tipo = detetar_tipo(destino)
+            if tipo is not None:
+                s = get_session()
+                # Com histórico de ingestões: ficheiro/unidades iguais aos já carregados são saltados
+                stats = ingerir_ficheiro(destino, s, tipo, filename)
+                s.commit()
+                if stats["ficheiro_inalterado"]:
+                    mensagem = f"{tipo.capitalize()} sem alterações (ficheiro igual ao último carregado)."
+                elif tipo == "atividade":
+                    mensagem = f"Atividade carregada com sucesso ({stats['entradas']} deputados)."
+                else:
+                    mensagem = f"Agenda carregada com sucesso ({stats['entradas']} eventos)."
+                return jsonify({
+                    "ok": True,
+                    "mensagem": mensagem,
+                    "tipo": tipo,
+                    "ficheiro": filename,
+                    "estatisticas": stats
+                })
             return jsonify({"ok": False, "mensagem": "JSON não reconhecido (esperado Atividade ou Agenda)."}), 400
         except Exception as e:
             return jsonify({"ok": False, "mensagem": f"Erro a processar JSON: {e}"}), 500
 
+    cronometro = Cronometro()
+    hash_ficheiro, tamanho = hash_stream(file.stream)
     resultado = validar_e_preparar(file)
     if not resultado["ok"]:
         return jsonify(resultado), 400
+    cronometro.marcar("validacao")
 
     sessao_meta = resultado["sessao"]
     registos = resultado["registos"]
 
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
+    s = get_session()
     try:
         # Verifica se a sessão já existe
         sessao_existente = s.query(Sessao).filter_by(id_legis_sessao=sessao_meta["id_legis_sessao"]).first()
@@ -102,649 +266,579 @@ def upload():
                 "sessao": sessao_meta,
                 "requer_confirmacao": True
             }), 409
-        
-        if sessao_existente and substituir:
-            # Apagar registos de assiduidade da sessão existente
-            s.query(Assiduidade).filter_by(sessao_id=sessao_existente.id).delete()
-            # Apagar a sessão
-            s.delete(sessao_existente)
-            s.flush()
-
-        # Criar nova sessão (ou recriar se substituiu)
-        sessao = Sessao(
-            id_legis_sessao=sessao_meta["id_legis_sessao"],
-            legislatura=sessao_meta["legislatura"],
-            numero=str(sessao_meta["numero"]),
-            tipo=sessao_meta["tipo"],
-            data=sessao_meta["data"]
+
+        # Ingestão set-based: 1 query IN para deputados, 1 executemany para assiduidade.
+        # Numa substituição só as diferenças são escritas (nada, se o conteúdo for igual ao
+        # já carregado; ver historico_ingestao.py)
+        ingestao = registar_ingestao(s, "assiduidade", filename or None, hash_ficheiro, tamanho)
+        stats = ingerir_sessao(
+            s, sessao_meta, registos, sessao_existente=sessao_existente, cronometro=cronometro,
+            ingestao_id=ingestao.id,
+        )
+        concluir_ingestao(
+            s, ingestao, {k: v for k, v in stats.items() if k != "sessao_id"},
+            unidades=1, alteradas=0 if stats["inalterada"] else 1,
         )
-        s.add(sessao)
-        s.flush()
-
-        inseridos = 0
-        novos_deputados = 0
-        duplicados = 0
-
-        for r in registos:
-            dep = s.query(Deputado).filter_by(nome_normalizado=r["deputado_normalizado"]).first()
-            if not dep:
-                dep = Deputado(
-                    nome_normalizado=r["deputado_normalizado"],
-                    nome_original_ultimo=r["deputado_original"],
-                    partido_atual=r["partido"]
-                )
-                s.add(dep)
-                s.flush()
-                novos_deputados += 1
-            else:
-                dep.nome_original_ultimo = r["deputado_original"]
-                dep.partido_atual = r["partido"]
-
-            reg = Assiduidade(
-                sessao_id=sessao.id,
-                deputado_id=dep.id,
-                partido=r["partido"],
-                status=r["status"],
-                motivo=r["motivo"]
-            )
-            s.add(reg)
-            try:
-                s.flush()
-                inseridos += 1
-            except IntegrityError:
-                s.rollback()
-                duplicados += 1
 
         s.commit()
-        return jsonify({
+        cronometro.marcar("commit")
+        if stats["inalterada"]:
+            mensagem = "Sessão sem alterações (conteúdo igual ao já carregado)."
+        else:
+            mensagem = "Sessão substituída com sucesso." if substituir else "Sessão inserida com sucesso."
+        resposta = {
             "ok": True,
-            "mensagem": "Sessão substituída com sucesso." if substituir else "Sessão inserida com sucesso.",
+            "mensagem": mensagem,
             "sessao": sessao_meta,
-            "inseridos": inseridos,
-            "novos_deputados": novos_deputados,
-            "duplicados_ignorados": duplicados,
+            "inseridos": stats["inseridos"],
+            "novos_deputados": stats["novos_deputados"],
+            "duplicados_ignorados": stats["duplicados_ignorados"],
             "resumo": resultado["resumo"],
-            "substituiu": substituir
-        })
+            "substituiu": substituir and not stats["inalterada"],
+            "inalterada": stats["inalterada"],
+            "ingestao_id": ingestao.id,
+            "tempos_ms": cronometro.resumo()
+        }
+        if "alteracoes" in stats:
+            # Substituição por diferenças: linhas inseridas, atualizadas e removidas
+            resposta["alteracoes"] = stats["alteracoes"]
+        return jsonify(resposta)
     except Exception as e:
         s.rollback()
         return jsonify({"ok": False, "mensagem": f"Erro ao inserir na base: {e}"}), 500
-    finally:
-        s.close()
 
 @app.route("/deputados", methods=["GET"])
+@em_cache(get_session)
 def listar_deputados():
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura")
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+
+    # Lido da tabela de resumo deputado × legislatura (mantida na ingestão)
+    query = (
+        s.query(
+            Deputado.nome_original_ultimo.label("nome"),
+            Deputado.partido_atual.label("partido"),
+            *somas_resumo_deputado()
+        )
+        .join(ResumoDeputado, ResumoDeputado.deputado_id == Deputado.id)
+    )
 
-        presencas_expr = func.sum(case((Assiduidade.status.like("Presença%"), 1), else_=0))
-        faltas_just_expr = func.sum(case((Assiduidade.status.like("Falta Justificada%"), 1), else_=0))
-        amp_expr = func.sum(case((Assiduidade.status.like("Ausência em Missão Parlamentar%"), 1), else_=0))
-        faltas_quorum_expr = func.sum(case((Assiduidade.status.like("Falta ao Quórum de Votação%"), 1), else_=0))
+    if legislatura:
+        query = query.filter(ResumoDeputado.legislatura == legislatura)
 
-        query = (
-            s.query(
-                Deputado.nome_original_ultimo.label("nome"),
-                Deputado.partido_atual.label("partido"),
-                presencas_expr.label("presencas"),
-                faltas_just_expr.label("faltas_justificadas"),
-                amp_expr.label("missao_parlamentar_amp"),
-                faltas_quorum_expr.label("faltas_penalizadoras")
-            )
-            .join(Assiduidade, Assiduidade.deputado_id == Deputado.id)
-        )
+    query = (
+        query.group_by(Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
+        .having(func.sum(ResumoDeputado.total_registos) > 0)
+        .order_by(Deputado.id)
+    )
 
-        if legislatura:
-            query = query.join(Sessao, Sessao.id == Assiduidade.sessao_id).filter(Sessao.legislatura == legislatura)
-
-        query = query.group_by(Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
-
-        dados = []
-        for reg in query.all():
-            presencas = reg.presencas or 0
-            faltas_penalizadoras = reg.faltas_penalizadoras or 0
-            denom = presencas + faltas_penalizadoras
-            assiduidade_pct = (presencas / denom * 100) if denom else 0.0
-
-            dados.append({
-                "nome": reg.nome,
-                "partido": reg.partido,
-                "presencas": presencas,
-                "faltas_justificadas": reg.faltas_justificadas or 0,
-                "missao_parlamentar_amp": reg.missao_parlamentar_amp or 0,
-                "faltas_penalizadoras": faltas_penalizadoras,
-                "assiduidade_pct": round(assiduidade_pct, 2)
-            })
+    dados = [linha_deputado(reg) for reg in query.all()]
 
-        return jsonify({"ok": True, "deputados": dados})
-    finally:
-        s.close()
+    return jsonify({"ok": True, "deputados": dados})
 
 
 @app.route("/atividade/deputados", methods=["GET"])
+@em_cache(get_session)
 def atividade_deputados():
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura")
-        tipo = request.args.get("tipo")
-        partido = request.args.get("partido")
-
-        query = s.query(DeputadoAtividade, Deputado).join(Deputado, DeputadoAtividade.deputado_id == Deputado.id)
-        if legislatura:
-            query = query.filter(DeputadoAtividade.legislatura == legislatura)
-        if tipo:
-            query = query.filter(DeputadoAtividade.tipo == tipo)
-        if partido:
-            query = query.filter(Deputado.partido_atual == partido)
-
-        registros = query.order_by(DeputadoAtividade.total.desc()).all()
-        dados = []
-        for atividade, dep in registros:
-            dados.append({
-                "deputado": dep.nome_original_ultimo,
-                "partido": dep.partido_atual,
-                "tipo": atividade.tipo,
-                "total": atividade.total,
-                "legislatura": atividade.legislatura,
-                "detalhes": atividade.detalhes or "",
-                "ultima_data": atividade.ultima_data.isoformat() if atividade.ultima_data else None,
-            })
-
-        return jsonify({"ok": True, "registos": dados})
-    finally:
-        s.close()
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    tipo = request.args.get("tipo")
+    partido = request.args.get("partido")
+
+    pagina = LISTAGEM_ATIVIDADES.pedido(request.args)
+
+    query = (
+        s.query(*pagina.colunas())
+        .select_from(DeputadoAtividade)
+        .join(Deputado, DeputadoAtividade.deputado_id == Deputado.id)
+    )
+    if legislatura:
+        query = query.filter(DeputadoAtividade.legislatura == legislatura)
+    if tipo:
+        query = query.filter(DeputadoAtividade.tipo == tipo)
+    if partido:
+        query = query.filter(Deputado.partido_atual == partido)
+
+    # Sem paginação a listagem pode ser grande: gerada em fluxo a partir do cursor
+    dados, seguinte = pagina.consultar(query)
+    resposta = {"ok": True, "registos": dados}
+    if pagina.paginada:
+        resposta["seguinte"] = seguinte
+    return resposta_json(resposta)
 
 
 @app.route("/atividade/agenda", methods=["GET"])
+@em_cache(get_session)
 def atividade_agenda():
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura")
-        section = request.args.get("section")
-        theme = request.args.get("theme")
-        data_inicio = parse_iso_date(request.args.get("data_inicio"))
-        data_fim = parse_iso_date(request.args.get("data_fim"))
-
-        query = s.query(AgendaItem)
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    section = request.args.get("section")
+    theme = request.args.get("theme")
+    data_inicio = parse_iso_date(request.args.get("data_inicio"))
+    data_fim = parse_iso_date(request.args.get("data_fim"))
+
+    pagina = LISTAGEM_AGENDA.pedido(request.args, limite_omissao=50)
+
+    query = s.query(*pagina.colunas())
+    if legislatura:
+        query = query.filter(AgendaItem.leg_des == legislatura)
+    if section:
+        query = query.filter(AgendaItem.secao == section)
+    if theme:
+        query = query.filter(AgendaItem.tema == theme)
+    if data_inicio:
+        query = query.filter(AgendaItem.inicio >= data_inicio)
+    if data_fim:
+        query = query.filter(AgendaItem.inicio <= data_fim)
+
+    dados, seguinte = pagina.consultar(query)
+    return jsonify({"ok": True, "agenda": list(dados), "seguinte": seguinte})
+
+def _pesquisar(s, fts, listagem, query_filtros):
+    """Aplica a pesquisa `q` (FTS5) e a paginação a uma listagem de pesquisa."""
+    if not fts_disponivel(s, fts.name):
+        return jsonify({"ok": False, "mensagem": "Pesquisa indisponível (SQLite sem FTS5)."}), 503
+    condicao = corresponde(fts, request.args.get("q"))
+    pagina = listagem.pedido(request.args, limite_omissao=20)
+    query = query_filtros(s.query(*pagina.colunas()).select_from(fts)).filter(condicao)
+    dados, seguinte = pagina.consultar(query)
+    return jsonify({"ok": True, "resultados": list(dados), "seguinte": seguinte})
+
+
+@app.route("/atividade/agenda/pesquisa", methods=["GET"])
+@em_cache(get_session)
+def pesquisa_agenda():
+    """Pesquisa no título e texto dos eventos da agenda (`q`, mais os filtros de /atividade/agenda)"""
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    section = request.args.get("section")
+    theme = request.args.get("theme")
+
+    def filtros(query):
+        query = query.join(AgendaItem, AgendaItem.id == AGENDA_FTS.c.rowid)
         if legislatura:
             query = query.filter(AgendaItem.leg_des == legislatura)
         if section:
             query = query.filter(AgendaItem.secao == section)
         if theme:
             query = query.filter(AgendaItem.tema == theme)
-        if data_inicio:
-            query = query.filter(AgendaItem.inicio >= data_inicio)
-        if data_fim:
-            query = query.filter(AgendaItem.inicio <= data_fim)
-
-        items = query.order_by(AgendaItem.inicio.asc().nullslast()).limit(50).all()
-        dados = []
-        for item in items:
-            dados.append({
-                "titulo": item.titulo,
-                "tema": item.tema,
-                "secao": item.secao,
-                "local": item.local,
-                "legislatura": item.leg_des,
-                "inicio": item.inicio.isoformat() if item.inicio else None,
-                "fim": item.fim.isoformat() if item.fim else None,
-                "link": item.link,
-                "texto": item.texto,
-            })
-
-        return jsonify({"ok": True, "agenda": dados})
-    finally:
-        s.close()
+        return query
+
+    return _pesquisar(s, AGENDA_FTS, LISTAGEM_PESQUISA_AGENDA, filtros)
+
+
+@app.route("/atividade/deputados/pesquisa", methods=["GET"])
+@em_cache(get_session)
+def pesquisa_atividades():
+    """Pesquisa nos títulos da atividade dos deputados (`q`, mais os filtros de /atividade/deputados)"""
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    tipo = request.args.get("tipo")
+    partido = request.args.get("partido")
+
+    def filtros(query):
+        query = (
+            query.join(DeputadoAtividade, DeputadoAtividade.id == ATIVIDADES_FTS.c.rowid)
+            .join(Deputado, DeputadoAtividade.deputado_id == Deputado.id)
+        )
+        if legislatura:
+            query = query.filter(DeputadoAtividade.legislatura == legislatura)
+        if tipo:
+            query = query.filter(DeputadoAtividade.tipo == tipo)
+        if partido:
+            query = query.filter(Deputado.partido_atual == partido)
+        return query
+
+    return _pesquisar(s, ATIVIDADES_FTS, LISTAGEM_PESQUISA_ATIVIDADES, filtros)
 
 @app.route("/deputados/filtrados", methods=["GET"])
+@em_cache(get_session)
 def listar_deputados_filtrados():
     """Retorna estatísticas de deputados filtradas por legislatura/sessões"""
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura", "")
-        tipo_sessao = request.args.get("tipo") or request.args.get("tipo_sessao") or ""
-        data_inicio = parse_iso_date(request.args.get("data_inicio"))
-        data_fim = parse_iso_date(request.args.get("data_fim"))
-        
-        # Construir query base de sessões
-        query_sessoes = s.query(Sessao)
+    s = get_session()
+    legislatura = request.args.get("legislatura", "")
+    tipo_sessao = request.args.get("tipo") or request.args.get("tipo_sessao") or ""
+    data_inicio = parse_iso_date(request.args.get("data_inicio"))
+    data_fim = parse_iso_date(request.args.get("data_fim"))
+    
+    if not (tipo_sessao or data_inicio or data_fim):
+        # Sem filtros ao nível da sessão: basta a tabela de resumo
+        presencas, faltas_j, amp, falta_quorum, _ = somas_resumo_deputado()
+        query = (
+            s.query(
+                Deputado.nome_original_ultimo.label("nome"),
+                Deputado.partido_atual.label("partido"),
+                presencas, faltas_j, amp, falta_quorum
+            )
+            .join(ResumoDeputado, ResumoDeputado.deputado_id == Deputado.id)
+        )
         if legislatura:
-            query_sessoes = query_sessoes.filter(Sessao.legislatura == legislatura)
-        if data_inicio:
-            query_sessoes = query_sessoes.filter(Sessao.data >= data_inicio)
-        if data_fim:
-            query_sessoes = query_sessoes.filter(Sessao.data <= data_fim)
-        if tipo_sessao:
-            query_sessoes = query_sessoes.filter(Sessao.tipo == tipo_sessao)
-        
-        sessoes_ids = [sess.id for sess in query_sessoes.all()]
-        
-        if not sessoes_ids:
-            return jsonify({"ok": True, "deputados": []})
-        
-        dados = []
-        for dep in s.query(Deputado).all():
-            presencas = s.query(Assiduidade).filter(
-                Assiduidade.deputado_id == dep.id,
-                Assiduidade.sessao_id.in_(sessoes_ids),
-                Assiduidade.status.like("Presença%")
-            ).count()
-
-            faltas_j = s.query(Assiduidade).filter(
-                Assiduidade.deputado_id == dep.id,
-                Assiduidade.sessao_id.in_(sessoes_ids),
-                Assiduidade.status.like("Falta Justificada%")
-            ).count()
-
-            amp = s.query(Assiduidade).filter(
-                Assiduidade.deputado_id == dep.id,
-                Assiduidade.sessao_id.in_(sessoes_ids),
-                Assiduidade.status.like("Ausência em Missão Parlamentar%")
-            ).count()
-
-            falta_quorum = s.query(Assiduidade).filter(
-                Assiduidade.deputado_id == dep.id,
-                Assiduidade.sessao_id.in_(sessoes_ids),
-                Assiduidade.status.like("Falta ao Quórum de Votação%")
-            ).count()
-
-            # Só incluir deputados que tiveram alguma participação nas sessões filtradas
-            total_participacoes = presencas + faltas_j + amp + falta_quorum
-            if total_participacoes == 0:
-                continue
-
-            denom = presencas + falta_quorum
-            assiduidade_pct = (presencas / denom * 100) if denom else 0.0
-
-            dados.append({
-                "nome": dep.nome_original_ultimo,
-                "partido": dep.partido_atual,
-                "presencas": presencas,
-                "faltas_justificadas": faltas_j,
-                "missao_parlamentar_amp": amp,
-                "faltas_penalizadoras": falta_quorum,
-                "assiduidade_pct": round(assiduidade_pct, 2)
-            })
-        
+            query = query.filter(ResumoDeputado.legislatura == legislatura)
+        query = (
+            query.group_by(Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
+            .having(presencas + faltas_j + amp + falta_quorum > 0)
+            .order_by(Deputado.id)
+        )
+        dados = [linha_deputado(reg) for reg in query.all()]
         return jsonify({"ok": True, "deputados": dados})
-    finally:
-        s.close()
+
+    presencas, faltas_j, amp, falta_quorum = somas_por_estado()
+
+    # Uma única query agrupada: filtros de sessão aplicados no JOIN em SQL
+    query = (
+        s.query(
+            Deputado.nome_original_ultimo.label("nome"),
+            Deputado.partido_atual.label("partido"),
+            presencas, faltas_j, amp, falta_quorum
+        )
+        .join(Assiduidade, Assiduidade.deputado_id == Deputado.id)
+        .join(Sessao, Sessao.id == Assiduidade.sessao_id)
+    )
+    if legislatura:
+        query = query.filter(Sessao.legislatura == legislatura)
+    if data_inicio:
+        query = query.filter(Sessao.data >= data_inicio)
+    if data_fim:
+        query = query.filter(Sessao.data <= data_fim)
+    if tipo_sessao:
+        query = query.filter(Sessao.tipo == tipo_sessao)
+
+    # Só incluir deputados que tiveram alguma participação nas sessões filtradas
+    query = (
+        query.group_by(Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
+        .having(presencas + faltas_j + amp + falta_quorum > 0)
+        .order_by(Deputado.id)
+    )
+
+    dados = [linha_deputado(reg) for reg in query.all()]
+    return jsonify({"ok": True, "deputados": dados})
 
 @app.route("/sessoes", methods=["GET"])
+@em_cache(get_session)
 def listar_sessoes():
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        dados = [{
-            "id_legis_sessao": x.id_legis_sessao,
-            "legislatura": x.legislatura,
-            "numero": x.numero,
-            "tipo": x.tipo,
-            "data": x.data.isoformat()
-        } for x in s.query(Sessao).order_by(Sessao.data.desc()).all()]
-        return jsonify({"ok": True, "sessoes": dados})
-    finally:
-        s.close()
+    s = get_session()
+    pagina = LISTAGEM_SESSOES.pedido(request.args)
+    dados, seguinte = pagina.consultar(s.query(*pagina.colunas()))
+    resposta = {"ok": True, "sessoes": list(dados)}
+    if pagina.paginada:
+        resposta["seguinte"] = seguinte
+    return jsonify(resposta)
+
+def _nome_ambiguo(nome, candidatos):
+    return jsonify({
+        "ok": False,
+        "mensagem": f"Nome ambíguo: '{nome}' corresponde a vários deputados.",
+        "ambiguo": True,
+        "candidatos": [{"nome": d.nome_original_ultimo, "partido": d.partido_atual} for d in candidatos],
+    }), 409
+
 
 @app.route("/deputados/<nome>/detalhes", methods=["GET"])
+@em_cache(get_session)
 def detalhes_deputado(nome):
     """Retorna detalhes sessão-a-sessão de um deputado específico"""
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        # Buscar deputado (case-insensitive, parcial)
-        dep = s.query(Deputado).filter(
-            Deputado.nome_original_ultimo.ilike(f"%{nome}%")
-        ).first()
-        
-        if not dep:
-            return jsonify({"ok": False, "mensagem": "Deputado não encontrado"}), 404
-        
-        # Buscar todas as assiduidades deste deputado com info da sessão
-        registos = s.query(Assiduidade, Sessao).join(
-            Sessao, Assiduidade.sessao_id == Sessao.id
-        ).filter(
-            Assiduidade.deputado_id == dep.id
-        ).order_by(Sessao.data.desc()).all()
-        
-        detalhes = [{
-            "data": sess.data.isoformat(),
-            "id_legis_sessao": sess.id_legis_sessao,
-            "tipo": sess.tipo,
-            "legislatura": sess.legislatura,
-            "numero": sess.numero,
-            "status": ass.status,
-            "motivo": ass.motivo or "",
-            "partido": ass.partido
-        } for ass, sess in registos]
-        
-        return jsonify({
-            "ok": True,
-            "deputado": {
-                "nome": dep.nome_original_ultimo,
-                "partido": dep.partido_atual
-            },
-            "total_sessoes": len(detalhes),
-            "detalhes": detalhes
-        })
-    finally:
-        s.close()
+    s = get_session()
+    # Nome exato, depois palavras/prefixos, depois FTS5 (nomes.py); sem acentos nem maiúsculas
+    dep, candidatos = resolver_nome(s, nome)
+    if candidatos:
+        return _nome_ambiguo(nome, candidatos)
+    if not dep:
+        return jsonify({"ok": False, "mensagem": "Deputado não encontrado"}), 404
+    
+    total_sessoes = s.query(func.count(Assiduidade.id)).filter(Assiduidade.deputado_id == dep.id).scalar()
+    
+    # Histórico completo gerado em fluxo a partir do cursor (memória constante)
+    registos = s.query(
+        Sessao.data, Sessao.id_legis_sessao, Sessao.tipo, Sessao.legislatura, Sessao.numero,
+        Assiduidade.status, Assiduidade.motivo, Assiduidade.partido,
+    ).join(
+        Sessao, Assiduidade.sessao_id == Sessao.id
+    ).filter(
+        Assiduidade.deputado_id == dep.id
+    ).order_by(Sessao.data.desc()).yield_per(LOTE_LINHAS)
+    
+    detalhes = ({
+        "data": r.data.isoformat(),
+        "id_legis_sessao": r.id_legis_sessao,
+        "tipo": r.tipo,
+        "legislatura": r.legislatura,
+        "numero": r.numero,
+        "status": r.status,
+        "motivo": r.motivo or "",
+        "partido": r.partido
+    } for r in registos)
+    
+    return resposta_json({
+        "ok": True,
+        "deputado": {
+            "nome": dep.nome_original_ultimo,
+            "partido": dep.partido_atual
+        },
+        "total_sessoes": total_sessoes,
+        "detalhes": detalhes
+    })
+
+@app.route("/classificacoes/<criterio>", methods=["GET"])
+@em_cache(get_session)
+def classificacao(criterio):
+    """
+    Top-K de uma classificação (assiduidade, faltas_penalizadoras, atividade), opcionalmente de
+    uma `legislatura` e de um `partido`; `ordem=inversa` começa pelo fim. Paginada (limit/cursor).
+    """
+    if criterio not in CRITERIOS:
+        raise PedidoInvalido(f"Critério desconhecido: {criterio} (disponíveis: {', '.join(CRITERIOS)}).")
+    s = get_session()
+    legislatura = request.args.get("legislatura") or TODAS
+    partido = request.args.get("partido")
+    inversa = request.args.get("ordem") == "inversa"
+    listagem = LISTAGENS_CLASSIFICACAO[(bool(partido), inversa)]
+    pagina = listagem.pedido(request.args, limite_omissao=20)
+
+    filtro = [Classificacao.criterio == criterio, Classificacao.legislatura == legislatura]
+    if partido:
+        filtro.append(Classificacao.partido == partido)
+    query = (
+        s.query(*pagina.colunas())
+        .join(Deputado, Deputado.id == Classificacao.deputado_id)
+        .filter(*filtro)
+    )
+    dados, seguinte = pagina.consultar(query)
+    converter = CRITERIOS[criterio]
+    dados = [{**d, "valor": converter(d["valor"])} if "valor" in d else d for d in dados]
+    # Última posição = total da classificação (máximo lido no fim do índice)
+    total = s.query(func.max(listagem.coluna)).filter(*filtro).scalar() or 0
+    return jsonify({
+        "ok": True,
+        "criterio": criterio,
+        "legislatura": legislatura,
+        "partido": partido,
+        "total": total,
+        "classificacao": dados,
+        "seguinte": seguinte,
+    })
+
+
+@app.route("/classificacoes/<criterio>/deputado/<nome>", methods=["GET"])
+@em_cache(get_session)
+def posicao_deputado(criterio, nome):
+    """Posição de um deputado numa classificação (geral e no partido), opcionalmente de uma `legislatura`"""
+    if criterio not in CRITERIOS:
+        raise PedidoInvalido(f"Critério desconhecido: {criterio} (disponíveis: {', '.join(CRITERIOS)}).")
+    s = get_session()
+    legislatura = request.args.get("legislatura") or TODAS
+    dep, candidatos = resolver_nome(s, nome)
+    if candidatos:
+        return _nome_ambiguo(nome, candidatos)
+    linha = s.get(Classificacao, (criterio, legislatura, dep.id)) if dep else None
+    if linha is None:
+        return jsonify({"ok": False, "mensagem": "Deputado não encontrado nesta classificação"}), 404
+
+    total = s.query(func.max(Classificacao.posicao)).filter_by(criterio=criterio, legislatura=legislatura).scalar()
+    total_partido = (
+        s.query(func.max(Classificacao.posicao_partido))
+        .filter_by(criterio=criterio, legislatura=legislatura, partido=linha.partido)
+        .scalar()
+    )
+    return jsonify({
+        "ok": True,
+        "criterio": criterio,
+        "legislatura": legislatura,
+        "nome": dep.nome_original_ultimo,
+        "partido": linha.partido,
+        "valor": CRITERIOS[criterio](linha.valor),
+        "posicao": linha.posicao,
+        "total": total,
+        "posicao_partido": linha.posicao_partido,
+        "total_partido": total_partido,
+    })
+
+
+@app.route("/estatisticas/partidos", methods=["GET"])
+@em_cache(get_session)
+def estatisticas_partidos():
+    """Médias e somas por partido (pré-calculadas com as classificações), opcionalmente de uma `legislatura`"""
+    s = get_session()
+    legislatura = request.args.get("legislatura") or TODAS
+    partidos = (
+        s.query(MediaPartido)
+        .filter(MediaPartido.legislatura == legislatura)
+        .order_by(MediaPartido.assiduidade_media.desc(), MediaPartido.partido)
+        .all()
+    )
+    return jsonify({"ok": True, "partidos": [{
+        "partido": m.partido,
+        "deputados": m.deputados,
+        "assiduidade_media": m.assiduidade_media,
+        "presencas": m.presencas,
+        "faltas_justificadas": m.faltas_justificadas,
+        "missao_parlamentar_amp": m.missao_parlamentar_amp,
+        "faltas_penalizadoras": m.faltas_penalizadoras,
+        "atividade_total": m.atividade_total,
+    } for m in partidos]})
 
 @app.route("/estatisticas/sessoes", methods=["GET"])
+@em_cache(get_session)
 def estatisticas_sessoes():
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura")
-        tipo_sessao = request.args.get("tipo") or request.args.get("tipo_sessao")
-        data_inicio = parse_iso_date(request.args.get("data_inicio"))
-        data_fim = parse_iso_date(request.args.get("data_fim"))
-
-        query = s.query(Sessao)
-        if legislatura:
-            query = query.filter(Sessao.legislatura == legislatura)
-        if data_inicio:
-            query = query.filter(Sessao.data >= data_inicio)
-        if data_fim:
-            query = query.filter(Sessao.data <= data_fim)
-        if tipo_sessao:
-            query = query.filter(Sessao.tipo == tipo_sessao)
-
-        sessoes = query.order_by(Sessao.data.asc()).all()
-        dados = []
-        for sess in sessoes:
-            total_registos = s.query(Assiduidade).filter(Assiduidade.sessao_id == sess.id).count()
-
-            presencas = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Presença%")
-            ).scalar() or 0
-
-            falta_quorum = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Falta ao Quórum de Votação%")
-            ).scalar() or 0
-
-            faltas_j = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Falta Justificada%")
-            ).scalar() or 0
-
-            amp = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Ausência em Missão Parlamentar%")
-            ).scalar() or 0
-
-            denom = presencas + falta_quorum
-            assiduidade_pct = (presencas / denom * 100) if denom else 0.0
-
-            dados.append({
-                "id_legis_sessao": sess.id_legis_sessao,
-                "legislatura": sess.legislatura,
-                "numero": sess.numero,
-                "data": sess.data.isoformat(),
-                "tipo": sess.tipo,
-                "presencas": presencas,
-                "faltas_quorum": falta_quorum,
-                "faltas_justificadas": faltas_j,
-                "amp": amp,
-                "total_registos": total_registos,
-                "assiduidade_pct": round(assiduidade_pct, 2)
-            })
-        return jsonify({"ok": True, "sessoes": dados})
-    finally:
-        s.close()
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    tipo_sessao = request.args.get("tipo") or request.args.get("tipo_sessao")
+    data_inicio = parse_iso_date(request.args.get("data_inicio"))
+    data_fim = parse_iso_date(request.args.get("data_fim"))
+
+    linhas = agregados_por_sessao(s, legislatura, tipo_sessao, data_inicio, data_fim)
+    return jsonify({"ok": True, "sessoes": resumo_sessoes(linhas)})
+
+@app.route("/estatisticas/series", methods=["GET"])
+@em_cache(get_session)
+def series_temporais():
+    """
+    Assiduidade por período (`granularidade`: dia, semana, mes, legislatura, dia_semana; por
+    omissão mes), de todos ou de um `partido`, entre `data_inicio` e `data_fim` (séries de series.py)
+    """
+    s = get_session()
+    granularidade = request.args.get("granularidade") or request.args.get("granularity") or "mes"
+    if granularidade not in GRANULARIDADES:
+        raise PedidoInvalido(
+            f"Granularidade desconhecida: {granularidade} (disponíveis: {', '.join(GRANULARIDADES)})."
+        )
+    partido = request.args.get("partido") or TODOS
+    data_inicio = parse_iso_date(request.args.get("data_inicio"))
+    data_fim = parse_iso_date(request.args.get("data_fim"))
+    if granularidade == "dia_semana" and (data_inicio or data_fim):
+        raise PedidoInvalido("data_inicio/data_fim não se aplicam a dia_semana.")
+
+    query = s.query(ResumoPeriodo).filter(
+        ResumoPeriodo.granularidade == granularidade, ResumoPeriodo.partido == partido
+    )
+    # Períodos que se sobrepõem ao intervalo pedido
+    if data_inicio:
+        query = query.filter(ResumoPeriodo.fim >= data_inicio)
+    if data_fim:
+        query = query.filter(ResumoPeriodo.inicio <= data_fim)
+    linhas = query.order_by(ResumoPeriodo.inicio, ResumoPeriodo.periodo).all()
+    return jsonify({
+        "ok": True,
+        "granularidade": granularidade,
+        "partido": partido,
+        "series": resumo_periodos(linhas),
+    })
 
 @app.route("/substituicoes", methods=["GET"])
+@em_cache(get_session)
 def listar_substituicoes():
-    """Lista deputados que saíram e entraram por partido ao longo das sessões"""
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        # Buscar todas as sessões ordenadas por data
-        sessoes = s.query(Sessao).order_by(Sessao.data.asc()).all()
-        
-        # Dicionário para rastrear deputados por partido em cada sessão
-        historico_partidos = {}
-        
-        for sessao in sessoes:
-            # Buscar todos os deputados presentes nesta sessão
-            registos = s.query(Assiduidade, Deputado).join(
-                Deputado, Assiduidade.deputado_id == Deputado.id
-            ).filter(
-                Assiduidade.sessao_id == sessao.id
-            ).all()
-            
-            # Agrupar por partido
-            deputados_por_partido = {}
-            for ass, dep in registos:
-                partido = ass.partido or dep.partido_atual or "Sem Partido"
-                if partido not in deputados_por_partido:
-                    deputados_por_partido[partido] = set()
-                deputados_por_partido[partido].add(dep.nome_original_ultimo)
-            
-            # Atualizar histórico
-            for partido, deputados in deputados_por_partido.items():
-                if partido not in historico_partidos:
-                    historico_partidos[partido] = {}
-                
-                for deputado in deputados:
-                    if deputado not in historico_partidos[partido]:
-                        historico_partidos[partido][deputado] = {
-                            "primeira_sessao": sessao.id_legis_sessao,
-                            "primeira_data": sessao.data.isoformat(),
-                            "ultima_sessao": sessao.id_legis_sessao,
-                            "ultima_data": sessao.data.isoformat()
-                        }
-                    else:
-                        # Atualizar última sessão
-                        historico_partidos[partido][deputado]["ultima_sessao"] = sessao.id_legis_sessao
-                        historico_partidos[partido][deputado]["ultima_data"] = sessao.data.isoformat()
-        
-        # Agrupar saídas e entradas por partido
-        movimentos_por_partido = {}
-        
-        for partido, deputados_hist in historico_partidos.items():
-            saidas = []
-            entradas = []
-            
-            for nome, info in deputados_hist.items():
-                # Se primeira != última sessão, o deputado teve um período de atividade
-                # Se primeira == última, apareceu em apenas uma sessão
-                
-                # Considerar "saída" se não está na última sessão conhecida do sistema
-                # Considerar "entrada" se não estava na primeira sessão conhecida
-                
-                # Para simplificar: listar todos com suas datas de início e fim
-                deputado_info = {
-                    "nome": nome,
-                    "primeira_sessao": info["primeira_sessao"],
-                    "primeira_data": info["primeira_data"],
-                    "ultima_sessao": info["ultima_sessao"],
-                    "ultima_data": info["ultima_data"]
-                }
-                
-                # Verificar se foi a última sessão de todas
-                ultima_sessao_sistema = sessoes[-1].id_legis_sessao if sessoes else None
-                
-                if info["ultima_sessao"] != ultima_sessao_sistema:
-                    saidas.append(deputado_info)
-                
-                if info["primeira_sessao"] != sessoes[0].id_legis_sessao if sessoes else False:
-                    entradas.append(deputado_info)
-            
-            if saidas or entradas:
-                movimentos_por_partido[partido] = {
-                    "saidas": saidas,
-                    "entradas": entradas
-                }
-        
-        return jsonify({
-            "ok": True, 
-            "movimentos": movimentos_por_partido,
-            "total_partidos": len(movimentos_por_partido)
-        })
-    finally:
-        s.close()
+    """Lista deputados que saíram e entraram por partido (intervalos de mandatos.py)"""
+    s = get_session()
+    movimentos_por_partido = {}
+    for movimento in movimentos(s):
+        partido = movimento.pop("partido")
+        lista = "entradas" if movimento.pop("movimento") == "entrada" else "saidas"
+        movimentos_por_partido.setdefault(partido, {"saidas": [], "entradas": []})[lista].append(movimento)
+
+    return jsonify({
+        "ok": True, 
+        "movimentos": movimentos_por_partido,
+        "total_partidos": len(movimentos_por_partido)
+    })
 
 @app.route("/estatisticas/analise-avancada", methods=["GET"])
+@em_cache(get_session)
 def analise_avancada():
     """Retorna estatísticas avançadas: faltas por dia da semana, piores sessões, custo estimado"""
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
+    s = get_session()
     
     # Parâmetro configurável para custo diário
     custo_dia = float(request.args.get("custo_dia", 200))
     
-    try:
-        # 1. Buscar todas as sessões com estatísticas
-        sessoes = s.query(Sessao).order_by(Sessao.data.asc()).all()
-        
-        # 2. Analisar faltas por dia da semana
-        faltas_por_dia_semana = {
-            0: {"dia": "Segunda", "faltas": 0, "sessoes": 0},
-            1: {"dia": "Terça", "faltas": 0, "sessoes": 0},
-            2: {"dia": "Quarta", "faltas": 0, "sessoes": 0},
-            3: {"dia": "Quinta", "faltas": 0, "sessoes": 0},
-            4: {"dia": "Sexta", "faltas": 0, "sessoes": 0},
-            5: {"dia": "Sábado", "faltas": 0, "sessoes": 0},
-            6: {"dia": "Domingo", "faltas": 0, "sessoes": 0}
-        }
-        
-        piores_sessoes = []
-        total_faltas_penalizadoras = 0
-        
-        for sess in sessoes:
-            # Dia da semana (0=segunda, 6=domingo)
-            dia_semana = sess.data.weekday()
-            
-            # Contar faltas penalizadoras nesta sessão
-            faltas_quorum = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Falta ao Quórum de Votação%")
-            ).scalar()
-            
-            total_faltas_penalizadoras += faltas_quorum
-            faltas_por_dia_semana[dia_semana]["faltas"] += faltas_quorum
-            faltas_por_dia_semana[dia_semana]["sessoes"] += 1
-            
-            # Calcular assiduidade desta sessão para ranking de piores
-            presencas = s.query(func.count(Assiduidade.id)).filter(
-                Assiduidade.sessao_id == sess.id,
-                Assiduidade.status.like("Presença%")
-            ).scalar()
-            
-            total_registos = s.query(Assiduidade).filter(Assiduidade.sessao_id == sess.id).count()
-            
-            denom = presencas + faltas_quorum
-            assiduidade_pct = (presencas / denom * 100) if denom else 0.0
-            
-            piores_sessoes.append({
-                "id_legis_sessao": sess.id_legis_sessao,
-                "data": sess.data.isoformat(),
-                "tipo": sess.tipo,
-                "assiduidade_pct": round(assiduidade_pct, 2),
-                "faltas_quorum": faltas_quorum,
-                "presencas": presencas,
-                "total_registos": total_registos,
-                "dia_semana": ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"][dia_semana]
-            })
-        
-        # Ordenar piores sessões por menor assiduidade
-        piores_sessoes.sort(key=lambda x: x["assiduidade_pct"])
-        top_10_piores = piores_sessoes[:10]
-        
-        # Calcular custo estimado
-        custo_estimado = total_faltas_penalizadoras * custo_dia
-        
-        # Converter dict de faltas por dia em lista
-        faltas_dia_lista = [
-            {
-                "dia": info["dia"],
-                "faltas": info["faltas"],
-                "sessoes": info["sessoes"],
-                "media_por_sessao": round(info["faltas"] / info["sessoes"], 2) if info["sessoes"] > 0 else 0
-            }
-            for dia, info in sorted(faltas_por_dia_semana.items())
-        ]
-        
-        return jsonify({
-            "ok": True,
-            "faltas_por_dia_semana": faltas_dia_lista,
-            "top_10_piores_sessoes": top_10_piores,
-            "custo_estimado": {
-                "total_faltas_penalizadoras": total_faltas_penalizadoras,
-                "custo_por_dia": custo_dia,
-                "custo_total": round(custo_estimado, 2),
-                "disclaimer": "Estimativa baseada no salário base de deputado (€4.595,81/mês, 14 meses). Não inclui subsídios adicionais."
-            }
-        })
-    finally:
-        s.close()
+    # Um único agregado por sessão (ranking e custo em memória); faltas por dia da semana das
+    # séries, sessões por dia da semana contadas em todas as sessões
+    linhas = agregados_por_sessao(s)
+    faltas_por_dia = {
+        int(r.periodo): r.faltas_penalizadoras
+        for r in s.query(ResumoPeriodo).filter_by(granularidade="dia_semana", partido=TODOS)
+    }
+    return jsonify({
+        "ok": True,
+        **resumo_analise_avancada(linhas, custo_dia, faltas_por_dia, sessoes_por_dia_semana(s)),
+    })
 
 @app.route("/atividade/estatisticas", methods=["GET"])
+@em_cache(get_session)
 def atividade_estatisticas():
     """Retorna estatísticas agregadas de atividade parlamentar"""
-    _, SessionLocal = get_engine_and_session()
-    s = SessionLocal()
-    try:
-        legislatura = request.args.get("legislatura")
-        
-        query = s.query(DeputadoAtividade, Deputado).join(
-            Deputado, DeputadoAtividade.deputado_id == Deputado.id
-        )
-        if legislatura:
-            query = query.filter(DeputadoAtividade.legislatura == legislatura)
-        
-        registros = query.all()
-        
-        # Agregações
-        total_por_partido = {}
-        total_por_tipo = {}
-        partido_mais_ativo = None
-        max_atividades = 0
-        
-        for atividade, dep in registros:
-            # Por partido
-            if dep.partido_atual:
-                if dep.partido_atual not in total_por_partido:
-                    total_por_partido[dep.partido_atual] = 0
-                total_por_partido[dep.partido_atual] += atividade.total
-                
-                if total_por_partido[dep.partido_atual] > max_atividades:
-                    max_atividades = total_por_partido[dep.partido_atual]
-                    partido_mais_ativo = dep.partido_atual
+    s = get_session()
+    legislatura = request.args.get("legislatura")
+    
+    query = s.query(DeputadoAtividade, Deputado).join(
+        Deputado, DeputadoAtividade.deputado_id == Deputado.id
+    )
+    if legislatura:
+        query = query.filter(DeputadoAtividade.legislatura == legislatura)
+    
+    registros = query.all()
+    
+    # Agregações
+    total_por_partido = {}
+    total_por_tipo = {}
+    partido_mais_ativo = None
+    max_atividades = 0
+    
+    for atividade, dep in registros:
+        # Por partido
+        if dep.partido_atual:
+            if dep.partido_atual not in total_por_partido:
+                total_por_partido[dep.partido_atual] = 0
+            total_por_partido[dep.partido_atual] += atividade.total
             
-            # Por tipo
-            if atividade.tipo not in total_por_tipo:
-                total_por_tipo[atividade.tipo] = 0
-            total_por_tipo[atividade.tipo] += atividade.total
+            if total_por_partido[dep.partido_atual] > max_atividades:
+                max_atividades = total_por_partido[dep.partido_atual]
+                partido_mais_ativo = dep.partido_atual
         
-        # Cálculos
-        total_atividades = sum(total_por_tipo.values())
-        deputados_unicos = len(set(dep.id for _, dep in registros))
-        iniciativas = total_por_tipo.get("Iniciativas", 0)
-        
-        # Taxa de participação (deputados com atividade / total de deputados)
-        total_deputados = s.query(func.count(Deputado.id)).scalar()
-        taxa_participacao = (deputados_unicos / total_deputados * 100) if total_deputados else 0
-        
-        return jsonify({
-            "ok": True,
-            "partido_mais_ativo": partido_mais_ativo or "-",
-            "iniciativas_legislativas": iniciativas,
-            "taxa_participacao": round(taxa_participacao, 1),
-            "total_atividades": total_atividades,
-            "deputados_ativos": deputados_unicos,
-            "tipos_atividade": len(total_por_tipo)
-        })
-    finally:
-        s.close()
+        # Por tipo
+        if atividade.tipo not in total_por_tipo:
+            total_por_tipo[atividade.tipo] = 0
+        total_por_tipo[atividade.tipo] += atividade.total
+    
+    # Cálculos
+    total_atividades = sum(total_por_tipo.values())
+    deputados_unicos = len(set(dep.id for _, dep in registros))
+    iniciativas = total_por_tipo.get("Iniciativas", 0)
+    
+    # Taxa de participação (deputados com atividade / total de deputados)
+    total_deputados = s.query(func.count(Deputado.id)).scalar()
+    taxa_participacao = (deputados_unicos / total_deputados * 100) if total_deputados else 0
+    
+    return jsonify({
+        "ok": True,
+        "partido_mais_ativo": partido_mais_ativo or "-",
+        "iniciativas_legislativas": iniciativas,
+        "taxa_participacao": round(taxa_participacao, 1),
+        "total_atividades": total_atividades,
+        "deputados_ativos": deputados_unicos,
+        "tipos_atividade": len(total_por_tipo)
+    })
+
+@app.route("/metricas", methods=["GET"])
+def metricas():
+    """Contadores da cache de respostas (hits/misses/evictions) e geração dos dados"""
+    s = get_session()
+    return jsonify({
+        "ok": True,
+        "geracao_dados": geracao_dados(s),
+        "cache": cache_respostas.metricas()
+    })
+
+
+@app.route("/ingestoes", methods=["GET"])
+def listar_ingestoes():
+    """Histórico de ingestões (mais recentes primeiro; paginado, sem cache: muda mesmo sem nova geração)"""
+    s = get_session()
+    pagina = LISTAGEM_INGESTOES.pedido(request.args, limite_omissao=50)
+    query = s.query(*pagina.colunas())
+    tipo = request.args.get("tipo")
+    if tipo:
+        query = query.filter(Ingestao.tipo == tipo)
+    dados, seguinte = pagina.consultar(query)
+    return jsonify({"ok": True, "ingestoes": list(dados), "seguinte": seguinte})
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001, host="0.0.0.0")
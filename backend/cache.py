@@ -0,0 +1,251 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, current_app
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import EstadoDados, Deputado
+
+try:  # Compressão brotli é opcional (pip install brotli)
+    import brotli
+except ImportError:
+    brotli = None
+
+ESTADO_ID = 1
+# Respostas abaixo deste tamanho não compensam comprimir
+COMPRIMIR_MIN_BYTES = int(os.environ.get("ASSIDUIDADE_COMPRIMIR_MIN_BYTES", 1024))
+
+
+def estado_dados(s) -> tuple[int, datetime | None]:
+    """(geração, momento da última ingestão); (0, None) se nunca houve ingestão."""
+    estado = s.get(EstadoDados, ESTADO_ID)
+    if estado is None:
+        return 0, None
+    return estado.geracao, estado.atualizado_em
+
+
+def geracao_dados(s) -> int:
+    """Geração atual dos dados (0 se nunca houve ingestão)."""
+    return estado_dados(s)[0]
+
+
+def nova_geracao(s, tipo: str | None = None, deputados=()) -> int:
+    """
+    Incrementa a geração dos dados. Chamar na mesma transação de cada ingestão.
+    `tipo` ("assiduidade", "atividade", "agenda") regista que esse conjunto mudou nesta geração
+    e `deputados` (ids) marca os deputados afetados; o export incremental usa ambos.
+    Devolve a nova geração.
+    """
+    # UTC sem tzinfo (é o que o Last-Modified espera)
+    agora = datetime.now(timezone.utc).replace(tzinfo=None)
+    tabela = EstadoDados.__table__
+    inicial = {"geracao": 1, "atualizado_em": agora}
+    set_ = {"geracao": tabela.c.geracao + 1, "atualizado_em": agora}
+    if tipo is not None:
+        inicial[f"geracao_{tipo}"] = 1
+        set_[f"geracao_{tipo}"] = tabela.c.geracao + 1
+    stmt = insert(tabela).values(id=ESTADO_ID, **inicial)
+    geracao = s.execute(
+        stmt.on_conflict_do_update(index_elements=["id"], set_=set_).returning(tabela.c.geracao)
+    ).scalar_one()
+
+    ids = list(set(deputados))
+    if ids:
+        s.execute(update(Deputado).where(Deputado.id.in_(ids)).values(geracao_alteracao=geracao))
+    return geracao
+
+
+class CacheRespostas:
+    """
+    Cache LRU de respostas JSON, limitada em nº de entradas.
+    Todas as entradas pertencem a uma geração; ao ver uma geração mais recente a cache é
+    esvaziada (a geração só avança: pedidos de gerações anteriores não a alteram).
+    """
+
+    def __init__(self, max_entradas: int = 256):
+        self.max_entradas = max_entradas
+        self.geracao = None
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidacoes = 0
+
+    def _alinhar_geracao(self, geracao: int) -> bool:
+        """Avança para uma geração mais recente (esvaziando a cache). False se `geracao` já é antiga."""
+        if self.geracao is not None and geracao < self.geracao:
+            return False
+        if geracao != self.geracao:
+            if self._entradas:
+                self.invalidacoes += 1
+            self._entradas.clear()
+            self.geracao = geracao
+        return True
+
+    def obter(self, chave, geracao: int):
+        with self._lock:
+            # Pedido que leu uma geração anterior: miss, sem mexer na cache atual
+            valor = self._entradas.get(chave) if self._alinhar_geracao(geracao) else None
+            if valor is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return valor
+
+    def guardar(self, chave, geracao: int, valor):
+        with self._lock:
+            # Resposta calculada com dados de uma geração anterior: não é guardada
+            if not self._alinhar_geracao(geracao):
+                return
+            self._entradas[chave] = valor
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.evictions += 1
+
+    def metricas(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "evictions": self.evictions,
+                "invalidacoes": self.invalidacoes,
+                "geracao": self.geracao,
+            }
+
+
+cache_respostas = CacheRespostas(int(os.environ.get("ASSIDUIDADE_CACHE_MAX", 256)))
+
+
+def chave_pedido() -> tuple:
+    """Endpoint + query args tal como as rotas os leem (só ordenados)."""
+    args = sorted(request.args.items(multi=True))
+    return (request.path, tuple(args))
+
+
+def _etag(geracao: int, chave: tuple) -> str:
+    """ETag forte: geração dos dados + hash da rota/argumentos."""
+    resumo = hashlib.sha1(repr(chave).encode("utf-8")).hexdigest()[:16]
+    return f"g{geracao}-{resumo}"
+
+
+def _codificacao_aceite() -> str | None:
+    aceites = request.accept_encodings
+    if brotli is not None and aceites["br"]:
+        return "br"
+    if aceites["gzip"]:
+        return "gzip"
+    return None
+
+
+def _comprimir(corpo: bytes, codificacao: str) -> bytes:
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=5)
+    return gzip.compress(corpo, compresslevel=6)
+
+
+def _comprimir_fluxo(blocos, codificacao: str):
+    """Comprime um corpo em streaming bloco a bloco, sem o ter inteiro em memória."""
+    if codificacao == "br":
+        compressor = brotli.Compressor(quality=5)
+        comprimir, terminar = compressor.process, compressor.finish
+    else:
+        # wbits 16+: cabeçalho e checksum gzip (como gzip.compress)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        comprimir, terminar = compressor.compress, compressor.flush
+    try:
+        for bloco in blocos:
+            if saida := comprimir(bloco):
+                yield saida
+        yield terminar()
+    finally:
+        # Fecha o gerador original (stream_with_context liberta a sessão do pedido)
+        if hasattr(blocos, "close"):
+            blocos.close()
+
+
+def _cabecalhos(resposta, etag: str, atualizado_em):
+    resposta.set_etag(etag)
+    if atualizado_em is not None:
+        resposta.last_modified = atualizado_em
+    # O browser revalida sempre (If-None-Match) e recebe 304 se nada mudou
+    resposta.headers["Cache-Control"] = "no-cache"
+    resposta.vary.add("Accept-Encoding")
+    return resposta
+
+
+def _nao_modificado(etag: str, atualizado_em) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.star_tag or any(
+            request.if_none_match.contains_weak(variante)
+            for variante in (etag, f"{etag}-gzip", f"{etag}-br")
+        )
+    if request.if_modified_since and atualizado_em is not None:
+        return atualizado_em.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def em_cache(get_session):
+    """
+    Decorator de rotas GET:
+    - pedidos condicionais (If-None-Match / If-Modified-Since) recebem 304 sem executar a rota;
+    - respostas 200 são servidas da cache enquanto a geração dos dados não mudar;
+    - compressão gzip/brotli opcional conforme Accept-Encoding (variantes guardadas na cache);
+    - respostas em streaming passam sem cache (mantêm ETag/Last-Modified e o 304) e são
+      comprimidas bloco a bloco.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            geracao, atualizado_em = estado_dados(get_session())
+            chave = chave_pedido()
+            etag = _etag(geracao, chave)
+
+            if _nao_modificado(etag, atualizado_em):
+                return _cabecalhos(current_app.response_class(status=304), etag, atualizado_em)
+
+            variantes = cache_respostas.obter(chave, geracao)
+            if variantes is None:
+                resposta = current_app.make_response(view(*args, **kwargs))
+                # Respostas em streaming (fluxo_json) não são guardadas: guardá-las obrigaria
+                # a ter o corpo inteiro em memória
+                if resposta.is_streamed and resposta.status_code == 200:
+                    codificacao = _codificacao_aceite()
+                    if codificacao:
+                        resposta.response = _comprimir_fluxo(resposta.response, codificacao)
+                        resposta.headers["Content-Encoding"] = codificacao
+                        etag = f"{etag}-{codificacao}"
+                    return _cabecalhos(resposta, etag, atualizado_em)
+                # Só respostas 200 são guardadas (erros/404 são sempre recalculados)
+                if resposta.status_code != 200 or resposta.mimetype != "application/json":
+                    return resposta
+                variantes = {"identity": resposta.get_data()}
+                cache_respostas.guardar(chave, geracao, variantes)
+
+            corpo = variantes["identity"]
+            codificacao = _codificacao_aceite() if len(corpo) >= COMPRIMIR_MIN_BYTES else None
+            if codificacao:
+                if codificacao not in variantes:
+                    variantes[codificacao] = _comprimir(corpo, codificacao)
+                corpo = variantes[codificacao]
+
+            resposta = current_app.response_class(corpo, mimetype="application/json")
+            if codificacao:
+                resposta.headers["Content-Encoding"] = codificacao
+                etag = f"{etag}-{codificacao}"
+            return _cabecalhos(resposta, etag, atualizado_em)
+        return wrapper
+    return decorator
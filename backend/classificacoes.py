@@ -0,0 +1,226 @@
+"""
+Classificações dos deputados (Classificacao) e médias por partido (MediaPartido) mantidas
+na ingestão.
+
+Cada classificação é uma lista ordenada critério × legislatura ("" = todas) com a posição
+geral e a posição dentro do partido já gravadas: o top-K (geral ou de um partido) é um
+intervalo do índice e a posição de um deputado é uma leitura pela chave primária.
+Critérios:
+- assiduidade: % de assiduidade (desempate: mais presenças);
+- faltas_penalizadoras: número de faltas que contam para a assiduidade;
+- atividade: soma dos totais de DeputadoAtividade.
+Uma ingestão recalcula só as legislaturas que tocou (e "") e grava só as linhas que mudaram.
+Reconstrução completa: `cd backend && python classificacoes.py`
+"""
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.sqlite import insert
+
+from models import (
+    Deputado,
+    DeputadoAtividade,
+    ResumoDeputado,
+    Classificacao,
+    MediaPartido,
+    get_engine_and_session,
+    inicializar_bd,
+)
+from resumos import somas_resumo_deputado
+
+# Critério → tipo do valor na API
+CRITERIOS = {"assiduidade": float, "faltas_penalizadoras": int, "atividade": int}
+TODAS = ""
+CAMPOS_POSICAO = ("partido", "valor", "posicao", "posicao_partido")
+
+
+def _assiduidade(s, legislatura: str) -> list:
+    query = (
+        s.query(ResumoDeputado.deputado_id, Deputado.partido_atual.label("partido"), *somas_resumo_deputado())
+        .join(Deputado, Deputado.id == ResumoDeputado.deputado_id)
+    )
+    if legislatura != TODAS:
+        query = query.filter(ResumoDeputado.legislatura == legislatura)
+    return (
+        query.group_by(ResumoDeputado.deputado_id, Deputado.partido_atual)
+        .having(func.sum(ResumoDeputado.total_registos) > 0)
+        .all()
+    )
+
+
+def _atividade(s, legislatura: str) -> dict:
+    query = s.query(DeputadoAtividade.deputado_id, func.sum(DeputadoAtividade.total))
+    if legislatura != TODAS:
+        query = query.filter(DeputadoAtividade.legislatura == legislatura)
+    return dict(query.group_by(DeputadoAtividade.deputado_id).all())
+
+
+def _ordenar(criterio: str, legislatura: str, valores: list) -> list[dict]:
+    """Linhas de Classificacao a partir de [(chave_ordenacao, deputado_id, partido, valor)]."""
+    valores.sort()
+    por_partido = {}
+    linhas = []
+    for posicao, (_, dep_id, partido, valor) in enumerate(valores, start=1):
+        por_partido[partido] = por_partido.get(partido, 0) + 1
+        linhas.append({
+            "criterio": criterio,
+            "legislatura": legislatura,
+            "deputado_id": dep_id,
+            "partido": partido,
+            "valor": valor,
+            "posicao": posicao,
+            "posicao_partido": por_partido[partido],
+        })
+    return linhas
+
+
+def calcular(s, legislatura: str) -> tuple[list[dict], list[dict]]:
+    """(linhas de Classificacao de todos os critérios, linhas de MediaPartido) de uma legislatura."""
+    assiduidade = _assiduidade(s, legislatura)
+    atividade = _atividade(s, legislatura)
+    partidos = dict(
+        s.query(Deputado.id, Deputado.partido_atual).filter(Deputado.id.in_(list(atividade))).all()
+    ) if atividade else {}
+
+    pct = {}
+    por_assiduidade, por_faltas = [], []
+    for r in assiduidade:
+        denom = r.presencas + r.faltas_penalizadoras
+        pct[r.deputado_id] = round((r.presencas / denom * 100) if denom else 0.0, 2)
+        por_assiduidade.append(((-pct[r.deputado_id], -r.presencas, r.deputado_id), r.deputado_id, r.partido, pct[r.deputado_id]))
+        por_faltas.append(((-r.faltas_penalizadoras, r.deputado_id), r.deputado_id, r.partido, r.faltas_penalizadoras))
+    por_atividade = [
+        ((-total, dep_id), dep_id, partidos.get(dep_id), total) for dep_id, total in atividade.items()
+    ]
+    linhas = (
+        _ordenar("assiduidade", legislatura, por_assiduidade)
+        + _ordenar("faltas_penalizadoras", legislatura, por_faltas)
+        + _ordenar("atividade", legislatura, por_atividade)
+    )
+
+    # Médias por partido (deputados com registos de assiduidade e partido conhecido)
+    medias = {}
+    for r in assiduidade:
+        if not r.partido:
+            continue
+        m = medias.setdefault(r.partido, {
+            "legislatura": legislatura, "partido": r.partido, "deputados": 0, "assiduidade_media": 0.0,
+            "presencas": 0, "faltas_justificadas": 0, "missao_parlamentar_amp": 0,
+            "faltas_penalizadoras": 0, "atividade_total": 0,
+        })
+        m["deputados"] += 1
+        m["assiduidade_media"] += pct[r.deputado_id]
+        for c in ("presencas", "faltas_justificadas", "missao_parlamentar_amp", "faltas_penalizadoras"):
+            m[c] += getattr(r, c)
+        m["atividade_total"] += atividade.get(r.deputado_id, 0)
+    for m in medias.values():
+        m["assiduidade_media"] = round(m["assiduidade_media"] / m["deputados"], 2)
+    return linhas, list(medias.values())
+
+
+def _gravar(s, legislatura: str, linhas: list[dict], medias: list[dict]) -> int:
+    """Escreve as diferenças face ao que está gravado. Devolve as linhas escritas ou apagadas."""
+    guardadas = {
+        (r.criterio, r.deputado_id): tuple(getattr(r, c) for c in CAMPOS_POSICAO)
+        for r in s.query(Classificacao).filter(Classificacao.legislatura == legislatura)
+    }
+    novas = {(l["criterio"], l["deputado_id"]): l for l in linhas}
+    escrever = [
+        l for chave, l in novas.items()
+        if guardadas.get(chave) != tuple(l[c] for c in CAMPOS_POSICAO)
+    ]
+    remover = [chave for chave in guardadas if chave not in novas]
+    if escrever:
+        stmt = insert(Classificacao.__table__)
+        s.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["criterio", "legislatura", "deputado_id"],
+                set_={c: stmt.excluded[c] for c in CAMPOS_POSICAO},
+            ),
+            escrever,
+        )
+    if remover:
+        s.query(Classificacao).filter(
+            Classificacao.legislatura == legislatura,
+            tuple_(Classificacao.criterio, Classificacao.deputado_id).in_(remover),
+        ).delete(synchronize_session=False)
+
+    # Poucas linhas por legislatura: regravadas por inteiro
+    s.query(MediaPartido).filter(MediaPartido.legislatura == legislatura).delete(synchronize_session=False)
+    if medias:
+        s.execute(insert(MediaPartido.__table__), medias)
+    return len(escrever) + len(remover)
+
+
+def legislaturas_existentes(s) -> set:
+    """Legislaturas com assiduidade, atividade ou classificações gravadas."""
+    legislaturas = {leg for (leg,) in s.query(ResumoDeputado.legislatura).distinct()}
+    legislaturas.update(
+        leg for (leg,) in s.query(DeputadoAtividade.legislatura).distinct() if leg is not None
+    )
+    legislaturas.update(leg for (leg,) in s.query(Classificacao.legislatura).distinct())
+    legislaturas.discard(TODAS)
+    return legislaturas
+
+
+def legislaturas_deputados(s, ids) -> set:
+    """Legislaturas em que os deputados `ids` têm assiduidade ou atividade."""
+    ids = list(set(ids))
+    if not ids:
+        return set()
+    legislaturas = {
+        leg for (leg,) in
+        s.query(ResumoDeputado.legislatura).filter(ResumoDeputado.deputado_id.in_(ids)).distinct()
+    }
+    legislaturas.update(
+        leg for (leg,) in
+        s.query(DeputadoAtividade.legislatura).filter(DeputadoAtividade.deputado_id.in_(ids)).distinct()
+        if leg is not None
+    )
+    return legislaturas
+
+
+def atualizar_classificacoes(s, legislaturas=None) -> int:
+    """
+    Recalcula as classificações e médias das `legislaturas` e de todas (""); com None,
+    recalcula todas as legislaturas. Um deputado que muda de partido muda as posições por
+    partido de todas as suas legislaturas (ver `legislaturas_deputados`).
+    Devolve as linhas de Classificacao escritas ou apagadas.
+    """
+    if legislaturas is None:
+        legislaturas = legislaturas_existentes(s)
+    escritas = 0
+    for legislatura in sorted({leg for leg in legislaturas if leg} | {TODAS}):
+        escritas += _gravar(s, legislatura, *calcular(s, legislatura))
+    return escritas
+
+
+def reconstruir_classificacoes(s):
+    """Regenera todas as classificações e médias."""
+    s.query(Classificacao).delete(synchronize_session=False)
+    s.query(MediaPartido).delete(synchronize_session=False)
+    atualizar_classificacoes(s)
+
+
+def reconstruir_classificacoes_se_vazio(s) -> bool:
+    """Preenche as classificações de uma BD anterior a esta tabela. Devolve True se reconstruiu."""
+    if s.query(Classificacao.deputado_id).first() is not None:
+        return False
+    if s.query(ResumoDeputado.id).first() is None and s.query(DeputadoAtividade.id).first() is None:
+        return False
+    reconstruir_classificacoes(s)
+    return True
+
+
+def main():
+    inicializar_bd()
+    engine, SessionLocal = get_engine_and_session()
+    session = SessionLocal()
+    try:
+        reconstruir_classificacoes(session)
+        session.commit()
+        print(f"Classificações reconstruídas: {session.query(Classificacao).count()} posições.")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
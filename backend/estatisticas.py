@@ -0,0 +1,154 @@
+from sqlalchemy import func, case
+
+from models import Sessao, Assiduidade, ResumoSessao
+
+DIAS_SEMANA = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+
+
+def somas_por_estado():
+    """Expressões SUM(CASE ...) sobre o código de estado (agregação numa só passagem)."""
+    return (
+        func.sum(case((Assiduidade.codigo == "P", 1), else_=0)).label("presencas"),
+        func.sum(case((Assiduidade.codigo == "FJ", 1), else_=0)).label("faltas_justificadas"),
+        func.sum(case((Assiduidade.codigo == "AMP", 1), else_=0)).label("missao_parlamentar_amp"),
+        func.sum(case((Assiduidade.codigo == "FQV", 1), else_=0)).label("faltas_penalizadoras"),
+    )
+
+
+def agregados_por_sessao(s, legislatura=None, tipo_sessao=None, data_inicio=None, data_fim=None) -> list:
+    """
+    Agregado por sessão numa única query, lido da tabela ResumoSessao
+    (mantida na ingestão). Sessões sem resumo aparecem a zero. Ordenado por data.
+    """
+    query = (
+        s.query(
+            Sessao.id,
+            Sessao.id_legis_sessao,
+            Sessao.legislatura,
+            Sessao.numero,
+            Sessao.tipo,
+            Sessao.data,
+            ResumoSessao.presencas,
+            ResumoSessao.faltas_justificadas,
+            ResumoSessao.missao_parlamentar_amp,
+            ResumoSessao.faltas_penalizadoras,
+            func.coalesce(ResumoSessao.total_registos, 0).label("total_registos"),
+        )
+        .outerjoin(ResumoSessao, ResumoSessao.sessao_id == Sessao.id)
+    )
+    if legislatura:
+        query = query.filter(Sessao.legislatura == legislatura)
+    if data_inicio:
+        query = query.filter(Sessao.data >= data_inicio)
+    if data_fim:
+        query = query.filter(Sessao.data <= data_fim)
+    if tipo_sessao:
+        query = query.filter(Sessao.tipo == tipo_sessao)
+
+    return query.order_by(Sessao.data.asc(), Sessao.id.asc()).all()
+
+
+def _pct(presencas: int, faltas_quorum: int) -> float:
+    denom = presencas + faltas_quorum
+    return round((presencas / denom * 100) if denom else 0.0, 2)
+
+
+def resumo_sessoes(linhas) -> list[dict]:
+    """Contrato de /estatisticas/sessoes a partir de `agregados_por_sessao`."""
+    dados = []
+    for sess in linhas:
+        presencas = sess.presencas or 0
+        falta_quorum = sess.faltas_penalizadoras or 0
+        dados.append({
+            "id_legis_sessao": sess.id_legis_sessao,
+            "legislatura": sess.legislatura,
+            "numero": sess.numero,
+            "data": sess.data.isoformat(),
+            "tipo": sess.tipo,
+            "presencas": presencas,
+            "faltas_quorum": falta_quorum,
+            "faltas_justificadas": sess.faltas_justificadas or 0,
+            "amp": sess.missao_parlamentar_amp or 0,
+            "total_registos": sess.total_registos,
+            "assiduidade_pct": _pct(presencas, falta_quorum)
+        })
+    return dados
+
+
+def resumo_periodos(linhas) -> list[dict]:
+    """Contrato de /estatisticas/series a partir de linhas de ResumoPeriodo."""
+    return [{
+        "periodo": r.periodo,
+        "inicio": r.inicio.isoformat() if r.inicio else None,
+        "fim": r.fim.isoformat() if r.fim else None,
+        "sessoes": r.sessoes,
+        "presencas": r.presencas,
+        "faltas_quorum": r.faltas_penalizadoras,
+        "faltas_justificadas": r.faltas_justificadas,
+        "amp": r.missao_parlamentar_amp,
+        "total_registos": r.total_registos,
+        "assiduidade_pct": _pct(r.presencas, r.faltas_penalizadoras),
+    } for r in linhas]
+
+
+def sessoes_por_dia_semana(s) -> dict:
+    """{dia da semana ISO (1=segunda): nº de sessões}, contando todas as sessões."""
+    dia = func.strftime("%w", Sessao.data)
+    # %w: 0=domingo
+    return {int(d) or 7: n for d, n in s.query(dia, func.count(Sessao.id)).group_by(dia)}
+
+
+def resumo_analise_avancada(linhas, custo_dia: float, faltas_por_dia: dict, sessoes_por_dia: dict) -> dict:
+    """
+    Faltas por dia da semana ({dia ISO: faltas}, das séries `dia_semana`, e
+    `sessoes_por_dia_semana`), piores sessões e custo estimado, calculados em memória.
+    """
+    faltas_por_dia_semana = {
+        i: {"dia": dia, "faltas": faltas_por_dia.get(i + 1, 0), "sessoes": sessoes_por_dia.get(i + 1, 0)}
+        for i, dia in enumerate(DIAS_SEMANA)
+    }
+
+    piores_sessoes = []
+    total_faltas_penalizadoras = 0
+
+    for sess in linhas:
+        dia_semana = sess.data.weekday()
+        faltas_quorum = sess.faltas_penalizadoras or 0
+        presencas = sess.presencas or 0
+        total_faltas_penalizadoras += faltas_quorum
+
+        piores_sessoes.append({
+            "id_legis_sessao": sess.id_legis_sessao,
+            "data": sess.data.isoformat(),
+            "tipo": sess.tipo,
+            "assiduidade_pct": _pct(presencas, faltas_quorum),
+            "faltas_quorum": faltas_quorum,
+            "presencas": presencas,
+            "total_registos": sess.total_registos,
+            "dia_semana": DIAS_SEMANA[dia_semana]
+        })
+
+    # Ordenar piores sessões por menor assiduidade
+    piores_sessoes.sort(key=lambda x: x["assiduidade_pct"])
+
+    # Converter dict de faltas por dia em lista
+    faltas_dia_lista = [
+        {
+            "dia": info["dia"],
+            "faltas": info["faltas"],
+            "sessoes": info["sessoes"],
+            "media_por_sessao": round(info["faltas"] / info["sessoes"], 2) if info["sessoes"] > 0 else 0
+        }
+        for dia, info in sorted(faltas_por_dia_semana.items())
+    ]
+
+    return {
+        "faltas_por_dia_semana": faltas_dia_lista,
+        "top_10_piores_sessoes": piores_sessoes[:10],
+        "custo_estimado": {
+            "total_faltas_penalizadoras": total_faltas_penalizadoras,
+            "custo_por_dia": custo_dia,
+            "custo_total": round(total_faltas_penalizadoras * custo_dia, 2),
+            "disclaimer": "Estimativa baseada no salário base de deputado (€4.595,81/mês, 14 meses). Não inclui subsídios adicionais."
+        }
+    }
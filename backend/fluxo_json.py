@@ -0,0 +1,231 @@
+"""
+JSON incremental (streaming), nos dois sentidos.
+
+`iterar_json` gera o documento aos bocados: dicionários são percorridos chave a chave e
+iteradores (p.ex. um gerador sobre `query.yield_per(...)`) são escritos como listas,
+elemento a elemento, sem materializar a lista. Usado pelas rotas Flask com listas
+potencialmente grandes (`resposta_json`) e pelo export_to_json.py (`escrever_json`).
+
+`iterar_lista_json` faz o inverso para ficheiros com uma lista no topo (dados abertos do
+Parlamento): devolve um elemento de cada vez, com memória limitada ao maior elemento.
+"""
+import hashlib
+import json
+import os
+import re
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from pathlib import Path
+
+from flask import current_app, stream_with_context
+
+# Linhas lidas do cursor de cada vez (query.yield_per) e bytes por bloco escrito/enviado
+LOTE_LINHAS = 500
+BLOCO_BYTES = 64 * 1024
+
+
+def iterar_json(valor, indent: int | None = None, ensure_ascii: bool = False,
+                sort_keys: bool = False, _nivel: int = 0) -> Iterator[str]:
+    """
+    Fragmentos do JSON de `valor`. O resultado concatenado é igual a
+    `json.dumps(valor, indent=indent, ensure_ascii=..., sort_keys=...)` (separadores compactos
+    quando `indent` é None), mas só dicionários e iteradores são percorridos em fluxo;
+    os restantes valores (p.ex. cada linha de uma lista) são serializados de uma vez.
+    """
+    opcoes = {"ensure_ascii": ensure_ascii, "sort_keys": sort_keys}
+    if indent is None:
+        separador, dois_pontos, quebra, quebra_fim = ",", ":", "", ""
+    else:
+        separador, dois_pontos = ",", ": "
+        quebra = "\n" + " " * (indent * (_nivel + 1))
+        quebra_fim = "\n" + " " * (indent * _nivel)
+
+    if isinstance(valor, dict):
+        itens = sorted(valor.items()) if sort_keys else valor.items()
+        primeiro = True
+        for chave, sub in itens:
+            yield ("{" if primeiro else separador) + quebra + json.dumps(str(chave), **opcoes) + dois_pontos
+            yield from iterar_json(sub, indent, ensure_ascii, sort_keys, _nivel + 1)
+            primeiro = False
+        yield "{}" if primeiro else quebra_fim + "}"
+    elif isinstance(valor, Iterator):
+        primeiro = True
+        for elemento in valor:
+            texto = json.dumps(elemento, indent=indent, separators=(separador, dois_pontos), **opcoes)
+            if indent is not None:
+                # Reindentar o elemento para o nível em que fica no documento
+                texto = texto.replace("\n", quebra)
+            yield ("[" if primeiro else separador) + quebra + texto
+            primeiro = False
+        yield "[]" if primeiro else quebra_fim + "]"
+    else:
+        texto = json.dumps(valor, indent=indent, separators=(separador, dois_pontos), **opcoes)
+        if indent is not None:
+            texto = texto.replace("\n", quebra_fim)
+        yield texto
+
+
+def em_blocos(fragmentos, tamanho: int = BLOCO_BYTES) -> Iterator[bytes]:
+    """Agrupa fragmentos de texto em blocos UTF-8 de ~`tamanho` bytes."""
+    buffer = []
+    acumulado = 0
+    for fragmento in fragmentos:
+        buffer.append(fragmento)
+        acumulado += len(fragmento)
+        if acumulado >= tamanho:
+            yield "".join(buffer).encode("utf-8")
+            buffer.clear()
+            acumulado = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def resposta_json(valor, status: int = 200):
+    """
+    Resposta Flask em streaming (chunked) com o JSON de `valor`, com as opções do provider
+    JSON da app (como `jsonify`). A sessão do pedido fica aberta até ao fim do envio.
+    """
+    provider = current_app.json
+    fragmentos = iterar_json(valor, ensure_ascii=provider.ensure_ascii, sort_keys=provider.sort_keys)
+    corpo = em_blocos(_com_fim_de_linha(fragmentos))
+    return current_app.response_class(stream_with_context(corpo), status=status, mimetype="application/json")
+
+
+def _com_fim_de_linha(fragmentos):
+    yield from fragmentos
+    yield "\n"  # igual ao jsonify
+
+
+def sha256_ficheiro(caminho: Path) -> str | None:
+    """Hash do ficheiro lido por blocos (None se não existir)."""
+    resumo = hashlib.sha256()
+    try:
+        with open(caminho, "rb") as f:
+            while bloco := f.read(BLOCO_BYTES):
+                resumo.update(bloco)
+    except FileNotFoundError:
+        return None
+    return resumo.hexdigest()
+
+
+def escrever_json(caminho: Path, valor, indent: int | None = None) -> tuple[str, int, bool]:
+    """
+    Escreve o JSON de `valor` em fluxo para um ficheiro temporário, calculando o hash pelo
+    caminho. Só substitui `caminho` (os.replace, atómico) se o conteúdo mudou.
+    Devolve (sha256, bytes, escrito).
+    """
+    temporario = caminho.with_name(caminho.name + ".tmp")
+    hash_novo = hashlib.sha256()
+    tamanho = 0
+    with open(temporario, "wb") as f:
+        for bloco in em_blocos(iterar_json(valor, indent=indent)):
+            f.write(bloco)
+            hash_novo.update(bloco)
+            tamanho += len(bloco)
+    hash_novo = hash_novo.hexdigest()
+    if sha256_ficheiro(caminho) == hash_novo:
+        os.unlink(temporario)
+        return hash_novo, tamanho, False
+    os.replace(temporario, caminho)
+    return hash_novo, tamanho, True
+
+
+_BRANCOS = re.compile(r"[ \t\n\r]*")
+_SEPARADORES = frozenset(",]} \t\r\n")
+
+
+class _LeitorJSON:
+    """Buffer sobre um ficheiro de texto que descodifica um valor JSON de cada vez."""
+
+    def __init__(self, f, bloco: int):
+        self.f = f
+        self.bloco = bloco
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _ler(self, tamanho: int) -> bool:
+        """Descarta o que já foi consumido e acrescenta até `tamanho` caracteres."""
+        pedaco = self.f.read(tamanho)
+        if not pedaco:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + pedaco
+        self.pos = 0
+        return True
+
+    def proximo_caracter(self) -> str:
+        """Próximo carácter que não é espaço, sem o consumir ("" no fim do ficheiro)."""
+        while True:
+            self.pos = _BRANCOS.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._ler(self.bloco):
+                return ""
+
+    def consumir(self):
+        self.pos += 1
+
+    def valor(self):
+        """Descodifica o valor seguinte, lendo mais do ficheiro enquanto estiver incompleto."""
+        self.proximo_caracter()
+        tamanho = self.bloco
+        while True:
+            try:
+                valor, fim = self.decoder.raw_decode(self.buffer, self.pos)
+                # Um valor não seguido de separador pode estar cortado (p.ex. um número "1." + "5")
+                if self.eof or (fim < len(self.buffer) and self.buffer[fim] in _SEPARADORES):
+                    self.pos = fim
+                    return valor
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Blocos crescentes: um elemento muito grande não é re-descodificado vezes sem conta
+            if self._ler(tamanho):
+                tamanho *= 2
+
+
+def _abrir_lista(f, bloco: int) -> _LeitorJSON | None:
+    leitor = _LeitorJSON(f, bloco)
+    if leitor.proximo_caracter() != "[":
+        return None
+    leitor.consumir()
+    return leitor
+
+
+def iterar_lista_json(caminho: Path, bloco: int = BLOCO_BYTES) -> Iterator:
+    """
+    Elementos da lista JSON no topo de `caminho`, um de cada vez (sem carregar o ficheiro).
+    ValueError se o ficheiro não for uma lista JSON válida.
+    """
+    with open(caminho, encoding="utf-8-sig") as f:
+        leitor = _abrir_lista(f, bloco)
+        if leitor is None:
+            raise ValueError("Esperada uma lista JSON no topo do ficheiro.")
+        if leitor.proximo_caracter() == "]":
+            return
+        while True:
+            yield leitor.valor()
+            seguinte = leitor.proximo_caracter()
+            if seguinte == "]":
+                return
+            if seguinte != ",":
+                raise ValueError(f"JSON inválido: esperado ',' ou ']' e não {seguinte or 'fim do ficheiro'!r}.")
+            leitor.consumir()
+
+
+def primeiro_elemento(caminho: Path, bloco: int = BLOCO_BYTES):
+    """Primeiro elemento da lista JSON no topo de `caminho` (None se não for uma lista ou estiver vazia)."""
+    with open(caminho, encoding="utf-8-sig") as f:
+        leitor = _abrir_lista(f, bloco)
+        if leitor is None or leitor.proximo_caracter() in ("]", ""):
+            return None
+        return leitor.valor()
+
+
+def em_lotes(iteravel: Iterable, tamanho: int = LOTE_LINHAS) -> Iterator[list]:
+    """Agrupa os elementos de `iteravel` em listas de até `tamanho`."""
+    iterador = iter(iteravel)
+    while lote := list(islice(iterador, tamanho)):
+        yield lote
@@ -0,0 +1,90 @@
+"""
+Histórico (ledger) de ingestões e hashes de conteúdo.
+
+Cada ficheiro recebido fica registado em `Ingestao` (nome, hash, contagens, geração
+resultante), o que dá um histórico auditável (`GET /ingestoes`). Cada unidade lógica
+ingerida — sessão (`id_legis_sessao`), atividade de um deputado numa legislatura,
+evento da agenda (`Id`) — guarda o hash do seu conteúdo em `HashUnidade`: na carga
+seguinte as unidades com o mesmo hash são saltadas e só as diferenças são escritas.
+Um ficheiro igual ao da última ingestão do mesmo tipo nem chega a ser lido.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Ingestao, HashUnidade
+from cache import geracao_dados
+
+
+def hash_valor(valor) -> str:
+    """sha256 da forma canónica (chaves ordenadas, compacta) de um valor JSON."""
+    texto = json.dumps(valor, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def hash_stream(stream) -> tuple[str, int]:
+    """(sha256, bytes) de um ficheiro aberto; volta a pô-lo no início."""
+    resumo = hashlib.sha256()
+    tamanho = 0
+    while bloco := stream.read(64 * 1024):
+        resumo.update(bloco)
+        tamanho += len(bloco)
+    stream.seek(0)
+    return resumo.hexdigest(), tamanho
+
+
+def ultima_ingestao(s, tipo: str) -> Ingestao | None:
+    return s.query(Ingestao).filter(Ingestao.tipo == tipo).order_by(Ingestao.id.desc()).first()
+
+
+def registar_ingestao(s, tipo: str, ficheiro: str | None, hash_ficheiro: str, tamanho: int | None) -> Ingestao:
+    """Abre o registo de uma ingestão (na transação da própria ingestão). Concluir com `concluir_ingestao`."""
+    ingestao = Ingestao(
+        tipo=tipo,
+        ficheiro=ficheiro,
+        hash=hash_ficheiro,
+        bytes=tamanho,
+        # UTC sem tzinfo, como EstadoDados.atualizado_em
+        recebido_em=datetime.now(timezone.utc).replace(tzinfo=None),
+        estado="aplicada",
+    )
+    s.add(ingestao)
+    s.flush()
+    return ingestao
+
+
+def concluir_ingestao(s, ingestao: Ingestao, stats: dict, unidades: int, alteradas: int):
+    """Guarda contagens e geração resultante; sem unidades alteradas a ingestão fica "inalterada"."""
+    ingestao.unidades = unidades
+    ingestao.unidades_alteradas = alteradas
+    ingestao.estado = "aplicada" if alteradas else "inalterada"
+    ingestao.geracao = geracao_dados(s)
+    ingestao.estatisticas = json.dumps(stats, ensure_ascii=False, default=str)
+
+
+def hashes_unidades(s, tipo: str, chaves) -> dict:
+    """{chave: hash} das unidades já ingeridas (uma query IN)."""
+    chaves = list(chaves)
+    if not chaves:
+        return {}
+    return dict(
+        s.query(HashUnidade.chave, HashUnidade.hash)
+        .filter(HashUnidade.tipo == tipo, HashUnidade.chave.in_(chaves))
+        .all()
+    )
+
+
+def gravar_hashes(s, tipo: str, hashes: dict, ingestao_id: int | None = None):
+    """Upsert dos hashes {chave: hash} das unidades escritas."""
+    if not hashes:
+        return
+    stmt = insert(HashUnidade.__table__)
+    s.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["tipo", "chave"],
+            set_={"hash": stmt.excluded.hash, "ingestao_id": stmt.excluded.ingestao_id},
+        ),
+        [{"tipo": tipo, "chave": chave, "hash": h, "ingestao_id": ingestao_id} for chave, h in hashes.items()],
+    )
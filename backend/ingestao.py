@@ -0,0 +1,311 @@
+import time
+
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Deputado, Sessao, Assiduidade
+from resumos import aplicar_sessao
+from series import aplicar_sessao_series, atualizar_deputados
+from mandatos import aplicar_sessao_intervalos, reconstruir_intervalos
+from nomes import indexar_deputados
+from classificacoes import atualizar_classificacoes, legislaturas_deputados
+from cache import nova_geracao
+from historico_ingestao import hash_valor, hashes_unidades, gravar_hashes
+
+
+class Cronometro:
+    """Regista o tempo (ms) de cada fase da ingestão."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.ultimo = self.inicio
+        self.fases = {}
+
+    def marcar(self, fase: str):
+        agora = time.perf_counter()
+        self.fases[fase] = round((agora - self.ultimo) * 1000, 2)
+        self.ultimo = agora
+
+    def resumo(self) -> dict:
+        return {**self.fases, "total": round((time.perf_counter() - self.inicio) * 1000, 2)}
+
+
+CAMPOS_ASSIDUIDADE = ("partido", "status", "codigo", "motivo")
+CAMPOS_SESSAO = ("legislatura", "numero", "tipo", "data")
+
+
+def resolver_deputados(s, registos) -> tuple[dict, int, set]:
+    """
+    Resolve todos os deputados dos registos com uma única query IN.
+    Cria os que faltam num só INSERT e atualiza em lote o nome/partido dos existentes que mudaram.
+    Devolve ({nome_normalizado: deputado_id}, novos_deputados, ids criados ou alterados).
+    """
+    # O último registo de cada deputado define o nome/partido mais recente
+    ultimos = {}
+    for r in registos:
+        ultimos[r["deputado_normalizado"]] = r
+
+    atuais = {
+        d.nome_normalizado: d
+        for d in s.query(Deputado.nome_normalizado, Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
+        .filter(Deputado.nome_normalizado.in_(list(ultimos)))
+    }
+    existentes = {nome: d.id for nome, d in atuais.items()}
+
+    novos = [
+        {
+            "nome_normalizado": nome,
+            "nome_original_ultimo": r["deputado_original"],
+            "partido_atual": r["partido"],
+        }
+        for nome, r in ultimos.items() if nome not in existentes
+    ]
+    if novos:
+        s.execute(insert(Deputado), novos)
+        existentes.update(
+            s.query(Deputado.nome_normalizado, Deputado.id)
+            .filter(Deputado.nome_normalizado.in_([n["nome_normalizado"] for n in novos]))
+            .all()
+        )
+        indexar_deputados(s, {existentes[n["nome_normalizado"]]: n["nome_normalizado"] for n in novos})
+
+    atualizar = [
+        {"id": d.id, "nome_original_ultimo": r["deputado_original"], "partido_atual": r["partido"]}
+        for nome, r in ultimos.items()
+        if (d := atuais.get(nome)) is not None
+        and (d.nome_original_ultimo, d.partido_atual) != (r["deputado_original"], r["partido"])
+    ]
+    # Partido novo: também as séries/intervalos das linhas sem partido destes deputados
+    atualizar_deputados(s, atualizar)
+
+    alterados = {existentes[n["nome_normalizado"]] for n in novos} | {a["id"] for a in atualizar}
+    return existentes, len(novos), alterados
+
+
+def linhas_assiduidade(registos, deputados_ids: dict) -> dict:
+    """{deputado_id: {campo: valor}} dos registos; duplicados no próprio CSV mantêm a primeira ocorrência."""
+    linhas = {}
+    for r in registos:
+        dep_id = deputados_ids[r["deputado_normalizado"]]
+        if dep_id not in linhas:
+            linhas[dep_id] = {c: r[c] for c in CAMPOS_ASSIDUIDADE}
+    return linhas
+
+
+def inserir_assiduidades(s, sessao_id: int, registos, deputados_ids: dict) -> tuple[int, int]:
+    """
+    Insere todas as linhas de assiduidade com um único executemany
+    (INSERT ... ON CONFLICT DO NOTHING). Devolve (inseridos, duplicados).
+    """
+    linhas = [
+        {"sessao_id": sessao_id, "deputado_id": dep_id, **campos}
+        for dep_id, campos in linhas_assiduidade(registos, deputados_ids).items()
+    ]
+    inseridos = 0
+    if linhas:
+        stmt = insert(Assiduidade.__table__).on_conflict_do_nothing(index_elements=["sessao_id", "deputado_id"])
+        inseridos = s.execute(stmt, linhas).rowcount
+    return inseridos, len(registos) - inseridos
+
+
+def diferencas_assiduidade(s, sessao_id: int, linhas: dict) -> dict:
+    """
+    Compara as linhas pretendidas ({deputado_id: campos}) com as guardadas da sessão,
+    por (sessao_id, deputado_id). Só lê; devolve {"inserir": [...], "atualizar": [...],
+    "remover": [...]}, cada entrada com o deputado_id e os valores antes/depois.
+    """
+    atuais = {
+        r.deputado_id: r
+        for r in s.query(Assiduidade.id, Assiduidade.deputado_id, *(getattr(Assiduidade, c) for c in CAMPOS_ASSIDUIDADE))
+        .filter(Assiduidade.sessao_id == sessao_id)
+    }
+    inserir, atualizar = [], []
+    for dep_id, campos in linhas.items():
+        atual = atuais.get(dep_id)
+        if atual is None:
+            inserir.append({"deputado_id": dep_id, "depois": campos})
+            continue
+        antes = {c: getattr(atual, c) for c in CAMPOS_ASSIDUIDADE}
+        if antes != campos:
+            atualizar.append({"id": atual.id, "deputado_id": dep_id, "antes": antes, "depois": campos})
+    remover = [
+        {"id": r.id, "deputado_id": dep_id, "antes": {c: getattr(r, c) for c in CAMPOS_ASSIDUIDADE}}
+        for dep_id, r in atuais.items() if dep_id not in linhas
+    ]
+    return {"inserir": inserir, "atualizar": atualizar, "remover": remover}
+
+
+def aplicar_diferencas(s, sessao_id: int, diferencas: dict) -> int:
+    """Aplica as diferenças em lote (INSERT, UPDATE por id, DELETE por id). Devolve as linhas inseridas."""
+    inseridos = 0
+    if diferencas["inserir"]:
+        inseridos = s.execute(
+            insert(Assiduidade.__table__),
+            [{"sessao_id": sessao_id, "deputado_id": d["deputado_id"], **d["depois"]} for d in diferencas["inserir"]],
+        ).rowcount
+    if diferencas["atualizar"]:
+        s.execute(update(Assiduidade), [{"id": d["id"], **d["depois"]} for d in diferencas["atualizar"]])
+    if diferencas["remover"]:
+        s.query(Assiduidade).filter(
+            Assiduidade.id.in_([d["id"] for d in diferencas["remover"]])
+        ).delete(synchronize_session=False)
+    return inseridos
+
+
+def conjunto_alteracoes(s, diferencas: dict, sessao_antes: dict, sessao_depois: dict) -> dict:
+    """Conjunto de alterações devolvido ao cliente: deputados (nome) e campos alterados."""
+    ids = {d["deputado_id"] for lista in diferencas.values() for d in lista}
+    nomes = dict(s.query(Deputado.id, Deputado.nome_original_ultimo).filter(Deputado.id.in_(ids)).all()) if ids else {}
+
+    def campos_alterados(antes, depois):
+        # O código deriva do status: não é reportado à parte
+        return {c: [antes[c], depois[c]] for c in CAMPOS_ASSIDUIDADE if c != "codigo" and antes[c] != depois[c]}
+
+    return {
+        "sessao": {
+            c: [str(sessao_antes[c]), str(sessao_depois[c])]
+            for c in CAMPOS_SESSAO if sessao_antes[c] != sessao_depois[c]
+        },
+        "inseridos": [
+            {"deputado": nomes.get(d["deputado_id"]), "status": d["depois"]["status"]}
+            for d in diferencas["inserir"]
+        ],
+        "atualizados": [
+            {"deputado": nomes.get(d["deputado_id"]), "campos": campos_alterados(d["antes"], d["depois"])}
+            for d in diferencas["atualizar"]
+        ],
+        "removidos": [
+            {"deputado": nomes.get(d["deputado_id"]), "status": d["antes"]["status"]}
+            for d in diferencas["remover"]
+        ],
+    }
+
+
+def _substituir_sessao(s, sessao, sessao_meta: dict, registos: list[dict], cronometro) -> dict:
+    """
+    Substituição por diferenças: a Sessao e as linhas iguais mantêm-se (e os ids);
+    só as linhas novas, alteradas ou removidas são escritas.
+    """
+    deputados_ids, novos_deputados, deputados_alterados = resolver_deputados(s, registos)
+    cronometro.marcar("deputados")
+
+    sessao_antes = {c: getattr(sessao, c) for c in CAMPOS_SESSAO}
+    sessao_depois = {**{c: sessao_meta[c] for c in CAMPOS_SESSAO}, "numero": str(sessao_meta["numero"])}
+    linhas = linhas_assiduidade(registos, deputados_ids)
+    diferencas = diferencas_assiduidade(s, sessao.id, linhas)
+    linhas_alteradas = sum(len(lista) for lista in diferencas.values())
+    cronometro.marcar("diferencas")
+
+    inseridos = 0
+    afetados = {d["deputado_id"] for lista in diferencas.values() for d in lista}
+    if linhas_alteradas or sessao_antes != sessao_depois:
+        # Retira o contributo antigo (com a legislatura antiga) e volta a somá-lo no fim
+        aplicar_sessao(s, sessao, sinal=-1)
+        aplicar_sessao_series(s, sessao, sinal=-1)
+        if sessao_antes != sessao_depois:
+            for c, valor in sessao_depois.items():
+                setattr(sessao, c, valor)
+            s.flush()
+            # Dados da sessão mudaram: afeta todos os deputados com registo nela
+            afetados.update(
+                dep_id for (dep_id,) in s.query(Assiduidade.deputado_id).filter_by(sessao_id=sessao.id)
+            )
+        inseridos = aplicar_diferencas(s, sessao.id, diferencas)
+        cronometro.marcar("assiduidade")
+        aplicar_sessao(s, sessao)
+        aplicar_sessao_series(s, sessao)
+        cronometro.marcar("resumos")
+
+    # Deputados com nome/partido novo também mudam no export
+    afetados |= deputados_alterados
+    if sessao_antes["data"] != sessao_depois["data"]:
+        # A sessão mudou de posição: lacunas de outros deputados podem abrir ou fechar
+        reconstruir_intervalos(s)
+    elif afetados:
+        aplicar_sessao_intervalos(s, sessao, afetados)
+    if afetados:
+        cronometro.marcar("intervalos")
+        atualizar_classificacoes(
+            s,
+            {sessao_antes["legislatura"], sessao.legislatura} | legislaturas_deputados(s, deputados_alterados),
+        )
+        cronometro.marcar("classificacoes")
+        nova_geracao(s, "assiduidade", afetados)
+
+    return {
+        "sessao_id": sessao.id,
+        "inseridos": inseridos,
+        "novos_deputados": novos_deputados,
+        "duplicados_ignorados": len(registos) - len(linhas),
+        "inalterada": not afetados,
+        "alteracoes": conjunto_alteracoes(s, diferencas, sessao_antes, sessao_depois),
+    }
+
+
+def ingerir_sessao(s, sessao_meta: dict, registos: list[dict], sessao_existente=None, cronometro=None,
+                   ingestao_id: int | None = None) -> dict:
+    """
+    Ingestão set-based de uma sessão (CSV já validado) numa única transação.
+    Se `sessao_existente` for indicada, os registos são comparados com os guardados e só
+    as diferenças são aplicadas (ver `_substituir_sessao`); com o mesmo conteúdo (hash no
+    histórico de ingestões) nada é lido nem escrito.
+    As tabelas de resumo e séries, os intervalos partidários e as classificações são atualizados na mesma transação.
+    O commit fica a cargo de quem chama.
+    """
+    cronometro = cronometro or Cronometro()
+    chave = sessao_meta["id_legis_sessao"]
+    hash_sessao = hash_valor({"sessao": sessao_meta, "registos": registos})
+    if sessao_existente is not None and hashes_unidades(s, "sessao", [chave]).get(chave) == hash_sessao:
+        cronometro.marcar("hash")
+        return {
+            "sessao_id": sessao_existente.id,
+            "inseridos": 0,
+            "novos_deputados": 0,
+            "duplicados_ignorados": 0,
+            "inalterada": True,
+        }
+
+    if sessao_existente is not None:
+        stats = _substituir_sessao(s, sessao_existente, sessao_meta, registos, cronometro)
+        gravar_hashes(s, "sessao", {chave: hash_sessao}, ingestao_id)
+        return stats
+
+    sessao = Sessao(
+        id_legis_sessao=sessao_meta["id_legis_sessao"],
+        legislatura=sessao_meta["legislatura"],
+        numero=str(sessao_meta["numero"]),
+        tipo=sessao_meta["tipo"],
+        data=sessao_meta["data"]
+    )
+    s.add(sessao)
+    s.flush()
+    cronometro.marcar("sessao")
+
+    deputados_ids, novos_deputados, deputados_alterados = resolver_deputados(s, registos)
+    cronometro.marcar("deputados")
+
+    inseridos, duplicados = inserir_assiduidades(s, sessao.id, registos, deputados_ids)
+    cronometro.marcar("assiduidade")
+
+    aplicar_sessao(s, sessao)
+    aplicar_sessao_series(s, sessao)
+    cronometro.marcar("resumos")
+
+    aplicar_sessao_intervalos(s, sessao)
+    cronometro.marcar("intervalos")
+
+    # Nome/partido novo de um deputado muda as posições por partido das suas legislaturas
+    atualizar_classificacoes(s, {sessao.legislatura} | legislaturas_deputados(s, deputados_alterados))
+    cronometro.marcar("classificacoes")
+
+    # Invalida caches de leitura (cache.py) e marca os deputados para o export incremental
+    nova_geracao(s, "assiduidade", deputados_ids.values())
+    gravar_hashes(s, "sessao", {chave: hash_sessao}, ingestao_id)
+
+    return {
+        "sessao_id": sessao.id,
+        "inseridos": inseridos,
+        "novos_deputados": novos_deputados,
+        "duplicados_ignorados": duplicados,
+        "inalterada": False,
+    }
@@ -0,0 +1,309 @@
+"""
+Intervalos de pertença partidária (IntervaloPartido) mantidos na ingestão.
+
+Um intervalo é uma sequência de sessões consecutivas (por data, id) em que o deputado
+aparece no mesmo partido. Uma lacuna (o deputado não consta de uma sessão, p.ex. por ter
+sido substituído) ou uma mudança de partido abrem um intervalo novo. /substituicoes e o
+export estático leem as entradas e saídas destes intervalos em vez de percorrer todas as
+linhas de Assiduidade sessão a sessão.
+Reconstrução completa: `cd backend && python mandatos.py`
+"""
+from sqlalchemy import and_, func, or_, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import aliased
+
+from models import (
+    Sessao,
+    Deputado,
+    Assiduidade,
+    IntervaloPartido,
+    get_engine_and_session,
+    inicializar_bd,
+)
+from fluxo_json import LOTE_LINHAS
+
+SEM_PARTIDO = "Sem Partido"
+
+
+def partido_linha():
+    """
+    Partido de uma linha de Assiduidade (query com Deputado): o da linha, senão o atual do
+    deputado, senão SEM_PARTIDO. Partilhado pelos intervalos e pelas séries (series.py).
+    """
+    return func.coalesce(
+        func.nullif(Assiduidade.partido, ""), func.nullif(Deputado.partido_atual, ""), SEM_PARTIDO
+    )
+
+
+def calcular_intervalos(s, ids=None) -> list[dict]:
+    """
+    Intervalos dos deputados `ids` (todos, se None) num só varrimento por (deputado, data, id).
+    O partido de cada linha é o de `partido_linha`.
+    """
+    posicao = {
+        sessao_id: i
+        for i, (sessao_id,) in enumerate(s.query(Sessao.id).order_by(Sessao.data, Sessao.id))
+    }
+    query = (
+        s.query(Assiduidade.deputado_id, Assiduidade.sessao_id, partido_linha())
+        .join(Sessao, Sessao.id == Assiduidade.sessao_id)
+        .join(Deputado, Deputado.id == Assiduidade.deputado_id)
+    )
+    if ids is not None:
+        query = query.filter(Assiduidade.deputado_id.in_(list(ids)))
+
+    intervalos = []
+    atual = None
+    anterior = None
+    for dep_id, sessao_id, partido in (
+        query.order_by(Assiduidade.deputado_id, Sessao.data, Sessao.id).yield_per(LOTE_LINHAS)
+    ):
+        p = posicao[sessao_id]
+        if atual is not None and atual["deputado_id"] == dep_id and atual["partido"] == partido and p == anterior + 1:
+            atual["fim_sessao_id"] = sessao_id
+            atual["sessoes"] += 1
+        else:
+            atual = {
+                "deputado_id": dep_id,
+                "partido": partido,
+                "inicio_sessao_id": sessao_id,
+                "fim_sessao_id": sessao_id,
+                "sessoes": 1,
+            }
+            intervalos.append(atual)
+        anterior = p
+    return intervalos
+
+
+def atualizar_intervalos(s, ids):
+    """Recalcula os intervalos dos deputados `ids`."""
+    ids = list(set(ids))
+    if not ids:
+        return
+    s.query(IntervaloPartido).filter(IntervaloPartido.deputado_id.in_(ids)).delete(synchronize_session=False)
+    intervalos = calcular_intervalos(s, ids)
+    if intervalos:
+        s.execute(insert(IntervaloPartido.__table__), intervalos)
+
+
+CAMPOS_INTERVALO = ("deputado_id", "partido", "inicio_sessao_id", "fim_sessao_id", "sessoes")
+
+
+def _vizinha(s, posicao: tuple, seguinte: bool):
+    """Posição (data, id) da sessão anterior ou seguinte a `posicao`; None se não houver."""
+    chave = tuple_(Sessao.data, Sessao.id)
+    query = s.query(Sessao.data, Sessao.id)
+    if seguinte:
+        query = query.filter(chave > posicao).order_by(Sessao.data, Sessao.id)
+    else:
+        query = query.filter(chave < posicao).order_by(Sessao.data.desc(), Sessao.id.desc())
+    linha = query.first()
+    return tuple(linha) if linha is not None else None
+
+
+def _sessoes_entre(s, inicio: tuple, fim: tuple) -> int:
+    """Nº de sessões entre as posições (data, id) `inicio` e `fim`, inclusive."""
+    chave = tuple_(Sessao.data, Sessao.id)
+    return s.query(func.count(Sessao.id)).filter(chave >= inicio, chave <= fim).scalar()
+
+
+def aplicar_sessao_intervalos(s, sessao, deputados=()):
+    """
+    Atualiza os intervalos depois de inserir `sessao` ou de alterar as suas linhas (sem mudar
+    a data), mexendo só nos intervalos junto dela. Para cada deputado, o intervalo que contém
+    a posição da sessão é partido à volta dela; se o deputado consta da sessão, esta junta-se
+    aos intervalos do mesmo partido que acabam na sessão anterior ou começam na seguinte.
+    Deputados tratados: os da sessão, os `deputados` indicados (p.ex. linhas removidas) e os
+    das duas sessões vizinhas (uma sessão nova sem eles abre uma lacuna no intervalo).
+    """
+    posicao = (sessao.data, sessao.id)
+    anterior = _vizinha(s, posicao, seguinte=False)
+    seguinte = _vizinha(s, posicao, seguinte=True)
+    partidos = dict(
+        s.query(Assiduidade.deputado_id, partido_linha())
+        .join(Deputado, Deputado.id == Assiduidade.deputado_id)
+        .filter(Assiduidade.sessao_id == sessao.id)
+    )
+    ids = set(deputados) | set(partidos)
+    if anterior is not None and seguinte is not None:
+        em_ambas = [
+            {dep_id for (dep_id,) in s.query(Assiduidade.deputado_id).filter_by(sessao_id=vizinha[1])}
+            for vizinha in (anterior, seguinte)
+        ]
+        ids |= em_ambas[0] & em_ambas[1]
+    if not ids:
+        return
+
+    inicio = aliased(Sessao)
+    fim = aliased(Sessao)
+    perto = [and_(tuple_(inicio.data, inicio.id) <= posicao, tuple_(fim.data, fim.id) >= posicao)]
+    if anterior is not None:
+        perto.append(IntervaloPartido.fim_sessao_id == anterior[1])
+    if seguinte is not None:
+        perto.append(IntervaloPartido.inicio_sessao_id == seguinte[1])
+    originais = {}
+    por_deputado = {}
+    for r in (
+        s.query(
+            IntervaloPartido.id,
+            *(getattr(IntervaloPartido, c) for c in CAMPOS_INTERVALO),
+            inicio.data.label("inicio_data"),
+            fim.data.label("fim_data"),
+        )
+        .join(inicio, inicio.id == IntervaloPartido.inicio_sessao_id)
+        .join(fim, fim.id == IntervaloPartido.fim_sessao_id)
+        .filter(IntervaloPartido.deputado_id.in_(list(ids)), or_(*perto))
+    ):
+        originais[r.id] = {c: getattr(r, c) for c in CAMPOS_INTERVALO}
+        por_deputado.setdefault(r.deputado_id, []).append({
+            "id": r.id, **originais[r.id],
+            "inicio": (r.inicio_data, r.inicio_sessao_id), "fim": (r.fim_data, r.fim_sessao_id),
+        })
+
+    finais = []
+    for dep_id in ids:
+        intervalos = por_deputado.get(dep_id, [])
+        # Parte o intervalo que contém a sessão em [início, anterior] e [seguinte, fim]
+        for i in [i for i in intervalos if i["inicio"] <= posicao <= i["fim"]]:
+            intervalos.remove(i)
+            id_livre = i["id"]
+            if anterior is not None and i["inicio"] <= anterior:
+                intervalos.append({
+                    **i, "fim_sessao_id": anterior[1], "fim": anterior,
+                    "sessoes": _sessoes_entre(s, i["inicio"], anterior),
+                })
+                id_livre = None
+            if seguinte is not None and i["fim"] >= seguinte:
+                intervalos.append({
+                    **i, "id": id_livre, "inicio_sessao_id": seguinte[1], "inicio": seguinte,
+                    "sessoes": _sessoes_entre(s, seguinte, i["fim"]),
+                })
+
+        partido = partidos.get(dep_id)
+        if partido is not None:
+            esquerda = next((i for i in intervalos if i["fim"] == anterior and i["partido"] == partido), None)
+            direita = next((i for i in intervalos if i["inicio"] == seguinte and i["partido"] == partido), None)
+            if esquerda is not None:
+                atual = esquerda
+                atual.update(fim_sessao_id=sessao.id, fim=posicao, sessoes=atual["sessoes"] + 1)
+            else:
+                atual = {
+                    "id": None, "deputado_id": dep_id, "partido": partido,
+                    "inicio_sessao_id": sessao.id, "fim_sessao_id": sessao.id, "sessoes": 1,
+                    "inicio": posicao, "fim": posicao,
+                }
+                intervalos.append(atual)
+            if direita is not None:
+                intervalos.remove(direita)
+                atual.update(
+                    fim_sessao_id=direita["fim_sessao_id"], fim=direita["fim"],
+                    sessoes=atual["sessoes"] + direita["sessoes"],
+                )
+                if atual["id"] is None:
+                    atual["id"] = direita["id"]
+        finais.extend(intervalos)
+
+    # Só as diferenças são escritas
+    manter = {i["id"] for i in finais if i["id"] is not None}
+    apagar = [id_ for id_ in originais if id_ not in manter]
+    atualizar = [
+        {"id": i["id"], **{c: i[c] for c in CAMPOS_INTERVALO}}
+        for i in finais
+        if i["id"] is not None and {c: i[c] for c in CAMPOS_INTERVALO} != originais[i["id"]]
+    ]
+    inserir = [{c: i[c] for c in CAMPOS_INTERVALO} for i in finais if i["id"] is None]
+    if apagar:
+        s.query(IntervaloPartido).filter(IntervaloPartido.id.in_(apagar)).delete(synchronize_session=False)
+    if atualizar:
+        s.execute(update(IntervaloPartido), atualizar)
+    if inserir:
+        s.execute(insert(IntervaloPartido.__table__), inserir)
+
+
+def movimentos(s) -> list[dict]:
+    """
+    Entradas e saídas por partido: um intervalo que não começa na primeira sessão é uma
+    entrada e um que não acaba na última é uma saída. `partido_anterior`/`partido_seguinte`
+    indicam uma mudança de partido (intervalo adjacente do mesmo deputado noutro partido).
+    Ordenado por partido, início do intervalo e nome.
+    """
+    primeira = s.query(Sessao.id).order_by(Sessao.data, Sessao.id).limit(1).scalar()
+    ultima = s.query(Sessao.id).order_by(Sessao.data.desc(), Sessao.id.desc()).limit(1).scalar()
+    inicio = aliased(Sessao)
+    fim = aliased(Sessao)
+    linhas = (
+        s.query(
+            IntervaloPartido.deputado_id,
+            IntervaloPartido.partido,
+            IntervaloPartido.inicio_sessao_id,
+            IntervaloPartido.fim_sessao_id,
+            IntervaloPartido.sessoes,
+            Deputado.nome_original_ultimo.label("nome"),
+            inicio.id_legis_sessao.label("primeira_sessao"),
+            inicio.data.label("primeira_data"),
+            fim.id_legis_sessao.label("ultima_sessao"),
+            fim.data.label("ultima_data"),
+        )
+        .join(Deputado, Deputado.id == IntervaloPartido.deputado_id)
+        .join(inicio, inicio.id == IntervaloPartido.inicio_sessao_id)
+        .join(fim, fim.id == IntervaloPartido.fim_sessao_id)
+        .order_by(IntervaloPartido.deputado_id, inicio.data, inicio.id)
+        .all()
+    )
+
+    resultado = []
+    for i, linha in enumerate(linhas):
+        antes = linhas[i - 1] if i > 0 and linhas[i - 1].deputado_id == linha.deputado_id else None
+        depois = linhas[i + 1] if i + 1 < len(linhas) and linhas[i + 1].deputado_id == linha.deputado_id else None
+        base = {
+            "partido": linha.partido,
+            "nome": linha.nome,
+            "primeira_sessao": linha.primeira_sessao,
+            "primeira_data": linha.primeira_data.isoformat(),
+            "ultima_sessao": linha.ultima_sessao,
+            "ultima_data": linha.ultima_data.isoformat(),
+            "sessoes": linha.sessoes,
+            "partido_anterior": antes.partido if antes is not None and antes.partido != linha.partido else None,
+            "partido_seguinte": depois.partido if depois is not None and depois.partido != linha.partido else None,
+        }
+        chave = (linha.partido, linha.primeira_data, linha.inicio_sessao_id, linha.nome or "")
+        if linha.inicio_sessao_id != primeira:
+            resultado.append((chave, {"movimento": "entrada", **base}))
+        if linha.fim_sessao_id != ultima:
+            resultado.append((chave, {"movimento": "saida", **base}))
+    resultado.sort(key=lambda par: par[0])
+    return [movimento for _, movimento in resultado]
+
+
+def reconstruir_intervalos(s):
+    """Regenera todos os intervalos a partir das linhas de Assiduidade."""
+    s.query(IntervaloPartido).delete(synchronize_session=False)
+    intervalos = calcular_intervalos(s)
+    if intervalos:
+        s.execute(insert(IntervaloPartido.__table__), intervalos)
+
+
+def reconstruir_intervalos_se_vazio(s) -> bool:
+    """Preenche os intervalos de uma BD anterior a esta tabela. Devolve True se reconstruiu."""
+    if s.query(IntervaloPartido.id).first() is not None:
+        return False
+    if s.query(Assiduidade.id).first() is None:
+        return False
+    reconstruir_intervalos(s)
+    return True
+
+
+def main():
+    inicializar_bd()
+    engine, SessionLocal = get_engine_and_session()
+    session = SessionLocal()
+    try:
+        reconstruir_intervalos(session)
+        session.commit()
+        print(f"Intervalos reconstruídos: {session.query(IntervaloPartido).count()} deputado×partido.")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
+import os
+import threading
 from pathlib import Path
 
 from sqlalchemy import (
     create_engine,
+    text,
+    event,
+    Index,
+    inspect,
+    case,
+    update,
     Column,
     Integer,
+    Float,
     String,
     Date,
     DateTime,
@@ -11,17 +20,67 @@ from sqlalchemy import (
     ForeignKey,
     UniqueConstraint,
 )
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 
+from utils import CODIGOS_ESTADO, CODIGO_OUTRO
+
 # Base declarativa
 Base = declarative_base()
 
-def get_engine_and_session():
+# Pragmas aplicados a cada nova ligação SQLite (leitores concorrentes não bloqueiam com WAL)
+PRAGMAS_SQLITE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256 MB
+    "cache_size": -65536,  # 64 MB (valor negativo = KiB)
+    "temp_store": "MEMORY",
+}
+
+_engine = None
+_SessionLocal = None
+_engine_lock = threading.Lock()
+
+
+def _aplicar_pragmas(dbapi_conn, _connection_record):
+    cursor = dbapi_conn.cursor()
+    try:
+        for nome, valor in PRAGMAS_SQLITE.items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+    finally:
+        cursor.close()
+
+
+def _criar_engine():
     base_dir = Path(__file__).resolve().parent.parent
     db_path = base_dir / "database" / "base.db"
-    engine = create_engine(f"sqlite:///{db_path}", echo=False)
-    SessionLocal = sessionmaker(bind=engine)
-    return engine, SessionLocal
+    # ASSIDUIDADE_DB_URL permite apontar para outra BD (ex.: verificar_planos.py)
+    db_url = os.environ.get("ASSIDUIDADE_DB_URL") or f"sqlite:///{db_path}"
+
+    opcoes = {"echo": False, "pool_pre_ping": True}
+    if ":memory:" not in db_url:
+        # Pool configurável (QueuePool); BDs em memória usam o pool por omissão
+        opcoes.update(
+            pool_size=int(os.environ.get("ASSIDUIDADE_DB_POOL_SIZE", 5)),
+            max_overflow=int(os.environ.get("ASSIDUIDADE_DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.environ.get("ASSIDUIDADE_DB_POOL_TIMEOUT", 30)),
+        )
+    engine = create_engine(db_url, **opcoes)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _aplicar_pragmas)
+    return engine
+
+
+def get_engine_and_session():
+    """Engine e sessionmaker únicos por processo (criados na primeira chamada)."""
+    global _engine, _SessionLocal
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = _criar_engine()
+                _SessionLocal = sessionmaker(bind=engine)
+                _engine = engine
+    return _engine, _SessionLocal
 
 # Modelos
 class Deputado(Base):
@@ -30,11 +89,19 @@ class Deputado(Base):
     nome_normalizado = Column(String, unique=True, nullable=False)
     nome_original_ultimo = Column(String, nullable=False)
     partido_atual = Column(String, nullable=True)
+    # Geração da última ingestão que alterou dados exportados deste deputado (export incremental)
+    geracao_alteracao = Column(Integer, nullable=True, index=True)
 
     # Relação com assiduidade
     assiduidades = relationship("Assiduidade", back_populates="deputado")
     atividades = relationship("DeputadoAtividade", back_populates="deputado")
 
+class TokenDeputado(Base):
+    """Palavras do nome normalizado de cada deputado (pesquisa por palavra/prefixo; ver nomes.py)."""
+    __tablename__ = "tokens_deputados"
+    token = Column(String, primary_key=True)
+    deputado_id = Column(Integer, ForeignKey("deputados.id"), primary_key=True)
+
 class Sessao(Base):
     __tablename__ = "sessoes"
     id = Column(Integer, primary_key=True)
@@ -47,6 +114,13 @@ class Sessao(Base):
     # Relação com assiduidade
     assiduidades = relationship("Assiduidade", back_populates="sessao")
 
+    # Filtros/ordenação de /sessoes, /estatisticas/* e /deputados/filtrados
+    __table_args__ = (
+        Index("ix_sessoes_data", "data"),
+        Index("ix_sessoes_legislatura_data", "legislatura", "data"),
+        Index("ix_sessoes_tipo_data", "tipo", "data"),
+    )
+
 class Assiduidade(Base):
     __tablename__ = "assiduidade"
     id = Column(Integer, primary_key=True)
@@ -54,15 +128,19 @@ class Assiduidade(Base):
     deputado_id = Column(Integer, ForeignKey("deputados.id"), nullable=False)
     partido = Column(String, nullable=True)
     status = Column(String, nullable=False)
+    # Código compacto derivado do status na ingestão (utils.CODIGOS_ESTADO)
+    codigo = Column(String(3), nullable=False, index=True)
     motivo = Column(String, nullable=True)
 
     # Relações
     sessao = relationship("Sessao", back_populates="assiduidades")
     deputado = relationship("Deputado", back_populates="assiduidades")
 
-    # Constraint para evitar duplicados
+    # Constraint para evitar duplicados (o índice único cobre também as buscas por sessao_id)
     __table_args__ = (
         UniqueConstraint("sessao_id", "deputado_id", name="_sessao_deputado_uc"),
+        # Detalhes por deputado e agregados por deputado
+        Index("ix_assiduidade_deputado_sessao", "deputado_id", "sessao_id"),
     )
 
 
@@ -82,6 +160,10 @@ class DeputadoAtividade(Base):
         UniqueConstraint(
             "deputado_id", "tipo", "legislatura", name="_deputado_tipo_legis_uc"
         ),
+        # Filtros de /atividade/deputados e /atividade/estatisticas, ordenados por total
+        Index("ix_deputado_atividades_legis_tipo_total", "legislatura", "tipo", "total"),
+        Index("ix_deputado_atividades_tipo_total", "tipo", "total"),
+        Index("ix_deputado_atividades_total", "total"),
     )
 
 
@@ -101,7 +183,257 @@ class AgendaItem(Base):
     fim = Column(DateTime, nullable=True)
     texto = Column(Text, nullable=True)
 
+    # Filtros de /atividade/agenda, sempre ordenados por início
+    __table_args__ = (
+        Index("ix_agenda_items_inicio", "inicio"),
+        Index("ix_agenda_items_leg_des_inicio", "leg_des", "inicio"),
+        Index("ix_agenda_items_secao_inicio", "secao", "inicio"),
+        Index("ix_agenda_items_tema_inicio", "tema", "inicio"),
+    )
+
+
+class ResumoSessao(Base):
+    """Contagens por estado de cada sessão (mantido na ingestão; ver resumos.py)."""
+    __tablename__ = "resumo_sessoes"
+    sessao_id = Column(Integer, ForeignKey("sessoes.id"), primary_key=True)
+    presencas = Column(Integer, default=0, nullable=False)
+    faltas_justificadas = Column(Integer, default=0, nullable=False)
+    missao_parlamentar_amp = Column(Integer, default=0, nullable=False)
+    faltas_penalizadoras = Column(Integer, default=0, nullable=False)
+    total_registos = Column(Integer, default=0, nullable=False)
+
+
+class ResumoDeputado(Base):
+    """Contagens por estado de cada deputado numa legislatura (mantido na ingestão)."""
+    __tablename__ = "resumo_deputados"
+    id = Column(Integer, primary_key=True)
+    deputado_id = Column(Integer, ForeignKey("deputados.id"), nullable=False)
+    legislatura = Column(String, nullable=False)
+    presencas = Column(Integer, default=0, nullable=False)
+    faltas_justificadas = Column(Integer, default=0, nullable=False)
+    missao_parlamentar_amp = Column(Integer, default=0, nullable=False)
+    faltas_penalizadoras = Column(Integer, default=0, nullable=False)
+    total_registos = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("deputado_id", "legislatura", name="_resumo_deputado_legis_uc"),
+        Index("ix_resumo_deputados_legislatura", "legislatura"),
+    )
+
+
+class ResumoPeriodo(Base):
+    """Contagens por estado por período (dia, semana, mês, ...) e partido ("" = todos; ver series.py)."""
+    __tablename__ = "resumo_periodos"
+    granularidade = Column(String, primary_key=True)
+    periodo = Column(String, primary_key=True)
+    partido = Column(String, primary_key=True)
+    # Primeiro e último dia do período (NULL em dia_semana)
+    inicio = Column(Date, nullable=True)
+    fim = Column(Date, nullable=True)
+    sessoes = Column(Integer, default=0, nullable=False)
+    presencas = Column(Integer, default=0, nullable=False)
+    faltas_justificadas = Column(Integer, default=0, nullable=False)
+    missao_parlamentar_amp = Column(Integer, default=0, nullable=False)
+    faltas_penalizadoras = Column(Integer, default=0, nullable=False)
+    total_registos = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_resumo_periodos_inicio", "granularidade", "partido", "inicio"),
+    )
+
+
+class IntervaloPartido(Base):
+    """Período de um deputado num partido em sessões consecutivas (mantido na ingestão; ver mandatos.py)."""
+    __tablename__ = "intervalos_partido"
+    id = Column(Integer, primary_key=True)
+    deputado_id = Column(Integer, ForeignKey("deputados.id"), nullable=False)
+    partido = Column(String, nullable=False)
+    inicio_sessao_id = Column(Integer, ForeignKey("sessoes.id"), nullable=False)
+    fim_sessao_id = Column(Integer, ForeignKey("sessoes.id"), nullable=False)
+    sessoes = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_intervalos_partido_deputado", "deputado_id"),
+    )
+
+
+class Classificacao(Base):
+    """Posição de cada deputado em cada classificação (critério × legislatura; ver classificacoes.py)."""
+    __tablename__ = "classificacoes"
+    criterio = Column(String, primary_key=True)
+    # "" = todas as legislaturas
+    legislatura = Column(String, primary_key=True)
+    deputado_id = Column(Integer, ForeignKey("deputados.id"), primary_key=True)
+    partido = Column(String, nullable=True)
+    valor = Column(Float, nullable=False)
+    posicao = Column(Integer, nullable=False)
+    posicao_partido = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Top-K (geral e por partido) num intervalo do índice
+        Index("ix_classificacoes_posicao", "criterio", "legislatura", "posicao", "deputado_id"),
+        Index(
+            "ix_classificacoes_partido_posicao",
+            "criterio", "legislatura", "partido", "posicao_partido", "deputado_id",
+        ),
+    )
+
+
+class MediaPartido(Base):
+    """Médias e somas por partido numa legislatura ("" = todas), calculadas com as classificações."""
+    __tablename__ = "medias_partidos"
+    legislatura = Column(String, primary_key=True)
+    partido = Column(String, primary_key=True)
+    deputados = Column(Integer, nullable=False)
+    assiduidade_media = Column(Float, nullable=False)
+    presencas = Column(Integer, nullable=False)
+    faltas_justificadas = Column(Integer, nullable=False)
+    missao_parlamentar_amp = Column(Integer, nullable=False)
+    faltas_penalizadoras = Column(Integer, nullable=False)
+    atividade_total = Column(Integer, nullable=False)
+
+
+class EstadoDados(Base):
+    """Linha única com a geração dos dados (incrementada em cada ingestão; ver cache.py)."""
+    __tablename__ = "estado_dados"
+    id = Column(Integer, primary_key=True)
+    geracao = Column(Integer, default=0, nullable=False)
+    atualizado_em = Column(DateTime, nullable=True)
+    # Última geração em que cada tipo de dados mudou (export incremental)
+    geracao_assiduidade = Column(Integer, nullable=True)
+    geracao_atividade = Column(Integer, nullable=True)
+    geracao_agenda = Column(Integer, nullable=True)
+
+
+class Ingestao(Base):
+    """Histórico de ingestões: um registo por ficheiro recebido (ver historico_ingestao.py)."""
+    __tablename__ = "ingestoes"
+    id = Column(Integer, primary_key=True)
+    tipo = Column(String, nullable=False)  # "assiduidade", "atividade" ou "agenda"
+    ficheiro = Column(String, nullable=True)
+    hash = Column(String(64), nullable=False)
+    bytes = Column(Integer, nullable=True)
+    recebido_em = Column(DateTime, nullable=False)
+    # "aplicada" (houve escrita) ou "inalterada" (ficheiro/unidades iguais às já ingeridas)
+    estado = Column(String, nullable=False)
+    unidades = Column(Integer, default=0, nullable=False)
+    unidades_alteradas = Column(Integer, default=0, nullable=False)
+    geracao = Column(Integer, nullable=True)
+    estatisticas = Column(Text, nullable=True)  # JSON com as contagens da ingestão
+
+    __table_args__ = (
+        Index("ix_ingestoes_tipo", "tipo"),
+        Index("ix_ingestoes_recebido_em", "recebido_em"),
+    )
+
+
+class HashUnidade(Base):
+    """Hash do conteúdo de cada unidade ingerida (sessão, atividade de um deputado numa legislatura, evento)."""
+    __tablename__ = "hashes_unidades"
+    tipo = Column(String, primary_key=True)
+    chave = Column(String, primary_key=True)
+    hash = Column(String(64), nullable=False)
+    ingestao_id = Column(Integer, ForeignKey("ingestoes.id"), nullable=True)
+
+
+# Índices FTS5 de conteúdo externo (tabela FTS → tabela de origem, colunas, opções FTS5),
+# sincronizados por triggers em cada escrita da ingestão. Opcionais: sem FTS5 no SQLite
+# a tabela não é criada.
+TABELAS_FTS = {
+    # Trigramas: pesquisa por qualquer parte do nome (substring) com índice
+    "deputados_fts": ("deputados", ("nome_normalizado",), "tokenize='trigram'"),
+    # Pesquisa (pesquisa.py): palavras sem acentos/maiúsculas; índices de prefixo para type-ahead
+    "agenda_fts": ("agenda_items", ("titulo", "texto"), "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"),
+    "atividades_fts": ("deputado_atividades", ("detalhes",), "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"),
+}
+
+
+def fts_disponivel(conn_ou_sessao, nome: str) -> bool:
+    """True se a tabela FTS5 `nome` existe nesta BD."""
+    return conn_ou_sessao.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"), {"nome": nome}
+    ).first() is not None
+
+
+def _criar_fts(conn):
+    """Cria as tabelas FTS5 em falta (e os triggers) e indexa as linhas já existentes."""
+    for nome, (origem, colunas, opcoes) in TABELAS_FTS.items():
+        if fts_disponivel(conn, nome):
+            continue
+        lista = ", ".join(colunas)
+        novos = ", ".join(f"new.{c}" for c in colunas)
+        antigos = ", ".join(f"old.{c}" for c in colunas)
+        try:
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {nome} USING fts5({lista}, content='{origem}', "
+                f"content_rowid='id', {opcoes})"
+            )
+        except OperationalError:
+            # SQLite sem FTS5 (ou sem o tokenizador): as pesquisas usam só os índices normais
+            continue
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {nome}_ai AFTER INSERT ON {origem} BEGIN "
+            f"INSERT INTO {nome}(rowid, {lista}) VALUES (new.id, {novos}); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {nome}_ad AFTER DELETE ON {origem} BEGIN "
+            f"INSERT INTO {nome}({nome}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END"
+        )
+        # Só quando as colunas indexadas mudam (não em cada atualização da linha)
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER {nome}_au AFTER UPDATE OF {lista} ON {origem} BEGIN "
+            f"INSERT INTO {nome}({nome}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); "
+            f"INSERT INTO {nome}(rowid, {lista}) VALUES (new.id, {novos}); END"
+        )
+        conn.exec_driver_sql(f"INSERT INTO {nome}({nome}) VALUES ('rebuild')")
+
+
+def expr_codigo_estado(status_col):
+    """CASE SQL equivalente a utils.codigo_estado (para backfill)."""
+    return case(
+        *[(status_col.like(f"{prefixo}%"), codigo) for prefixo, codigo in CODIGOS_ESTADO],
+        else_=CODIGO_OUTRO,
+    )
+
+
+def _adicionar_colunas_em_falta(conn):
+    """ALTER TABLE ADD COLUMN para colunas do modelo que a tabela existente ainda não tem."""
+    inspetor = inspect(conn)
+    for tabela in Base.metadata.sorted_tables:
+        existentes = {c["name"] for c in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in existentes:
+                continue
+            # ADD COLUMN não aceita NOT NULL sem DEFAULT; os backfills abaixo preenchem as linhas
+            tipo = coluna.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}")
+
+
+def migrar_esquema(engine):
+    """Migrações ligeiras para BDs criadas por versões anteriores (sem Alembic)."""
+    with engine.begin() as conn:
+        _adicionar_colunas_em_falta(conn)
+        tabela = Assiduidade.__table__
+        conn.execute(
+            update(tabela)
+            .where(tabela.c.codigo.is_(None))
+            .values(codigo=expr_codigo_estado(tabela.c.status))
+        )
+        # BD anterior ao registo por tipo: considera-se que todos os tipos mudaram na geração atual
+        estado = EstadoDados.__table__
+        for tipo in ("assiduidade", "atividade", "agenda"):
+            coluna = estado.c[f"geracao_{tipo}"]
+            conn.execute(update(estado).where(coluna.is_(None)).values({coluna: estado.c.geracao}))
+        # create_all não cria índices novos em tabelas já existentes
+        for tabela_meta in Base.metadata.sorted_tables:
+            for indice in tabela_meta.indexes:
+                indice.create(conn, checkfirst=True)
+        _criar_fts(conn)
+
 
-# Criar tabelas automaticamente se não existirem
-engine, _ = get_engine_and_session()
-Base.metadata.create_all(engine)
+def inicializar_bd():
+    """Cria as tabelas em falta e aplica as migrações. Chamar no arranque (app, scripts)."""
+    engine, _ = get_engine_and_session()
+    Base.metadata.create_all(engine)
+    migrar_esquema(engine)
+    return engine
@@ -0,0 +1,105 @@
+"""
+Resolução do nome de um deputado (rota /deputados/<nome>/detalhes) com índices.
+
+Por ordem, e parando na primeira que encontra alguém:
+1. nome normalizado exato (`utils.normalizar_nome`, índice único de `nome_normalizado`);
+2. palavras/prefixos: cada palavra pedida tem de ser o início de uma palavra do nome
+   (intervalos na chave primária de `tokens_deputados`);
+3. se o SQLite tiver FTS5, qualquer parte do nome (`deputados_fts`, trigramas).
+Vários candidatos num passo: ganha quem tem todas as palavras pedidas completas, se for
+só um; caso contrário o nome é ambíguo e os candidatos são devolvidos.
+"""
+import re
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Deputado, TokenDeputado, fts_disponivel
+from utils import normalizar_nome
+
+# Candidatos devolvidos num nome ambíguo
+MAX_CANDIDATOS = 20
+_PALAVRAS = re.compile(r"[a-z0-9]+")
+
+
+def tokens(nome_normalizado: str) -> set:
+    """Palavras de um nome já normalizado (sem acentos, minúsculas)."""
+    return set(_PALAVRAS.findall(nome_normalizado))
+
+
+def indexar_deputados(s, deputados: dict):
+    """Grava as palavras de {deputado_id: nome_normalizado} (chamar ao criar deputados)."""
+    linhas = [
+        {"token": token, "deputado_id": dep_id}
+        for dep_id, nome in deputados.items() for token in tokens(nome)
+    ]
+    if linhas:
+        s.execute(insert(TokenDeputado.__table__).on_conflict_do_nothing(), linhas)
+
+
+def indexar_em_falta(s) -> int:
+    """Indexa os deputados sem palavras (BD anterior a esta tabela). Devolve quantos."""
+    em_falta = dict(
+        s.query(Deputado.id, Deputado.nome_normalizado)
+        .filter(~Deputado.id.in_(select(TokenDeputado.deputado_id)))
+        .all()
+    )
+    indexar_deputados(s, em_falta)
+    return len(em_falta)
+
+
+def _por_prefixos(s, palavras: list) -> set:
+    if not palavras:
+        return set()
+    ids = None
+    for palavra in palavras:
+        # Intervalo [palavra, palavra + U+FFFF) na chave (token, deputado_id)
+        encontrados = {
+            dep_id for (dep_id,) in
+            s.query(TokenDeputado.deputado_id)
+            .filter(TokenDeputado.token >= palavra, TokenDeputado.token < palavra + "\uffff")
+        }
+        ids = encontrados if ids is None else ids & encontrados
+        if not ids:
+            return set()
+    return ids
+
+
+def _por_fts(s, normalizado: str) -> set:
+    # Trigramas: pelo menos 3 caracteres
+    if len(normalizado) < 3 or not fts_disponivel(s, "deputados_fts"):
+        return set()
+    termo = '"' + normalizado.replace('"', '""') + '"'
+    return {
+        rowid for (rowid,) in
+        s.execute(text("SELECT rowid FROM deputados_fts WHERE deputados_fts MATCH :termo"), {"termo": termo})
+    }
+
+
+def resolver_nome(s, nome: str) -> tuple:
+    """
+    Deputado com o nome `nome` (completo ou parcial, com ou sem acentos).
+    Devolve (deputado, []) se for único, (None, candidatos) se for ambíguo
+    (ordenados por nome, até MAX_CANDIDATOS) e (None, []) se não existir.
+    """
+    normalizado = normalizar_nome(nome)
+    if not normalizado:
+        return None, []
+    dep = s.query(Deputado).filter(Deputado.nome_normalizado == normalizado).first()
+    if dep is not None:
+        return dep, []
+
+    palavras = tokens(normalizado)
+    ids = _por_prefixos(s, sorted(palavras)) or _por_fts(s, normalizado)
+    if not ids:
+        return None, []
+    candidatos = (
+        s.query(Deputado).filter(Deputado.id.in_(ids))
+        .order_by(Deputado.nome_normalizado, Deputado.id).all()
+    )
+    if len(candidatos) == 1:
+        return candidatos[0], []
+    completos = [d for d in candidatos if palavras <= tokens(d.nome_normalizado)]
+    if len(completos) == 1:
+        return completos[0], []
+    return None, candidatos[:MAX_CANDIDATOS]
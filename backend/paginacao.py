@@ -0,0 +1,175 @@
+"""
+Paginação keyset e projeção de campos das listagens da API.
+
+Cada listagem é ordenada por (coluna, id): no SQLite o rowid faz parte de todos os
+índices, pelo que o índice da coluna (com os filtros de igualdade à frente) serve a
+ordenação e o desempate. O cursor opaco guarda a chave da última linha enviada e a
+página seguinte continua a partir dela com um intervalo no índice, nunca com OFFSET.
+Colunas anuláveis ficam com os NULL no fim, percorridos num segundo troço (coluna IS NULL,
+por id). `?fields=a,b` limita as colunas lidas e devolvidas.
+
+Parâmetros: `limit` (tamanho da página), `cursor` (valor de `seguinte` da página anterior)
+e `fields`. Sem `limit`/`cursor` a listagem devolve tudo (salvo limite por omissão da rota).
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
+
+from fluxo_json import LOTE_LINHAS
+
+LIMITE_MAX = 1000
+
+
+class PedidoInvalido(ValueError):
+    """Parâmetro `limit`, `cursor` ou `fields` inválido (a rota responde 400)."""
+
+
+def iso(valor):
+    """Data/hora em ISO 8601 (None mantém-se)."""
+    return valor.isoformat() if valor is not None else None
+
+
+class Listagem:
+    """
+    Listagem paginável: `campos` (nome na resposta → (expressão SQL, conversão do valor ou None))
+    e ordenação por (`coluna`, `id_coluna`), ascendente ou descendente. `anulavel` indica se
+    a coluna pode ser NULL (por omissão, o que diz o modelo).
+    """
+
+    def __init__(self, nome: str, campos: dict, coluna, id_coluna, descendente: bool = False,
+                 anulavel: bool | None = None):
+        self.nome = nome
+        self.campos = campos
+        self.coluna = coluna
+        self.id_coluna = id_coluna
+        self.descendente = descendente
+        self.anulavel = getattr(coluna.expression, "nullable", True) if anulavel is None else anulavel
+
+    def pedido(self, args, limite_omissao: int | None = None) -> "Pagina":
+        """Lê `fields`, `limit` e `cursor` dos argumentos do pedido."""
+        campos = list(self.campos)
+        if args.get("fields", "").strip():
+            pedidos = [c.strip() for c in args["fields"].split(",") if c.strip()]
+            desconhecidos = [c for c in pedidos if c not in self.campos]
+            if desconhecidos:
+                raise PedidoInvalido(
+                    f"Campos desconhecidos: {', '.join(desconhecidos)} (disponíveis: {', '.join(self.campos)})."
+                )
+            campos = [c for c in self.campos if c in pedidos]
+
+        limite = limite_omissao
+        if args.get("limit", "").strip():
+            try:
+                limite = int(args["limit"])
+            except ValueError:
+                raise PedidoInvalido("limit tem de ser um inteiro.") from None
+            if not 1 <= limite <= LIMITE_MAX:
+                raise PedidoInvalido(f"limit tem de estar entre 1 e {LIMITE_MAX}.")
+
+        posicao = None
+        if args.get("cursor", "").strip():
+            posicao = self._ler_cursor(args["cursor"].strip())
+            if limite is None:
+                limite = LIMITE_MAX
+        return Pagina(self, campos, limite, posicao)
+
+    def _ler_cursor(self, cursor: str) -> tuple:
+        try:
+            nome, nulo, valor, id_ = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise PedidoInvalido("cursor inválido.") from None
+        if nome != self.nome or not isinstance(id_, int):
+            raise PedidoInvalido("cursor inválido.")
+        if not nulo:
+            tipo = self.coluna.type.python_type
+            try:
+                if tipo in (date, datetime):
+                    valor = tipo.fromisoformat(valor)
+                elif not isinstance(valor, tipo):
+                    raise ValueError
+            except (ValueError, TypeError):
+                raise PedidoInvalido("cursor inválido.") from None
+        return bool(nulo), valor, id_
+
+    def cursor(self, linha) -> str:
+        """Cursor opaco que continua depois de `linha`."""
+        valor = linha._chave
+        nulo = valor is None
+        if isinstance(valor, (date, datetime)):
+            valor = valor.isoformat()
+        texto = json.dumps([self.nome, nulo, valor, linha._id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+class Pagina:
+    """Um pedido a uma Listagem: campos projetados, tamanho da página e posição do cursor."""
+
+    def __init__(self, listagem: Listagem, campos: list, limite: int | None, posicao: tuple | None):
+        self.listagem = listagem
+        self.campos = campos
+        self.limite = limite
+        self.posicao = posicao
+
+    @property
+    def paginada(self) -> bool:
+        return self.limite is not None
+
+    def colunas(self) -> list:
+        """Colunas a selecionar: os campos pedidos mais a chave de ordenação."""
+        lst = self.listagem
+        return [
+            *(lst.campos[c][0].label(c) for c in self.campos),
+            lst.coluna.label("_chave"),
+            lst.id_coluna.label("_id"),
+        ]
+
+    def _ordem(self, coluna):
+        return coluna.desc() if self.listagem.descendente else coluna.asc()
+
+    def _depois(self, coluna, valor):
+        return coluna < valor if self.listagem.descendente else coluna > valor
+
+    def consultar(self, query) -> tuple:
+        """
+        Aplica ordenação, cursor e limite a `query` (com `colunas()` e já filtrada).
+        Devolve (iterador de dicionários, cursor seguinte ou None). Sem paginação as linhas
+        são lidas do cursor em lotes.
+        """
+        lst = self.listagem
+        if not self.paginada:
+            ordem = self._ordem(lst.coluna)
+            if lst.anulavel:
+                ordem = ordem.nullslast()
+            linhas = query.order_by(ordem, self._ordem(lst.id_coluna)).yield_per(LOTE_LINHAS)
+            return (self._dicionario(linha) for linha in linhas), None
+
+        nulo, valor, id_ = self.posicao or (False, None, None)
+        linhas = []
+        if not nulo:
+            # Troço dos valores não nulos: intervalo (coluna, id) no índice da coluna
+            q = query
+            if lst.anulavel:
+                q = q.filter(lst.coluna.isnot(None))
+            if self.posicao is not None:
+                q = q.filter(self._depois(tuple_(lst.coluna, lst.id_coluna), (valor, id_)))
+            linhas = q.order_by(self._ordem(lst.coluna), self._ordem(lst.id_coluna)).limit(self.limite + 1).all()
+        if lst.anulavel and len(linhas) <= self.limite:
+            # Troço dos NULL (sempre no fim), por id
+            q = query.filter(lst.coluna.is_(None))
+            if nulo:
+                q = q.filter(self._depois(lst.id_coluna, id_))
+            linhas += q.order_by(self._ordem(lst.id_coluna)).limit(self.limite + 1 - len(linhas)).all()
+
+        seguinte = lst.cursor(linhas[self.limite - 1]) if len(linhas) > self.limite else None
+        return (self._dicionario(linha) for linha in linhas[:self.limite]), seguinte
+
+    def _dicionario(self, linha) -> dict:
+        dados = {}
+        for campo in self.campos:
+            valor = getattr(linha, campo)
+            conversao = self.listagem.campos[campo][1]
+            dados[campo] = conversao(valor) if conversao else valor
+        return dados
@@ -0,0 +1,47 @@
+"""
+Pesquisa de texto (FTS5) na agenda (título e texto) e na atividade dos deputados
+(títulos em `detalhes`), rotas /atividade/agenda/pesquisa e /atividade/deputados/pesquisa.
+
+Os índices `agenda_fts` e `atividades_fts` (models.TABELAS_FTS) são de conteúdo externo e
+atualizados por triggers nas próprias escritas de process_agenda/process_atividade.
+O tokenizador ignora acentos e maiúsculas ("saude" encontra "Saúde"); a última palavra
+pedida é um prefixo (type-ahead), servido pelos índices de prefixo. Resultados ordenados
+por relevância (bm25) e paginados com cursor keyset sobre (relevância, id).
+"""
+import re
+
+from sqlalchemy import Float, Integer, column, func, literal_column, table
+
+from paginacao import PedidoInvalido
+
+# Marcas à volta das palavras encontradas no trecho (texto simples, sem HTML)
+MARCA_INICIO = "["
+MARCA_FIM = "]"
+PALAVRAS_TRECHO = 12
+_PALAVRAS = re.compile(r"\w+")
+
+
+def tabela_fts(nome: str):
+    """Tabela FTS5 `nome` com as colunas ocultas rowid e rank."""
+    return table(nome, column("rowid", Integer), column("rank", Float))
+
+
+def termo_fts(q: str | None) -> str:
+    """
+    Query FTS5 a partir do texto pedido: palavras entre aspas (sem operadores FTS5),
+    todas obrigatórias, a última como prefixo.
+    """
+    palavras = _PALAVRAS.findall(q or "")
+    if not palavras:
+        raise PedidoInvalido("q tem de conter pelo menos uma palavra.")
+    return " ".join(f'"{p}"' for p in palavras) + "*"
+
+
+def corresponde(fts, q: str | None):
+    """Condição `<fts> MATCH <termo>`."""
+    return literal_column(fts.name).op("MATCH")(termo_fts(q))
+
+
+def trecho(fts, coluna: int = -1):
+    """Excerto com as palavras encontradas (coluna -1: a que melhor corresponde)."""
+    return func.snippet(literal_column(fts.name), coluna, MARCA_INICIO, MARCA_FIM, "…", PALAVRAS_TRECHO)
@@ -2,12 +2,19 @@ import pandas as pd
 from datetime import datetime
 
 # Import absoluto
-from utils import limpar_campo, normalizar_nome, validar_colunas, necessita_motivo, motivo_valido
+from utils import (
+    limpar_coluna,
+    normalizar_coluna,
+    validar_colunas,
+    mascara_necessita_motivo,
+    mascara_motivo_valido,
+    codigo_estado_coluna,
+)
 
 def ler_csv_generoso(file_storage) -> pd.DataFrame:
     df = pd.read_csv(file_storage, sep="\t", quotechar='"', dtype=str)
     for col in df.columns:
-        df[col] = df[col].apply(limpar_campo)
+        df[col] = limpar_coluna(df[col])
     return df
 
 def validar_regra_230(df) -> dict:
@@ -18,28 +25,37 @@ def validar_regra_230(df) -> dict:
         "distintos": distintos
     }
 
+def _coluna_motivo(df) -> pd.Series:
+    if "MOTIVO" in df.columns:
+        return df["MOTIVO"]
+    return pd.Series("", index=df.index, dtype=object)
+
 def validar_motivos(df, include_amp: bool = False) -> dict:
+    # Máscaras calculadas de uma vez; só as linhas em violação são percorridas
+    status = limpar_coluna(df["ASSIDUIDADE"])
+    motivo = limpar_coluna(_coluna_motivo(df))
+
+    exige = mascara_necessita_motivo(status, include_amp=include_amp)
+    em_falta = exige & (motivo == "")
+    invalido = exige & ~em_falta & ~mascara_motivo_valido(motivo)
+
     violacoes = []
-    for idx, row in df.iterrows():
-        status = limpar_campo(row["ASSIDUIDADE"])
-        motivo = limpar_campo(row.get("MOTIVO", ""))
-
-        if necessita_motivo(status, include_amp=include_amp):
-            if motivo == "":
-                violacoes.append({
-                    "linha": idx + 2,
-                    "deputado": row["DEPUTADO"],
-                    "assiduidade": status,
-                    "erro": "Motivo em falta"
-                })
-            elif not motivo_valido(motivo):
-                violacoes.append({
-                    "linha": idx + 2,
-                    "deputado": row["DEPUTADO"],
-                    "assiduidade": status,
-                    "motivo": motivo,
-                    "erro": "Motivo inválido (não consta da lista oficial)"
-                })
+    for idx in df.index[em_falta | invalido]:
+        if em_falta[idx]:
+            violacoes.append({
+                "linha": int(idx) + 2,
+                "deputado": df.at[idx, "DEPUTADO"],
+                "assiduidade": status[idx],
+                "erro": "Motivo em falta"
+            })
+        else:
+            violacoes.append({
+                "linha": int(idx) + 2,
+                "deputado": df.at[idx, "DEPUTADO"],
+                "assiduidade": status[idx],
+                "motivo": motivo[idx],
+                "erro": "Motivo inválido (não consta da lista oficial)"
+            })
     ok = len(violacoes) == 0
     return {
         "ok": ok,
@@ -60,16 +76,25 @@ def extrair_metadados_sessao(df) -> dict:
     }
 
 def preparar_registos_assiduidade(df) -> list[dict]:
-    registos = []
-    for _, row in df.iterrows():
-        registos.append({
-            "deputado_original": row["DEPUTADO"],
-            "deputado_normalizado": normalizar_nome(row["DEPUTADO"]),
-            "partido": row["PARTIDO"],
-            "status": row["ASSIDUIDADE"],
-            "motivo": row.get("MOTIVO", "")
-        })
-    return registos
+    colunas = zip(
+        df["DEPUTADO"].tolist(),
+        normalizar_coluna(df["DEPUTADO"]).tolist(),
+        df["PARTIDO"].tolist(),
+        df["ASSIDUIDADE"].tolist(),
+        codigo_estado_coluna(df["ASSIDUIDADE"]).tolist(),
+        _coluna_motivo(df).tolist(),
+    )
+    return [
+        {
+            "deputado_original": deputado,
+            "deputado_normalizado": normalizado,
+            "partido": partido,
+            "status": status,
+            "codigo": codigo,
+            "motivo": motivo
+        }
+        for deputado, normalizado, partido, status, codigo, motivo in colunas
+    ]
 
 def validar_e_preparar(file_storage) -> dict:
     try:
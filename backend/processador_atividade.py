@@ -1,14 +1,30 @@
-import json
 from datetime import datetime
 from pathlib import Path
 
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
 from models import (
     AgendaItem,
     Deputado,
     DeputadoAtividade,
     get_engine_and_session,
+    inicializar_bd,
 )
 from utils import normalizar_nome
+from cache import nova_geracao
+from fluxo_json import iterar_lista_json, primeiro_elemento, em_lotes, sha256_ficheiro
+from nomes import indexar_deputados
+from classificacoes import atualizar_classificacoes, legislaturas_deputados
+from series import atualizar_deputados
+from historico_ingestao import (
+    hash_valor,
+    hashes_unidades,
+    gravar_hashes,
+    ultima_ingestao,
+    registar_ingestao,
+    concluir_ingestao,
+)
 
 ACTIVITY_MAPPING = {
     "Ini": "Iniciativas",
@@ -45,20 +61,151 @@ def build_datetime(date_str: str, time_str: str):
         return datetime.combine(date_part, datetime.min.time())
 
 
-def _get_or_create_deputado(session, nome_normalizado: str, nome_original: str, partido: str | None):
-    deputado = session.query(Deputado).filter_by(nome_normalizado=nome_normalizado).first()
-    if deputado:
-        deputado.partido_atual = partido or deputado.partido_atual
-        deputado.nome_original_ultimo = nome_original or deputado.nome_original_ultimo
-        return deputado
-    deputado = Deputado(
-        nome_normalizado=nome_normalizado,
-        nome_original_ultimo=nome_original,
-        partido_atual=partido,
-    )
-    session.add(deputado)
-    session.flush()
-    return deputado
+def detetar_tipo(path: Path) -> str | None:
+    """"atividade" ou "agenda" a partir do primeiro elemento do ficheiro (None se não for reconhecido)."""
+    item0 = primeiro_elemento(path)
+    if not isinstance(item0, dict):
+        return None
+    if "AtividadeDeputadoList" in item0 and "Deputado" in item0:
+        return "atividade"
+    if "EventStartDate" in item0 and "Title" in item0:
+        return "agenda"
+    return None
+
+
+# Colunas de AgendaItem copiadas de cada evento (externo_id é a chave do upsert)
+CAMPOS_AGENDA = (
+    "titulo", "tema", "secao", "local", "organizacao", "leg_des",
+    "parlamentar_group", "link", "texto", "inicio", "fim",
+)
+
+
+def _resolver_deputados(session, deputados: dict) -> tuple[dict, int, set]:
+    """
+    Resolve os deputados de um lote ({nome_normalizado: (nome_original, partido)}) com uma
+    query IN, cria os que faltam num só INSERT e atualiza em lote apenas os que mudaram
+    (nome/partido em falta mantêm o atual). Devolve ({nome_normalizado: id}, novos, ids alterados).
+    """
+    existentes = {
+        nome: (dep_id, original, partido)
+        for nome, dep_id, original, partido in session.query(
+            Deputado.nome_normalizado, Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual
+        ).filter(Deputado.nome_normalizado.in_(list(deputados)))
+    }
+    ids = {nome: e[0] for nome, e in existentes.items()}
+    alterados = set()
+
+    novos = [
+        {"nome_normalizado": nome, "nome_original_ultimo": original, "partido_atual": partido}
+        for nome, (original, partido) in deputados.items() if nome not in existentes
+    ]
+    if novos:
+        session.execute(insert(Deputado), novos)
+        ids.update(
+            session.query(Deputado.nome_normalizado, Deputado.id)
+            .filter(Deputado.nome_normalizado.in_([n["nome_normalizado"] for n in novos]))
+            .all()
+        )
+        alterados.update(ids[n["nome_normalizado"]] for n in novos)
+        indexar_deputados(session, {ids[n["nome_normalizado"]]: n["nome_normalizado"] for n in novos})
+
+    atualizar = []
+    for nome, (dep_id, original_atual, partido_atual) in existentes.items():
+        original, partido = deputados[nome]
+        linha = {
+            "id": dep_id,
+            "nome_original_ultimo": original or original_atual,
+            "partido_atual": partido or partido_atual,
+        }
+        if (linha["nome_original_ultimo"], linha["partido_atual"]) != (original_atual, partido_atual):
+            atualizar.append(linha)
+            alterados.add(dep_id)
+    # Partido novo: também as séries/intervalos das linhas sem partido destes deputados
+    atualizar_deputados(session, atualizar)
+
+    return ids, len(novos), alterados
+
+
+def _gravar_atividades(session, linhas: dict) -> tuple[int, int, int, set]:
+    """
+    Upsert de {(deputado_id, tipo, legislatura): (total, detalhes)}: uma query carrega as
+    chaves existentes dos deputados do lote; as novas entram num INSERT ... ON CONFLICT DO UPDATE
+    e só as que mudaram são atualizadas (UPDATE em lote por id).
+    Devolve (inseridas, atualizadas, inalteradas, deputados com alterações).
+    """
+    existentes = {
+        (dep_id, tipo, legislatura): (ativ_id, total, detalhes)
+        for ativ_id, dep_id, tipo, legislatura, total, detalhes in session.query(
+            DeputadoAtividade.id, DeputadoAtividade.deputado_id, DeputadoAtividade.tipo,
+            DeputadoAtividade.legislatura, DeputadoAtividade.total, DeputadoAtividade.detalhes,
+        ).filter(DeputadoAtividade.deputado_id.in_({chave[0] for chave in linhas}))
+    }
+
+    novas, atualizar, inalteradas, alterados = [], [], 0, set()
+    for (dep_id, tipo, legislatura), (total, detalhes) in linhas.items():
+        atual = existentes.get((dep_id, tipo, legislatura))
+        if atual is None:
+            novas.append({
+                "deputado_id": dep_id, "tipo": tipo, "legislatura": legislatura,
+                "total": total, "detalhes": detalhes,
+            })
+        elif (atual[1], atual[2]) == (total, detalhes):
+            inalteradas += 1
+            continue
+        else:
+            atualizar.append({"id": atual[0], "total": total, "detalhes": detalhes})
+        alterados.add(dep_id)
+
+    if novas:
+        stmt = insert(DeputadoAtividade.__table__)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["deputado_id", "tipo", "legislatura"],
+                set_={"total": stmt.excluded.total, "detalhes": stmt.excluded.detalhes},
+            ),
+            novas,
+        )
+    if atualizar:
+        session.execute(update(DeputadoAtividade), atualizar)
+    return len(novas), len(atualizar), inalteradas, alterados
+
+
+def _gravar_agenda(session, eventos: dict) -> tuple[int, int, int]:
+    """
+    Upsert de {externo_id: {campo: valor}}: uma query carrega os eventos existentes do lote
+    e só os novos ou alterados seguem num INSERT ... ON CONFLICT (externo_id) DO UPDATE.
+    Devolve (inseridos, atualizados, inalterados).
+    """
+    colunas = [getattr(AgendaItem, campo) for campo in CAMPOS_AGENDA]
+    existentes = {
+        linha[0]: dict(zip(CAMPOS_AGENDA, linha[1:]))
+        for linha in session.query(AgendaItem.externo_id, *colunas)
+        .filter(AgendaItem.externo_id.in_(list(eventos)))
+    }
+
+    gravar, inseridos, inalterados = [], 0, 0
+    for externo_id, campos in eventos.items():
+        atual = existentes.get(externo_id)
+        if atual is not None:
+            # Evento sem título mantém o que já tinha
+            campos["titulo"] = campos["titulo"] or atual["titulo"]
+            if campos == atual:
+                inalterados += 1
+                continue
+        else:
+            inseridos += 1
+        gravar.append({"externo_id": externo_id, **campos})
+
+    if gravar:
+        stmt = insert(AgendaItem.__table__)
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["externo_id"],
+                set_={campo: stmt.excluded[campo] for campo in CAMPOS_AGENDA},
+            ),
+            gravar,
+        )
+    return inseridos, len(gravar) - inseridos, inalterados
 
 
 def _detalhes_limit(lista: list) -> str:
@@ -73,87 +220,175 @@ def _detalhes_limit(lista: list) -> str:
     return "; ".join([s for s in nomes if s])
 
 
-def process_atividade(path: Path, session):
-    payload = json.loads(path.read_text())
-    for entry in payload:
-        deputado_meta = entry.get("Deputado") or {}
-        nome = deputado_meta.get("DepNomeParlamentar") or deputado_meta.get("DepNomeCompleto")
-        if not nome:
+def _por_alterar(session, tipo: str, unidades: list, stats: dict) -> tuple[list, dict]:
+    """
+    Filtra as unidades [(chave, hash, entrada)] de um lote cujo hash difere do guardado
+    (uma query IN). Devolve (entradas a escrever, {chave: hash} a gravar).
+    """
+    guardados = hashes_unidades(session, tipo, {chave for chave, _, _ in unidades})
+    entradas, novos = [], {}
+    for chave, h, entrada in unidades:
+        if guardados.get(chave) == h:
+            stats["unidades_inalteradas"] += 1
             continue
-        nome_norm = normalizar_nome(nome)
-        if not nome_norm:
+        # Repetida no ficheiro: compara com a versão anterior do próprio ficheiro
+        guardados[chave] = novos[chave] = h
+        entradas.append(entrada)
+    return entradas, novos
+
+
+def process_atividade(path: Path, session, ingestao_id: int | None = None) -> dict:
+    """
+    Ingere o ficheiro AtividadeDeputado lido em fluxo, por lotes de deputados. Cada bloco
+    (deputado × legislatura) cujo hash não mudou desde a última carga é saltado; para os
+    restantes o lote resolve os deputados e faz o upsert das atividades com meia dúzia de
+    statements (a memória depende do lote e não do tamanho do ficheiro).
+    Devolve as contagens (entradas, ignoradas, unidades_inalteradas, novos_deputados,
+    inseridos, atualizados, inalterados).
+    """
+    stats = dict.fromkeys(
+        ("entradas", "ignoradas", "unidades_inalteradas", "novos_deputados", "inseridos", "atualizados", "inalterados"), 0
+    )
+    afetados = set()
+    for lote in em_lotes(iterar_lista_json(path)):
+        stats["entradas"] += len(lote)
+        unidades = []
+        for entry in lote:
+            deputado_meta = entry.get("Deputado") or {}
+            nome = deputado_meta.get("DepNomeParlamentar") or deputado_meta.get("DepNomeCompleto")
+            nome_norm = normalizar_nome(nome) if nome else None
+            if not nome_norm:
+                stats["ignoradas"] += 1
+                continue
+            chave = f"{nome_norm}|{deputado_meta.get('LegDes') or ''}"
+            unidades.append((chave, hash_valor(entry), (entry, nome, nome_norm)))
+        alterar, hashes = _por_alterar(session, "atividade", unidades, stats)
+
+        deputados = {}
+        linhas = {}
+        for entry, nome, nome_norm in alterar:
+            deputado_meta = entry.get("Deputado") or {}
+            partido = None
+            gp = deputado_meta.get("DepGP")
+            if isinstance(gp, list) and gp:
+                partido = gp[0].get("GpSigla")
+            legislatura = deputado_meta.get("LegDes")
+            # O último registo de cada deputado define o nome/partido (partido em falta mantém o anterior)
+            deputados[nome_norm] = (nome, partido or deputados.get(nome_norm, (None, None))[1])
+
+            atividades = entry.get("AtividadeDeputadoList") or []
+            for atividade in atividades:
+                for campo, tipo in ACTIVITY_MAPPING.items():
+                    itens = atividade.get(campo)
+                    if itens is None:
+                        continue
+                    if isinstance(itens, list):
+                        total = len(itens)
+                    elif isinstance(itens, dict):
+                        total = 1
+                    else:
+                        continue
+                    linhas[(nome_norm, tipo, legislatura)] = (total, _detalhes_limit(itens))
+        if not deputados:
             continue
-        partido = None
-        gp = deputado_meta.get("DepGP")
-        if isinstance(gp, list) and gp:
-            partido = gp[0].get("GpSigla")
-        legislatura = deputado_meta.get("LegDes")
-        deputado = _get_or_create_deputado(session, nome_norm, nome, partido)
-
-        atividades = entry.get("AtividadeDeputadoList") or []
-        for atividade in atividades:
-            for campo, tipo in ACTIVITY_MAPPING.items():
-                itens = atividade.get(campo)
-                if itens is None:
-                    continue
-                if isinstance(itens, list):
-                    total = len(itens)
-                elif isinstance(itens, dict):
-                    total = 1
-                else:
-                    continue
-                registro = (
-                    session.query(DeputadoAtividade)
-                    .filter_by(deputado_id=deputado.id, tipo=tipo, legislatura=legislatura)
-                    .first()
-                )
-                if registro is None:
-                    registro = DeputadoAtividade(
-                        deputado_id=deputado.id,
-                        tipo=tipo,
-                        legislatura=legislatura,
-                        total=total,
-                        detalhes=_detalhes_limit(itens),
-                    )
-                    session.add(registro)
-                else:
-                    registro.total = total
-                    registro.detalhes = _detalhes_limit(itens)
-
-
-def process_agenda(path: Path, session):
-    payload = json.loads(path.read_text())
-    for entry in payload:
-        externo_id = entry.get("Id")
-        if externo_id is None:
+
+        ids, novos, alterados = _resolver_deputados(session, deputados)
+        inseridas, atualizadas, inalteradas, com_alteracoes = _gravar_atividades(session, {
+            (ids[nome_norm], tipo, legislatura): valores
+            for (nome_norm, tipo, legislatura), valores in linhas.items()
+        }) if linhas else (0, 0, 0, set())
+        gravar_hashes(session, "atividade", hashes, ingestao_id)
+        stats["novos_deputados"] += novos
+        stats["inseridos"] += inseridas
+        stats["atualizados"] += atualizadas
+        stats["inalterados"] += inalteradas
+        afetados |= alterados | com_alteracoes
+
+    # Ficheiro sem alterações: a geração (e as caches) mantêm-se
+    if afetados:
+        atualizar_classificacoes(session, legislaturas_deputados(session, afetados))
+        nova_geracao(session, "atividade", afetados)
+    return stats
+
+
+def process_agenda(path: Path, session, ingestao_id: int | None = None) -> dict:
+    """
+    Ingere o ficheiro da Agenda lido em fluxo, com um upsert por lote dos eventos cujo
+    hash mudou desde a última carga.
+    Devolve as contagens (entradas, ignoradas, unidades_inalteradas, inseridos, atualizados, inalterados).
+    """
+    stats = dict.fromkeys(("entradas", "ignoradas", "unidades_inalteradas", "inseridos", "atualizados", "inalterados"), 0)
+    for lote in em_lotes(iterar_lista_json(path)):
+        stats["entradas"] += len(lote)
+        unidades = []
+        for entry in lote:
+            if entry.get("Id") is None:
+                stats["ignoradas"] += 1
+                continue
+            unidades.append((str(entry["Id"]), hash_valor(entry), entry))
+        alterar, hashes = _por_alterar(session, "agenda", unidades, stats)
+
+        eventos = {}
+        for entry in alterar:
+            externo_id = entry["Id"]
+            anterior = eventos.get(externo_id, {})
+            eventos[externo_id] = {
+                "titulo": entry.get("Title") or anterior.get("titulo"),
+                "tema": entry.get("Theme"),
+                "secao": entry.get("Section"),
+                "local": entry.get("Local"),
+                "organizacao": entry.get("OrgDes"),
+                "leg_des": entry.get("LegDes"),
+                "parlamentar_group": str(entry.get("ParlamentGroup")) if entry.get("ParlamentGroup") is not None else None,
+                "link": entry.get("Link"),
+                "texto": entry.get("InternetText"),
+                "inicio": build_datetime(entry.get("EventStartDate"), entry.get("EventStartTime")),
+                "fim": build_datetime(entry.get("EventEndDate"), entry.get("EventEndTime")),
+            }
+        if not eventos:
             continue
-        agenda = session.query(AgendaItem).filter_by(externo_id=externo_id).first()
-        if agenda is None:
-            agenda = AgendaItem(externo_id=externo_id)
-            session.add(agenda)
-        agenda.titulo = entry.get("Title") or agenda.titulo
-        agenda.tema = entry.get("Theme")
-        agenda.secao = entry.get("Section")
-        agenda.local = entry.get("Local")
-        agenda.organizacao = entry.get("OrgDes")
-        agenda.leg_des = entry.get("LegDes")
-        agenda.parlamentar_group = str(entry.get("ParlamentGroup")) if entry.get("ParlamentGroup") is not None else None
-        agenda.link = entry.get("Link")
-        agenda.texto = entry.get("InternetText")
-        agenda.inicio = build_datetime(entry.get("EventStartDate"), entry.get("EventStartTime"))
-        agenda.fim = build_datetime(entry.get("EventEndDate"), entry.get("EventEndTime"))
+        inseridos, atualizados, inalterados = _gravar_agenda(session, eventos)
+        gravar_hashes(session, "agenda", hashes, ingestao_id)
+        stats["inseridos"] += inseridos
+        stats["atualizados"] += atualizados
+        stats["inalterados"] += inalterados
+
+    if stats["inseridos"] or stats["atualizados"]:
+        nova_geracao(session, "agenda")
+    return stats
+
+
+def ingerir_ficheiro(path: Path, session, tipo: str, nome: str | None = None) -> dict:
+    """
+    Ingere um ficheiro "atividade" ou "agenda" com registo no histórico de ingestões.
+    Um ficheiro igual (hash) ao da última ingestão do mesmo tipo não é lido.
+    Devolve as contagens, com `ficheiro_inalterado` e `ingestao_id`.
+    """
+    hash_ficheiro = sha256_ficheiro(path)
+    anterior = ultima_ingestao(session, tipo)
+    ingestao = registar_ingestao(session, tipo, nome or path.name, hash_ficheiro, path.stat().st_size)
+    if anterior is not None and anterior.hash == hash_ficheiro:
+        stats = {"ficheiro_inalterado": True}
+        concluir_ingestao(session, ingestao, stats, unidades=anterior.unidades, alteradas=0)
+    else:
+        processar = process_atividade if tipo == "atividade" else process_agenda
+        stats = {"ficheiro_inalterado": False, **processar(path, session, ingestao.id)}
+        unidades = stats["entradas"] - stats["ignoradas"]
+        concluir_ingestao(session, ingestao, stats, unidades=unidades, alteradas=unidades - stats["unidades_inalteradas"])
+    return {**stats, "ingestao_id": ingestao.id}
 
 
 def main():
+    inicializar_bd()
     engine, SessionLocal = get_engine_and_session()
     session = SessionLocal()
     try:
         atividade_path = Path("uploads/AtividadeDeputadoXVII.json")
         if atividade_path.exists():
-            process_atividade(atividade_path, session)
+            ingerir_ficheiro(atividade_path, session, "atividade")
         agenda_path = Path("uploads/AgendaParlamentar.json")
         if agenda_path.exists():
-            process_agenda(agenda_path, session)
+            ingerir_ficheiro(agenda_path, session, "agenda")
         session.commit()
     finally:
         session.close()
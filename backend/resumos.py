@@ -0,0 +1,129 @@
+"""
+Tabelas de resumo (ResumoSessao / ResumoDeputado) mantidas na ingestão.
+
+As leituras (/deputados, /estatisticas/*, export_to_json.py) passam a consultar
+estas tabelas em vez de reagregar todas as linhas de Assiduidade.
+Reconstrução completa: `cd backend && python resumos.py`
+"""
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import (
+    Sessao,
+    Assiduidade,
+    ResumoSessao,
+    ResumoDeputado,
+    get_engine_and_session,
+    inicializar_bd,
+)
+from estatisticas import somas_por_estado
+
+CONTAGENS = (
+    "presencas",
+    "faltas_justificadas",
+    "missao_parlamentar_amp",
+    "faltas_penalizadoras",
+    "total_registos",
+)
+
+
+def _contagens():
+    return (*somas_por_estado(), func.count(Assiduidade.id).label("total_registos"))
+
+
+def somas_resumo_deputado():
+    """SUM de cada contagem de ResumoDeputado (agrupar por deputado, somando legislaturas)."""
+    return tuple(func.sum(getattr(ResumoDeputado, c)).label(c) for c in CONTAGENS)
+
+
+def aplicar_sessao(s, sessao, sinal: int = 1):
+    """
+    Soma (sinal=1) ou retira (sinal=-1) o contributo de uma sessão aos resumos.
+    Chamar depois de inserir as linhas da sessão, ou antes de as apagar.
+    """
+    por_deputado = (
+        s.query(Assiduidade.deputado_id, *_contagens())
+        .filter(Assiduidade.sessao_id == sessao.id)
+        .group_by(Assiduidade.deputado_id)
+        .all()
+    )
+
+    if sinal > 0:
+        totais = {c: sum(getattr(r, c) or 0 for r in por_deputado) for c in CONTAGENS}
+        s.execute(
+            insert(ResumoSessao.__table__)
+            .values(sessao_id=sessao.id, **totais)
+            .on_conflict_do_update(index_elements=["sessao_id"], set_=totais)
+        )
+    else:
+        s.query(ResumoSessao).filter_by(sessao_id=sessao.id).delete(synchronize_session=False)
+
+    if not por_deputado:
+        return
+
+    tabela = ResumoDeputado.__table__
+    stmt = insert(tabela)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["deputado_id", "legislatura"],
+        set_={c: tabela.c[c] + stmt.excluded[c] for c in CONTAGENS},
+    )
+    s.execute(stmt, [
+        {
+            "deputado_id": r.deputado_id,
+            "legislatura": sessao.legislatura,
+            **{c: sinal * (getattr(r, c) or 0) for c in CONTAGENS},
+        }
+        for r in por_deputado
+    ])
+
+
+def reconstruir_resumos(s):
+    """Regenera ambas as tabelas de resumo a partir das linhas de Assiduidade."""
+    s.query(ResumoSessao).delete(synchronize_session=False)
+    s.query(ResumoDeputado).delete(synchronize_session=False)
+
+    s.execute(
+        insert(ResumoSessao.__table__).from_select(
+            ["sessao_id", *CONTAGENS],
+            select(Sessao.id, *_contagens())
+            .outerjoin(Assiduidade, Assiduidade.sessao_id == Sessao.id)
+            .group_by(Sessao.id),
+        )
+    )
+    s.execute(
+        insert(ResumoDeputado.__table__).from_select(
+            ["deputado_id", "legislatura", *CONTAGENS],
+            select(Assiduidade.deputado_id, Sessao.legislatura, *_contagens())
+            .join(Sessao, Sessao.id == Assiduidade.sessao_id)
+            .group_by(Assiduidade.deputado_id, Sessao.legislatura),
+        )
+    )
+
+
+def reconstruir_se_vazio(s) -> bool:
+    """Preenche os resumos de uma BD anterior a estas tabelas. Devolve True se reconstruiu."""
+    if s.query(ResumoSessao.sessao_id).first() is not None:
+        return False
+    if s.query(Sessao.id).first() is None:
+        return False
+    reconstruir_resumos(s)
+    return True
+
+
+def main():
+    inicializar_bd()
+    engine, SessionLocal = get_engine_and_session()
+    session = SessionLocal()
+    try:
+        reconstruir_resumos(session)
+        session.commit()
+        print(
+            f"Resumos reconstruídos: {session.query(ResumoSessao).count()} sessões, "
+            f"{session.query(ResumoDeputado).count()} deputado×legislatura."
+        )
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
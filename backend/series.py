@@ -0,0 +1,205 @@
+"""
+Séries temporais de assiduidade (ResumoPeriodo) mantidas na ingestão.
+
+Contagens por estado somadas por período — dia, semana ISO, mês, legislatura e dia da
+semana — para cada partido (`mandatos.partido_linha`, o mesmo de /substituicoes) e para
+todos (""). Cada sessão soma ou retira o seu contributo aos seus períodos, como
+`resumos.aplicar_sessao`. Linhas sem partido contam no partido atual do deputado: quando
+este muda (`atualizar_deputados`) as sessões dessas linhas passam para o partido novo.
+A rota /estatisticas/series lê algumas centenas de linhas em vez das linhas de Assiduidade.
+Reconstrução completa: `cd backend && python series.py`
+"""
+from datetime import timedelta
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import (
+    Deputado,
+    Sessao,
+    Assiduidade,
+    ResumoPeriodo,
+    get_engine_and_session,
+    inicializar_bd,
+)
+from estatisticas import somas_por_estado
+from mandatos import partido_linha, atualizar_intervalos
+
+GRANULARIDADES = ("dia", "semana", "mes", "legislatura", "dia_semana")
+TODOS = ""
+CONTAGENS = (
+    "sessoes",
+    "presencas",
+    "faltas_justificadas",
+    "missao_parlamentar_amp",
+    "faltas_penalizadoras",
+    "total_registos",
+)
+
+
+def periodo(granularidade: str, data, legislatura: str) -> tuple:
+    """(chave, primeiro dia, último dia) do período que contém `data`; a legislatura fica sem limites."""
+    if granularidade == "dia":
+        return data.isoformat(), data, data
+    if granularidade == "semana":
+        ano, semana, dia = data.isocalendar()
+        inicio = data - timedelta(days=dia - 1)
+        return f"{ano}-W{semana:02d}", inicio, inicio + timedelta(days=6)
+    if granularidade == "mes":
+        inicio = data.replace(day=1)
+        return f"{data:%Y-%m}", inicio, (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    if granularidade == "legislatura":
+        return legislatura, None, None
+    return str(data.isoweekday()), None, None
+
+
+def contributos(s, sessao_ids=None) -> list:
+    """
+    Contagens por (sessão, partido) das sessões `sessao_ids` (todas, se None), com a data e a
+    legislatura da sessão. O partido é o de `mandatos.partido_linha`, como em /substituicoes.
+    """
+    partido = partido_linha().label("partido")
+    query = (
+        s.query(
+            Sessao.id, Sessao.data, Sessao.legislatura, partido,
+            *somas_por_estado(), func.count(Assiduidade.id).label("total_registos"),
+        )
+        .join(Assiduidade, Assiduidade.sessao_id == Sessao.id)
+        .join(Deputado, Deputado.id == Assiduidade.deputado_id)
+    )
+    if sessao_ids is not None:
+        query = query.filter(Sessao.id.in_(list(sessao_ids)))
+    return query.group_by(Sessao.id, partido).order_by(Sessao.id).all()
+
+
+def _acumular(linhas: dict, data, legislatura: str, por_partido, sinal: int):
+    """Soma o contributo de uma sessão ({partido: contagens}) às linhas {(granularidade, periodo, partido): linha}."""
+    grupos = {TODOS: dict.fromkeys(CONTAGENS, 0)}
+    for r in por_partido:
+        contagens = {c: getattr(r, c) or 0 for c in CONTAGENS[1:]}
+        grupos[r.partido] = {"sessoes": 1, **contagens}
+        for c, valor in contagens.items():
+            grupos[TODOS][c] += valor
+    grupos[TODOS]["sessoes"] = 1
+    for granularidade in GRANULARIDADES:
+        chave, inicio, fim = periodo(granularidade, data, legislatura)
+        for partido, contagens in grupos.items():
+            linha = linhas.setdefault((granularidade, chave, partido), {
+                "granularidade": granularidade, "periodo": chave, "partido": partido,
+                "inicio": inicio, "fim": fim, **dict.fromkeys(CONTAGENS, 0),
+            })
+            for c, valor in contagens.items():
+                linha[c] += sinal * valor
+
+
+def _limites_legislatura(s, legislatura: str, excluir_sessao_id=None):
+    """Atualiza o primeiro/último dia das linhas de uma legislatura a partir das sessões."""
+    query = s.query(func.min(Sessao.data), func.max(Sessao.data)).filter(Sessao.legislatura == legislatura)
+    if excluir_sessao_id is not None:
+        query = query.filter(Sessao.id != excluir_sessao_id)
+    inicio, fim = query.one()
+    s.query(ResumoPeriodo).filter_by(granularidade="legislatura", periodo=legislatura).update(
+        {"inicio": inicio, "fim": fim}, synchronize_session=False
+    )
+
+
+def aplicar_sessao_series(s, sessao, sinal: int = 1, por_partido=None):
+    """
+    Soma (sinal=1) ou retira (sinal=-1) o contributo de uma sessão às séries.
+    Chamar depois de inserir as linhas da sessão, ou antes de as apagar/alterar; `por_partido`
+    (linhas de `contributos` desta sessão) substitui a leitura das linhas atuais.
+    """
+    if por_partido is None:
+        por_partido = contributos(s, [sessao.id])
+    if not por_partido:
+        return
+    linhas = {}
+    _acumular(linhas, sessao.data, sessao.legislatura, por_partido, sinal)
+
+    stmt = insert(ResumoPeriodo.__table__)
+    tabela = ResumoPeriodo.__table__.c
+    s.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["granularidade", "periodo", "partido"],
+            set_={c: tabela[c] + stmt.excluded[c] for c in CONTAGENS},
+        ),
+        list(linhas.values()),
+    )
+    if sinal < 0:
+        # Períodos sem sessões deixam de existir
+        s.query(ResumoPeriodo).filter(
+            ResumoPeriodo.sessoes <= 0,
+            ResumoPeriodo.periodo.in_({chave for _, chave, _ in linhas}),
+        ).delete(synchronize_session=False)
+    _limites_legislatura(s, sessao.legislatura, sessao.id if sinal < 0 else None)
+
+
+def atualizar_deputados(s, atualizar: list[dict]):
+    """
+    UPDATE em lote de Deputado ([{id, nome_original_ultimo, partido_atual}]). Se o partido
+    atual de um deputado com linhas sem partido mudar, essas sessões mudam de partido nas
+    séries e os intervalos do deputado são recalculados.
+    """
+    ids = [a["id"] for a in atualizar]
+    anteriores = dict(s.query(Deputado.id, Deputado.partido_atual).filter(Deputado.id.in_(ids))) if ids else {}
+    mudam = [a["id"] for a in atualizar if a["partido_atual"] != anteriores.get(a["id"])]
+    sem_partido = {}
+    if mudam:
+        for dep_id, sessao_id in (
+            s.query(Assiduidade.deputado_id, Assiduidade.sessao_id)
+            .filter(Assiduidade.deputado_id.in_(mudam), or_(Assiduidade.partido.is_(None), Assiduidade.partido == ""))
+        ):
+            sem_partido.setdefault(sessao_id, set()).add(dep_id)
+    antes = {}
+    for r in contributos(s, sem_partido) if sem_partido else ():
+        antes.setdefault(r.id, []).append(r)
+
+    if atualizar:
+        s.execute(update(Deputado), atualizar)
+    if not sem_partido:
+        return
+    for sessao in s.query(Sessao).filter(Sessao.id.in_(list(sem_partido))):
+        aplicar_sessao_series(s, sessao, sinal=-1, por_partido=antes[sessao.id])
+        aplicar_sessao_series(s, sessao)
+    atualizar_intervalos(s, set().union(*sem_partido.values()))
+
+
+def reconstruir_series(s):
+    """Regenera todas as séries num só agregado por (sessão, partido)."""
+    s.query(ResumoPeriodo).delete(synchronize_session=False)
+    linhas = {}
+    por_sessao = {}
+    for r in contributos(s):
+        por_sessao.setdefault((r.id, r.data, r.legislatura), []).append(r)
+    for (_, data, legislatura), por_partido in por_sessao.items():
+        _acumular(linhas, data, legislatura, por_partido, 1)
+    if linhas:
+        s.execute(insert(ResumoPeriodo.__table__), list(linhas.values()))
+    for (legislatura,) in s.query(Sessao.legislatura).distinct():
+        _limites_legislatura(s, legislatura)
+
+
+def reconstruir_series_se_vazio(s) -> bool:
+    """Preenche as séries de uma BD anterior a esta tabela. Devolve True se reconstruiu."""
+    if s.query(ResumoPeriodo.periodo).first() is not None:
+        return False
+    if s.query(Assiduidade.id).first() is None:
+        return False
+    reconstruir_series(s)
+    return True
+
+
+def main():
+    inicializar_bd()
+    engine, SessionLocal = get_engine_and_session()
+    session = SessionLocal()
+    try:
+        reconstruir_series(session)
+        session.commit()
+        print(f"Séries reconstruídas: {session.query(ResumoPeriodo).count()} períodos × partido.")
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
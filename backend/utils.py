@@ -2,6 +2,8 @@ import unicodedata
 import re
 import math
 
+import pandas as pd
+
 COLS_ESPERADAS = [
     "LEGISLATURA", "DATA", "NUMERO", "SESSAO", "ID_LEGIS_SESSAO",
     "DEPUTADO", "PARTIDO", "ASSIDUIDADE", "MOTIVO"
@@ -25,6 +27,17 @@ MOTIVOS_VALIDOS = {
     # Evita duplicações semânticas como "trabalho parlamentar" se já tens "missao ou trabalho parlamentar"
 }
 
+# Código compacto por estado de assiduidade: prefixo do texto oficial → código.
+# A ordem importa (primeiro prefixo que corresponde). Estados fora da lista → CODIGO_OUTRO.
+CODIGOS_ESTADO = [
+    ("Presença", "P"),
+    ("Falta Justificada", "FJ"),
+    ("Ausência em Missão Parlamentar", "AMP"),
+    ("Falta ao Quórum de Votação", "FQV"),
+    ("Falta Injustificada", "FI"),
+]
+CODIGO_OUTRO = "OUT"
+
 def _is_nan_like(valor) -> bool:
     """Deteta NaN do pandas e literais 'nan'/'NaN' como vazio."""
     if valor is None:
@@ -63,6 +76,14 @@ def normalizar_nome(nome: str) -> str:
     nome = " ".join(nome.split()).lower()
     return nome
 
+def codigo_estado(status: str) -> str:
+    """Deriva o código compacto (P, FJ, AMP, FQV, FI, OUT) do texto do estado."""
+    status = limpar_campo(status).lower()
+    for prefixo, codigo in CODIGOS_ESTADO:
+        if status.startswith(prefixo.lower()):
+            return codigo
+    return CODIGO_OUTRO
+
 def validar_colunas(df) -> list[str]:
     return [c for c in COLS_ESPERADAS if c not in df.columns]
 
@@ -98,3 +119,43 @@ def motivo_valido(motivo: str) -> bool:
         if motivo_norm.startswith(m):
             return True
     return False
+
+# --- Versões vetorizadas (pandas .str) para colunas inteiras ---
+# Produzem exatamente o mesmo resultado que aplicar as funções acima célula a célula.
+
+_NAN_LITERAIS = ["nan", "na", "none", ""]
+
+def limpar_coluna(serie):
+    """Equivalente vetorizado de `limpar_campo` para uma Series."""
+    serie = serie.fillna("").astype(str)
+    vazio = serie.str.strip().str.lower().isin(_NAN_LITERAIS)
+    serie = serie.str.strip()
+    aspas = (serie.str.len() >= 2) & serie.str.startswith('"') & serie.str.endswith('"')
+    serie = serie.mask(aspas, serie.str[1:-1])
+    serie = serie.str.replace(r"\s+", " ", regex=True)
+    return serie.mask(vazio, "")
+
+def normalizar_coluna(serie):
+    """Equivalente vetorizado de `normalizar_nome` para uma Series."""
+    serie = limpar_coluna(serie)
+    serie = serie.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("utf-8")
+    return serie.str.split().str.join(" ").str.lower()
+
+def mascara_necessita_motivo(status, include_amp: bool = False):
+    """Máscara booleana equivalente a `necessita_motivo` aplicada a cada linha."""
+    status = limpar_coluna(status)
+    return ~status.str.startswith("Presença") & status.isin(estados_que_exigem_motivo(include_amp))
+
+def mascara_motivo_valido(motivo):
+    """Máscara booleana equivalente a `motivo_valido` aplicada a cada linha."""
+    motivo_norm = normalizar_coluna(motivo)
+    return (motivo_norm != "") & motivo_norm.str.startswith(tuple(MOTIVOS_VALIDOS))
+
+def codigo_estado_coluna(status):
+    """Equivalente vetorizado de `codigo_estado` para uma Series."""
+    status = limpar_coluna(status).str.lower()
+    codigos = pd.Series(CODIGO_OUTRO, index=status.index, dtype=object)
+    # Percorrer ao contrário para que o primeiro prefixo da lista prevaleça
+    for prefixo, codigo in reversed(CODIGOS_ESTADO):
+        codigos = codigos.mask(status.str.startswith(prefixo.lower()), codigo)
+    return codigos
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark das estatísticas por sessão (/estatisticas/sessoes e /estatisticas/analise-avancada).
+Compara o padrão antigo (N+1: várias COUNT por sessão) com o agregado único
+`estatisticas.agregados_por_sessao` (tabela ResumoSessao), e a série mensal por partido
+calculada das linhas de Assiduidade com a lida de ResumoPeriodo (/estatisticas/series),
+numa BD SQLite sintética temporária.
+
+Uso: python3 benchmark_estatisticas.py [n_sessoes ...]   (por omissão: 500 2000)
+"""
+
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+# Adicionar backend ao path
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Deputado, Sessao, Assiduidade, ResumoPeriodo
+from estatisticas import agregados_por_sessao, resumo_sessoes, resumo_periodos, resumo_analise_avancada, sessoes_por_dia_semana, somas_por_estado
+from resumos import reconstruir_resumos
+from series import reconstruir_series
+from utils import codigo_estado
+
+DEPUTADOS = 230
+ESTADOS = [
+    ("Presença (P)", 0.92),
+    ("Falta Justificada (FJ)", 0.03),
+    ("Ausência em Missão Parlamentar (AMP)", 0.03),
+    ("Falta ao Quórum de Votação", 0.02),
+]
+
+
+def popular(engine, n_sessoes: int):
+    """Cria `n_sessoes` sessões com 230 registos de assiduidade cada."""
+    rnd = random.Random(42)
+    estados = [e for e, _ in ESTADOS]
+    pesos = [p for _, p in ESTADOS]
+    with engine.begin() as conn:
+        conn.execute(insert(Deputado), [
+            {"id": i, "nome_normalizado": f"deputado {i}", "nome_original_ultimo": f"Deputado {i}", "partido_atual": "P"}
+            for i in range(1, DEPUTADOS + 1)
+        ])
+        inicio = date(2015, 1, 5)
+        conn.execute(insert(Sessao), [
+            {"id": k, "id_legis_sessao": f"S_{k}", "legislatura": "XVII", "numero": str(k),
+             "tipo": "ORDINÁRIA", "data": inicio + timedelta(days=k)}
+            for k in range(1, n_sessoes + 1)
+        ])
+        for k in range(1, n_sessoes + 1):
+            conn.execute(insert(Assiduidade), [
+                {"sessao_id": k, "deputado_id": d, "partido": "P", "status": status, "codigo": codigo_estado(status), "motivo": ""}
+                for d, status in zip(range(1, DEPUTADOS + 1), rnd.choices(estados, pesos, k=DEPUTADOS))
+            ])
+
+
+def legado(s):
+    """Padrão anterior: 5 COUNT por sessão (estatisticas/sessoes) + 3 (analise-avancada)."""
+    for sess in s.query(Sessao).order_by(Sessao.data.asc()).all():
+        s.query(Assiduidade).filter(Assiduidade.sessao_id == sess.id).count()
+        for padrao in ("Presença%", "Falta ao Quórum de Votação%", "Falta Justificada%", "Ausência em Missão Parlamentar%"):
+            s.query(func.count(Assiduidade.id)).filter(
+                Assiduidade.sessao_id == sess.id, Assiduidade.status.like(padrao)
+            ).scalar()
+    for sess in s.query(Sessao).order_by(Sessao.data.asc()).all():
+        for padrao in ("Falta ao Quórum de Votação%", "Presença%"):
+            s.query(func.count(Assiduidade.id)).filter(
+                Assiduidade.sessao_id == sess.id, Assiduidade.status.like(padrao)
+            ).scalar()
+        s.query(Assiduidade).filter(Assiduidade.sessao_id == sess.id).count()
+
+
+def agregado(s):
+    """Padrão atual: um agregado partilhado pelos dois endpoints."""
+    resumo_sessoes(agregados_por_sessao(s))
+    faltas_por_dia = {
+        int(r.periodo): r.faltas_penalizadoras
+        for r in s.query(ResumoPeriodo).filter_by(granularidade="dia_semana", partido="")
+    }
+    resumo_analise_avancada(agregados_por_sessao(s), 200.0, faltas_por_dia, sessoes_por_dia_semana(s))
+
+
+def mensal_linhas(s):
+    """Série mensal por partido reagregando todas as linhas de Assiduidade."""
+    mes = func.strftime("%Y-%m", Sessao.data)
+    s.query(mes, Assiduidade.partido, *somas_por_estado()).join(Sessao, Sessao.id == Assiduidade.sessao_id).group_by(
+        mes, Assiduidade.partido
+    ).all()
+
+
+def mensal_series(s):
+    """Série mensal por partido lida de ResumoPeriodo."""
+    resumo_periodos(s.query(ResumoPeriodo).filter_by(granularidade="mes", partido="P").order_by(ResumoPeriodo.inicio).all())
+
+
+def medir(engine, fn) -> tuple[int, float]:
+    contador = {"queries": 0}
+
+    def contar(*_):
+        contador["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", contar)
+    s = sessionmaker(bind=engine)()
+    try:
+        t0 = time.perf_counter()
+        fn(s)
+        ms = (time.perf_counter() - t0) * 1000
+    finally:
+        s.close()
+        event.remove(engine, "before_cursor_execute", contar)
+    return contador["queries"], ms
+
+
+def main():
+    tamanhos = [int(x) for x in sys.argv[1:]] or [500, 2000]
+    print(f"{'sessões':>8} | {'modo':<11} | {'queries':>8} | {'ms':>10}")
+    print("-" * 47)
+    for n in tamanhos:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+            Base.metadata.create_all(engine)
+            popular(engine, n)
+            s = sessionmaker(bind=engine)()
+            reconstruir_resumos(s)
+            reconstruir_series(s)
+            s.commit()
+            s.close()
+            for nome, fn in (("legado", legado), ("agregado", agregado), ("mês/linhas", mensal_linhas), ("mês/séries", mensal_series)):
+                queries, ms = medir(engine, fn)
+                print(f"{n:>8} | {nome:<11} | {queries:>8} | {ms:>10.1f}")
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark do export estático (`export_to_json.exportar`) numa BD SQLite sintética temporária:
+export completo, repetição sem alterações e export incremental depois de uma nova sessão.
+No fim indica o pico de memória (RSS) do processo.
+
+Uso: python3 benchmark_export.py [n_sessoes]   (por omissão: 4000, ~10 legislaturas)
+"""
+
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+
+def nova_sessao(session, n_sessoes: int):
+    """Ingere uma sessão a seguir às sintéticas, com os 230 deputados."""
+    from ingestao import ingerir_sessao
+    from benchmark_estatisticas import DEPUTADOS
+
+    registos = [
+        {"deputado_normalizado": f"deputado {i}", "deputado_original": f"Deputado {i}", "partido": "P",
+         "status": "Presença (P)", "codigo": "P", "motivo": ""}
+        for i in range(1, DEPUTADOS + 1)
+    ]
+    ingerir_sessao(session, {
+        "id_legis_sessao": f"S_{n_sessoes + 1}", "legislatura": "XVII", "numero": n_sessoes + 1,
+        "tipo": "ORDINÁRIA", "data": date(2015, 1, 5) + timedelta(days=n_sessoes + 1),
+    }, registos)
+    session.commit()
+
+
+def main():
+    n_sessoes = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ASSIDUIDADE_DB_URL"] = f"sqlite:///{Path(tmp) / 'export.db'}"
+        output_dir = Path(tmp) / 'data'
+
+        from models import get_engine_and_session, inicializar_bd
+        from resumos import reconstruir_resumos
+        from mandatos import reconstruir_intervalos
+        from cache import nova_geracao
+        from benchmark_estatisticas import popular
+        from verificar_planos import popular_atividade_agenda
+        from export_to_json import exportar
+
+        inicializar_bd()
+        engine, SessionLocal = get_engine_and_session()
+        print(f"🏗️  A criar BD sintética ({n_sessoes} sessões × 230 deputados)...")
+        popular(engine, n_sessoes)
+        popular_atividade_agenda(engine, n_sessoes)
+        session = SessionLocal()
+        reconstruir_resumos(session)
+        reconstruir_intervalos(session)
+        nova_geracao(session, "assiduidade")
+        session.commit()
+
+        medicoes = []
+        for nome, passo in (
+            ("completo", lambda: exportar(output_dir, completo=True, compacto=True)),
+            ("sem alterações", lambda: exportar(output_dir, compacto=True)),
+            ("nova sessão", lambda: (nova_sessao(session, n_sessoes), exportar(output_dir, compacto=True))),
+        ):
+            print(f"\n⏱️  Export {nome}")
+            t0 = time.perf_counter()
+            passo()
+            medicoes.append((nome, (time.perf_counter() - t0) * 1000))
+        session.close()
+
+    print()
+    for nome, ms in medicoes:
+        print(f"{nome:<16} {ms:>10.0f} ms")
+    # ru_maxrss vem em KB no Linux
+    print(f"{'pico de memória':<16} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:>10.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,44 @@
 const CONFIG = {
   mode: 'api', // Modo API para desenvolvimento local
   apiUrl: 'http://127.0.0.1:5001',
-  dataPath: 'data/' // Caminho relativo para os JSON
+  dataPath: 'data/', // Caminho relativo para os JSON
+  // Formato dos JSON estáticos: 'colunar' (<nome>.col.json, export_to_json.py --compacto) ou 'json'
+  // (sem o .col.json, p.ex. export sem --compacto, é lido o <nome>.json)
+  formato: 'colunar'
 };
 
+// Reconstrói a lista de objetos original a partir do formato colunar
+// ({ colunas: {nome: [...]}, dicionarios: {nome: [valores]} } → { ok, [chave]: [{...}] })
+function descodificarColunar(dados) {
+  const nomes = Object.keys(dados.colunas);
+  const colunas = nomes.map(nome => dados.colunas[nome]);
+  const dicionarios = nomes.map(nome => dados.dicionarios[nome]);
+  const linhas = new Array(dados.linhas);
+  for (let i = 0; i < dados.linhas; i++) {
+    const linha = {};
+    for (let c = 0; c < nomes.length; c++) {
+      const valor = colunas[c][i];
+      linha[nomes[c]] = dicionarios[c] ? dicionarios[c][valor] : valor;
+    }
+    linhas[i] = linha;
+  }
+  return { ok: dados.ok, [dados.chave]: linhas };
+}
+
+// Índice nome → id dos ficheiros de detalhes (carregado uma vez por página)
+let indiceDeputadosPromise = null;
+function carregarIndiceDeputados() {
+  if (!indiceDeputadosPromise) {
+    indiceDeputadosPromise = fetch(`${CONFIG.dataPath}deputados_indice.json`)
+      .then(response => response.json())
+      .catch(erro => {
+        indiceDeputadosPromise = null;
+        throw erro;
+      });
+  }
+  return indiceDeputadosPromise;
+}
+
 // Função helper para fazer fetch da fonte correta
 async function fetchData(endpoint) {
   if (CONFIG.mode === 'static') {
@@ -20,14 +55,16 @@ async function fetchData(endpoint) {
       '/substituicoes': 'substituicoes.json'
     };
     
-    // Lidar com endpoint dinâmico de detalhes de deputado
+    // Lidar com endpoint dinâmico de detalhes de deputado:
+    // índice nome → id e depois só o ficheiro desse deputado (data/deputados/<id>.json)
     if (endpoint.startsWith('/deputados/') && endpoint.endsWith('/detalhes')) {
-      const nomeDeputado = endpoint.split('/')[2]; // Extrair nome do deputado
-      const response = await fetch(`${CONFIG.dataPath}deputados_detalhes.json`);
-      const allData = await response.json();
+      const nomeDeputado = decodeURIComponent(endpoint.split('/')[2]); // Extrair nome do deputado
+      const indice = await carregarIndiceDeputados();
+      const id = indice.ok ? indice.deputados[nomeDeputado] : undefined;
       
-      if (allData.ok && allData.deputados_detalhes[nomeDeputado]) {
-        return { ok: true, ...allData.deputados_detalhes[nomeDeputado] };
+      if (id !== undefined) {
+        const response = await fetch(`${CONFIG.dataPath}deputados/${id}.json`);
+        return response.json();
       } else {
         return { ok: false, mensagem: "Deputado não encontrado" };
       }
@@ -39,6 +76,15 @@ async function fetchData(endpoint) {
       return { ok: false };
     }
     
+    if (CONFIG.formato === 'colunar') {
+      const response = await fetch(`${CONFIG.dataPath}${jsonFile.replace(/\.json$/, '.col.json')}`);
+      if (response.ok) {
+        return descodificarColunar(await response.json());
+      }
+      // Export sem --compacto: não há .col.json, usar o JSON normal
+      console.warn(`${jsonFile}: versão colunar indisponível (HTTP ${response.status}), a usar o JSON`);
+    }
+    
     const response = await fetch(`${CONFIG.dataPath}${jsonFile}`);
     return response.json();
   } else {
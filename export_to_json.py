@@ -2,65 +2,197 @@
 """
 Script para exportar dados da base de dados SQLite para JSON estáticos
 para uso no GitHub Pages (sem backend)
+
+Export incremental: `data/.export_estado.json` guarda a geração exportada e o hash
+de cada ficheiro. Só se recalculam os conjuntos (e os deputados) alterados desde então
+e só se reescrevem ficheiros cujo conteúdo mudou. `--completo` força o export total.
+
+`--compacto` escreve também a versão colunar de cada conjunto tabular (`<nome>.col.json`,
+minificada, strings repetidas codificadas por dicionário) e as cópias pré-comprimidas
+`.gz` (e `.br`, se o pacote `brotli` estiver instalado). `config.js` descodifica-a.
 """
 
+import gzip
+import hashlib
 import json
 import sys
 import os
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 
 # Adicionar backend ao path
 sys.path.insert(0, str(Path(__file__).parent / 'backend'))
 
-from models import get_engine_and_session, Deputado, Sessao, Assiduidade, DeputadoAtividade, AgendaItem
-from sqlalchemy import func
+from sqlalchemy import select
+
+from models import get_engine_and_session, inicializar_bd, Deputado, DeputadoAtividade, AgendaItem, ResumoDeputado, EstadoDados
+from resumos import somas_resumo_deputado, reconstruir_se_vazio
+from mandatos import movimentos, reconstruir_intervalos_se_vazio
+from estatisticas import agregados_por_sessao
+from cache import ESTADO_ID
+from fluxo_json import escrever_json, LOTE_LINHAS
+
+try:  # Compressão brotli é opcional (pip install brotli)
+    import brotli
+except ImportError:
+    brotli = None
+
+ESTADO_EXPORT = '.export_estado.json'
+# Detalhes sessão-a-sessão: um ficheiro por deputado (data/deputados/<id>.json) + índice nome → id
+DIR_DETALHES = 'deputados'
+INDICE_DETALHES = 'deputados_indice.json'
+# Ficheiro único anterior aos ficheiros por deputado (removido no export)
+LEGADO_DETALHES = 'deputados_detalhes.json'
+
+# Threads para serializar/comprimir/escrever ficheiros
+TRABALHADORES = int(os.environ.get('ASSIDUIDADE_EXPORT_TRABALHADORES', min(8, os.cpu_count() or 1)))
 
-def exportar_deputados(session):
-    """Exporta dados de deputados com métricas de assiduidade"""
-    print("📊 Exportando deputados...")
+# Conjuntos tabulares com versão colunar (--compacto): ficheiro → chave da lista
+COLUNARES = {
+    'deputados.json': 'deputados',
+    'sessoes.json': 'sessoes',
+    'estatisticas_sessoes.json': 'sessoes',
+    'atividades.json': 'atividades',
+    'agenda.json': 'agenda',
+    'substituicoes.json': 'substituicoes',
+}
+
+# Tipos de dados (EstadoDados.geracao_<tipo>) de que cada ficheiro depende
+DEPENDENCIAS = {
+    'sessoes.json': ('assiduidade',),
+    'estatisticas_sessoes.json': ('assiduidade',),
+    # Nome/partido do deputado vêm de ambas as ingestões
+    'atividades.json': ('atividade', 'assiduidade'),
+    'agenda.json': ('agenda',),
+    'substituicoes.json': ('assiduidade',),
+}
+
+class Instantaneo:
+    """
+    Dados lidos uma só vez, numa única transação de leitura (snapshot consistente:
+    uma ingestão concorrente não fica meio exportada). Cada tabela é carregada na
+    primeira utilização, para o export incremental só ler o que precisa.
+    Todos os conjuntos derivados são calculados a partir destas estruturas.
+    """
     
-    deputados = session.query(Deputado).all()
-    resultado = []
+    def __init__(self, session):
+        self.session = session
+        conexao = session.connection()
+        # pysqlite só abre transação antes de escritas: BEGIN explícito fixa o snapshot (WAL)
+        if not conexao.connection.driver_connection.in_transaction:
+            conexao.exec_driver_sql("BEGIN")
+        self.estado = session.get(EstadoDados, ESTADO_ID)
+    
+    @cached_property
+    def deputados(self) -> dict:
+        """{id: (nome, partido)}"""
+        return {
+            dep_id: (nome, partido)
+            for dep_id, nome, partido in self.session.execute(
+                select(Deputado.id, Deputado.nome_original_ultimo, Deputado.partido_atual)
+            )
+        }
     
-    for dep in deputados:
-        # Calcular métricas
-        assiduidades = session.query(Assiduidade).filter(
-            Assiduidade.deputado_id == dep.id
+    @cached_property
+    def sessoes(self) -> list:
+        """Sessões com os agregados de ResumoSessao, por data."""
+        return agregados_por_sessao(self.session)
+    
+    @cached_property
+    def sessoes_por_id(self) -> dict:
+        """{id: (ordem, campos do detalhe)}; ordem 0 = sessão mais recente."""
+        recentes = sorted(self.sessoes, key=lambda s: (s.data, s.id), reverse=True)
+        return {
+            s.id: (ordem, s.data.isoformat(), s.id_legis_sessao, s.tipo, s.legislatura, s.numero)
+            for ordem, s in enumerate(recentes)
+        }
+    
+    def alterados_desde(self, geracao: int) -> set:
+        """Deputados marcados pela ingestão depois de `geracao`."""
+        return set(self.session.scalars(
+            select(Deputado.id).where(Deputado.geracao_alteracao > geracao)
+        ))
+    
+    def resumo_deputados(self, ids=None) -> list:
+        query = select(ResumoDeputado.deputado_id, *somas_resumo_deputado())
+        if ids is not None:
+            query = query.where(ResumoDeputado.deputado_id.in_(ids))
+        return self.session.execute(
+            query.group_by(ResumoDeputado.deputado_id).order_by(ResumoDeputado.deputado_id)
         ).all()
+    
+    def assiduidade(self, ids=None):
+        """
+        Gera (deputado_id, [(sessao_id, status, motivo, partido), ...]) um deputado de cada vez,
+        lendo o cursor por ordem de deputado (índice ix_assiduidade_deputado_sessao):
+        a memória fica limitada ao histórico de um deputado.
+        """
+        sql = "SELECT deputado_id, sessao_id, status, motivo, partido FROM assiduidade"
+        params = ()
+        if ids is not None:
+            params = tuple(ids)
+            sql += f" WHERE deputado_id IN ({', '.join('?' * len(params))})"
+        sql += " ORDER BY deputado_id"
+        # Cursor do sqlite3 (tuplos): com ~1M linhas, construir Row do SQLAlchemy custa mais do que a query
+        cursor = self.session.connection().connection.driver_connection.execute(sql, params)
+        for dep_id, linhas in groupby(cursor, key=itemgetter(0)):
+            yield dep_id, [linha[1:] for linha in linhas]
+    
+    def atividades(self):
+        """Atividades por id, lidas do cursor em lotes (yield_per)."""
+        return self.session.execute(
+            select(
+                DeputadoAtividade.id, DeputadoAtividade.deputado_id, DeputadoAtividade.tipo,
+                DeputadoAtividade.legislatura, DeputadoAtividade.total,
+                DeputadoAtividade.ultima_data, DeputadoAtividade.detalhes,
+            ).order_by(DeputadoAtividade.id).execution_options(yield_per=LOTE_LINHAS)
+        )
+    
+    @cached_property
+    def agenda(self) -> list:
+        # Limitar aos últimos 100 itens
+        return self.session.execute(
+            select(AgendaItem.id, AgendaItem.inicio, AgendaItem.fim, AgendaItem.titulo, AgendaItem.link)
+            .order_by(AgendaItem.inicio.desc()).limit(100)
+        ).all()
+
+def exportar_deputados(dados, ids=None):
+    """Exporta dados de deputados com métricas de assiduidade (só `ids`, se indicados)"""
+    resultado = []
+    # Métricas lidas da tabela de resumo (mesma classificação que a API)
+    for dep in dados.resumo_deputados(ids):
+        # IMPORTANTE: Só exportar deputados que têm pelo menos 1 registo de assiduidade
+        if not dep.total_registos or dep.deputado_id not in dados.deputados:
+            continue
         
-        # Usar comparação parcial para status (pode ser "P" ou "Presença (P)")
-        presencas = sum(1 for a in assiduidades if 'P)' in a.status or a.status == 'Presença (P)')
-        faltas_penalizadoras = sum(1 for a in assiduidades if 'Quórum' in a.status or a.status == 'Falta ao Quórum de Votação')
-        faltas_justificadas = sum(1 for a in assiduidades if 'FJ)' in a.status or a.status == 'Falta Justificada (FJ)')
-        missao_parlamentar = sum(1 for a in assiduidades if 'AMP)' in a.status or a.status == 'Ausência em Missão Parlamentar (AMP)')
-        
-        total_base = presencas + faltas_penalizadoras
-        assiduidade_pct = round((presencas / total_base * 100), 2) if total_base > 0 else 0
+        nome, partido = dados.deputados[dep.deputado_id]
+        total_base = dep.presencas + dep.faltas_penalizadoras
+        assiduidade_pct = round((dep.presencas / total_base * 100), 2) if total_base > 0 else 0
         
-        # IMPORTANTE: Só exportar deputados que têm pelo menos 1 registo de assiduidade
-        if len(assiduidades) > 0:
-            resultado.append({
-                'id': dep.id,
-                'nome': dep.nome_original_ultimo,
-                'partido': dep.partido_atual,
-                'presencas': presencas,
-                'faltas_justificadas': faltas_justificadas,
-                'missao_parlamentar_amp': missao_parlamentar,
-                'faltas_penalizadoras': faltas_penalizadoras,
-                'assiduidade_pct': assiduidade_pct
-            })
-    
-    print(f"   ✅ {len(resultado)} deputados com registos de assiduidade")
+        resultado.append({
+            'id': dep.deputado_id,
+            'nome': nome,
+            'partido': partido,
+            'presencas': dep.presencas,
+            'faltas_justificadas': dep.faltas_justificadas,
+            'missao_parlamentar_amp': dep.missao_parlamentar_amp,
+            'faltas_penalizadoras': dep.faltas_penalizadoras,
+            'assiduidade_pct': assiduidade_pct
+        })
+    
     return {'ok': True, 'deputados': resultado}
 
-def exportar_sessoes(session):
+def exportar_sessoes(dados):
     """Exporta dados de sessões"""
-    print("📅 Exportando sessões...")
-    
-    sessoes = session.query(Sessao).all()
     resultado = []
     
-    for s in sessoes:
+    for s in sorted(dados.sessoes, key=lambda s: s.id):
         resultado.append({
             'id': s.id,
             'legislatura': s.legislatura,
@@ -72,20 +204,12 @@ def exportar_sessoes(session):
     
     return {'ok': True, 'sessoes': resultado}
 
-def exportar_estatisticas_sessoes(session):
+def exportar_estatisticas_sessoes(dados):
     """Exporta estatísticas agregadas por sessão"""
-    print("📈 Exportando estatísticas de sessões...")
-    
-    sessoes = session.query(Sessao).all()
     resultado = []
-    
-    for s in sessoes:
-        assiduidades = session.query(Assiduidade).filter(
-            Assiduidade.sessao_id == s.id
-        ).all()
-        
-        presencas = sum(1 for a in assiduidades if 'P)' in a.status or a.status == 'Presença (P)')
-        faltas_penalizadoras = sum(1 for a in assiduidades if 'Quórum' in a.status)
+    for s in dados.sessoes:
+        presencas = s.presencas or 0
+        faltas_penalizadoras = s.faltas_penalizadoras or 0
         
         total_base = presencas + faltas_penalizadoras
         assiduidade_pct = round((presencas / total_base * 100), 2) if total_base > 0 else 0
@@ -103,39 +227,30 @@ def exportar_estatisticas_sessoes(session):
     
     return {'ok': True, 'sessoes': resultado}
 
-def exportar_atividades(session):
-    """Exporta atividades parlamentares"""
-    print("🗂️ Exportando atividades...")
-    
-    atividades = session.query(DeputadoAtividade).all()
-    resultado = []
-    
-    for ativ in atividades:
-        deputado = session.query(Deputado).filter(Deputado.id == ativ.deputado_id).first()
-        
-        resultado.append({
+def exportar_atividades(dados):
+    """Exporta atividades parlamentares (lista gerada em fluxo a partir do cursor)"""
+    atividades = (
+        {
             'id': ativ.id,
             'deputado_id': ativ.deputado_id,
-            'deputado_nome': deputado.nome_original_ultimo if deputado else None,
-            'partido': deputado.partido_atual if deputado else None,
+            'deputado_nome': dados.deputados.get(ativ.deputado_id, (None, None))[0],
+            'partido': dados.deputados.get(ativ.deputado_id, (None, None))[1],
             'tipo': ativ.tipo,
             'legislatura': ativ.legislatura,
             'total': ativ.total,
             'ultima_data': ativ.ultima_data.isoformat() if ativ.ultima_data else None,
             'detalhes': ativ.detalhes
-        })
+        }
+        for ativ in dados.atividades()
+    )
     
-    return {'ok': True, 'atividades': resultado}
+    return {'ok': True, 'atividades': atividades}
 
-def exportar_agenda(session):
+def exportar_agenda(dados):
     """Exporta agenda parlamentar"""
-    print("📆 Exportando agenda...")
-    
-    # Limitar aos últimos 100 itens
-    agenda = session.query(AgendaItem).order_by(AgendaItem.inicio.desc()).limit(100).all()
     resultado = []
     
-    for item in agenda:
+    for item in dados.agenda:
         resultado.append({
             'id': item.id,
             'inicio': item.inicio.isoformat() if item.inicio else None,
@@ -146,93 +261,391 @@ def exportar_agenda(session):
     
     return {'ok': True, 'agenda': resultado}
 
-def exportar_detalhes_deputados(session):
-    """Exporta detalhes sessão-a-sessão de todos os deputados"""
-    print("📋 Exportando detalhes dos deputados...")
+@lru_cache(maxsize=None)
+def _json(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False)
+
+def detalhes_por_deputado(dados, ids=None):
+    """
+    Detalhes sessão-a-sessão (só `ids`, se indicados), mais recentes primeiro.
+    Gera (deputado_id, nome, JSON compacto do ficheiro), um deputado de cada vez,
+    apenas para deputados com registos.
     
-    deputados = session.query(Deputado).all()
-    resultado = {}
+    O JSON é montado por fragmentos: a parte da sessão é serializada uma vez por sessão
+    (e não uma vez por deputado) e status/motivo/partido, muito repetidos, ficam em cache.
+    O resultado é idêntico a `serializar` do dicionário {ok, deputado, total_sessoes, detalhes}.
+    """
+    fragmentos = {
+        sessao_id: (ordem, '{"data":%s,"id_legis_sessao":%s,"tipo":%s,"legislatura":%s,"numero":%s,' % (
+            _json(data), _json(id_legis_sessao), _json(tipo), _json(legislatura), _json(numero)
+        ))
+        for sessao_id, (ordem, data, id_legis_sessao, tipo, legislatura, numero) in dados.sessoes_por_id.items()
+    }
+    caudas = {}
+    for dep_id, linhas in dados.assiduidade(ids):
+        linhas.sort(key=lambda linha: fragmentos[linha[0]][0])
+        partes = []
+        for sessao_id, status, motivo, partido in linhas:
+            chave = (status, motivo, partido)
+            cauda = caudas.get(chave)
+            if cauda is None:
+                cauda = caudas[chave] = '"status":%s,"motivo":%s,"partido":%s}' % (
+                    _json(status), _json(str(motivo or "").strip()), _json(partido)
+                )
+            partes.append(fragmentos[sessao_id][1] + cauda)
+        nome, partido_atual = dados.deputados[dep_id]
+        yield dep_id, nome, (
+            '{"ok":true,"deputado":{"nome":%s,"partido":%s},"total_sessoes":%d,"detalhes":[%s]}'
+            % (_json(nome), _json(partido_atual), len(linhas), ','.join(partes))
+        ).encode('utf-8')
+
+def ficheiro_detalhe(dep_id) -> str:
+    return f'{DIR_DETALHES}/{dep_id}.json'
+
+def montar_indice(nomes):
+    """Índice nome → id por ordem de id (nomes repetidos: ganha o último id)."""
+    return {'ok': True, 'deputados': {nomes[dep_id]: dep_id for dep_id in sorted(nomes)}}
+
+def exportar_detalhes_deputados(dados, nomes: dict, ids=None):
+    """
+    Exporta detalhes sessão-a-sessão, um ficheiro por deputado (só `ids`, se indicados).
+    Gera (ficheiro, conteúdo) à medida que cada deputado fica pronto; preenche `nomes` (id → nome).
+    """
+    for dep_id, nome, conteudo in detalhes_por_deputado(dados, ids):
+        nomes[dep_id] = nome
+        yield ficheiro_detalhe(dep_id), conteudo
+
+def exportar_substituicoes(dados):
+    """Exporta entradas e saídas por partido (uma linha por movimento; ver mandatos.py)"""
+    return {'ok': True, 'substituicoes': movimentos(dados.session)}
+
+def nome_colunar(filename: str) -> str:
+    return filename.removesuffix('.json') + '.col.json'
+
+def comprimidos(filename: str) -> list[str]:
+    """Cópias pré-comprimidas de um ficheiro colunar."""
+    return [filename + '.gz'] + ([filename + '.br'] if brotli is not None else [])
+
+def colunar(data: dict, chave: str) -> dict:
+    """
+    Lista de objetos → uma lista por coluna. Colunas de texto com valores repetidos
+    (partido, tipo, legislatura, nome...) passam a índices para `dicionarios[coluna]`.
+    """
+    linhas = data[chave]
+    colunas = {}
+    dicionarios = {}
+    for nome in dict.fromkeys(k for linha in linhas for k in linha):
+        valores = [linha.get(nome) for linha in linhas]
+        distintos = list(dict.fromkeys(valores))
+        if all(v is None or isinstance(v, str) for v in distintos) and len(distintos) * 2 <= len(valores):
+            posicao = {v: i for i, v in enumerate(distintos)}
+            dicionarios[nome] = distintos
+            valores = [posicao[v] for v in valores]
+        colunas[nome] = valores
+    return {
+        'ok': data['ok'],
+        'formato': 'colunar',
+        'chave': chave,
+        'linhas': len(linhas),
+        'colunas': colunas,
+        'dicionarios': dicionarios,
+    }
+
+def comprimir(filename: str, conteudo: bytes) -> bytes:
+    if filename.endswith('.gz'):
+        # mtime=0: saída determinística (não muda se o conteúdo não mudar)
+        return gzip.compress(conteudo, compresslevel=9, mtime=0)
+    return brotli.compress(conteudo, quality=11)
+
+def compacto_json(filename: str) -> bool:
+    """Ficheiros por deputado, índice e colunares: JSON compacto (restantes: indent=2)."""
+    return (filename == INDICE_DETALHES or filename.startswith(f'{DIR_DETALHES}/')
+            or filename.endswith('.col.json'))
+
+def serializar(filename: str, data) -> bytes:
+    if isinstance(data, bytes):  # já serializado (ficheiros por deputado)
+        return data
+    if compacto_json(filename):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+def sha256(conteudo: bytes) -> str:
+    return hashlib.sha256(conteudo).hexdigest()
+
+def carregar_estado_export(output_dir: Path) -> dict | None:
+    try:
+        return json.loads((output_dir / ESTADO_EXPORT).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def ficheiro_intacto(output_dir: Path, filename: str, estado: dict | None) -> bool:
+    """O ficheiro existe e é o que o último export escreveu (não foi alterado à mão/por git)."""
+    if estado is None:
+        return False
+    hash_anterior = estado.get('ficheiros', {}).get(filename)
+    filepath = output_dir / filename
+    return hash_anterior is not None and filepath.exists() and sha256(filepath.read_bytes()) == hash_anterior
+
+def ler_json(output_dir: Path, filename: str) -> dict:
+    return json.loads((output_dir / filename).read_text(encoding='utf-8'))
+
+def exportar_por_deputado(dados, output_dir, estado, ids, escrita, tempos) -> set:
+    """
+    deputados.json, deputados/<id>.json e deputados_indice.json: `ids` None → export total;
+    caso contrário só se recalculam esses deputados e funde-se com o existente.
+    Cada ficheiro por deputado é entregue a `escrita` logo que fica pronto.
+    Devolve os ficheiros por deputado que deixaram de existir.
+    """
+    t0 = time.perf_counter()
+    if ids is None or not ficheiro_intacto(output_dir, 'deputados.json', estado):
+        deputados = exportar_deputados(dados)
+    else:
+        existentes = [d for d in ler_json(output_dir, 'deputados.json')['deputados'] if d['id'] not in ids]
+        novos = exportar_deputados(dados, ids)['deputados']
+        deputados = {'ok': True, 'deputados': sorted(existentes + novos, key=lambda d: d['id'])}
+    tempos['deputados.json'] = time.perf_counter() - t0
+    escrita.submeter('deputados.json', deputados)
     
-    for dep in deputados:
-        # Verificar se deputado tem assiduidades
-        assiduidades = session.query(Assiduidade, Sessao).join(
-            Sessao, Assiduidade.sessao_id == Sessao.id
-        ).filter(
-            Assiduidade.deputado_id == dep.id
-        ).order_by(Sessao.data.desc()).all()
+    t0 = time.perf_counter()
+    incremental = ids is not None and ficheiro_intacto(output_dir, INDICE_DETALHES, estado)
+    nomes = {}
+    gerados = set()
+    for filename, conteudo in exportar_detalhes_deputados(dados, nomes, ids if incremental else None):
+        escrita.submeter(filename, conteudo)
+        gerados.add(filename)
+    if incremental:
+        anteriores = {
+            dep_id: nome
+            for nome, dep_id in ler_json(output_dir, INDICE_DETALHES)['deputados'].items()
+            if dep_id not in ids
+        }
+        nomes = {**anteriores, **nomes}
+        remover = {ficheiro_detalhe(dep_id) for dep_id in ids} - gerados
+    else:
+        remover = {f'{DIR_DETALHES}/{p.name}' for p in (output_dir / DIR_DETALHES).glob('*.json')} - gerados
+    tempos[f'{DIR_DETALHES}/*.json'] = time.perf_counter() - t0
+    escrita.submeter(INDICE_DETALHES, montar_indice(nomes))
+    return remover
+
+def gravar(output_dir: Path, filename: str, data) -> dict:
+    """
+    Serializa e escreve um ficheiro (só se o conteúdo mudou) e as cópias comprimidas.
+    Dicionários são escritos em fluxo (fluxo_json.escrever_json); os colunares são
+    serializados em memória, já que as cópias .gz/.br precisam do conteúdo todo.
+    """
+    t0 = time.perf_counter()
+    filepath = output_dir / filename
+    tamanhos_comprimidos = {}
+    if isinstance(data, bytes) or filename.endswith('.col.json'):
+        conteudo = serializar(filename, data)
+        hash_novo = sha256(conteudo)
+        inalterado = filepath.exists() and sha256(filepath.read_bytes()) == hash_novo
+        if not inalterado:
+            filepath.write_bytes(conteudo)
+        tamanho = len(conteudo)
         
-        # Só incluir deputados com registos
-        if assiduidades:
-            detalhes = [{
-                "data": sess.data.isoformat(),
-                "id_legis_sessao": sess.id_legis_sessao,
-                "tipo": sess.tipo,
-                "legislatura": sess.legislatura,
-                "numero": sess.numero,
-                "status": ass.status,
-                "motivo": str(ass.motivo or "").strip(),
-                "partido": ass.partido
-            } for ass, sess in assiduidades]
-            
-            resultado[dep.nome_original_ultimo] = {
-                "deputado": {
-                    "nome": dep.nome_original_ultimo,
-                    "partido": dep.partido_atual
-                },
-                "total_sessoes": len(detalhes),
-                "detalhes": detalhes
-            }
-    
-    print(f"   ✅ Detalhes de {len(resultado)} deputados exportados")
-    return {'ok': True, 'deputados_detalhes': resultado}
-
-def exportar_substituicoes(session):
-    """Exporta dados de substituições (placeholder)"""
-    print("🔄 Exportando substituições...")
-    
-    # Placeholder - implementar se necessário
-    return {'ok': True, 'substituicoes': []}
+        # Cópias .gz/.br dos colunares acompanham o ficheiro
+        if filename.endswith('.col.json'):
+            for irmao in comprimidos(filename):
+                caminho_irmao = output_dir / irmao
+                if not inalterado or not caminho_irmao.exists():
+                    caminho_irmao.write_bytes(comprimir(irmao, conteudo))
+                tamanhos_comprimidos[irmao.rsplit('.', 1)[1]] = caminho_irmao.stat().st_size
+    else:
+        hash_novo, tamanho, escrito = escrever_json(filepath, data, indent=None if compacto_json(filename) else 2)
+        inalterado = not escrito
+    
+    return {
+        'ficheiro': filename,
+        'hash': hash_novo,
+        'escrito': not inalterado,
+        'bytes': tamanho,
+        'comprimidos': tamanhos_comprimidos,
+        'segundos': time.perf_counter() - t0,
+    }
 
-def main():
-    print("🚀 Iniciando exportação de dados para JSON...")
+class Escrita:
+    """
+    Escrita dos ficheiros num pool de threads, à medida que são calculados.
+    No máximo 2×trabalhadores ficheiros ficam em espera, o que limita a memória
+    (os ficheiros por deputado são gerados um a um). Conjuntos que ainda leem do
+    cursor (iteradores) são escritos nesta thread, a única que usa a sessão.
+    """
     
-    # Configurar caminho de saída
-    output_dir = Path(__file__).parent / 'data'
-    output_dir.mkdir(exist_ok=True)
-    print(f"📁 Diretório de saída: {output_dir}\n")
+    def __init__(self, output_dir: Path, trabalhadores: int):
+        self.output_dir = output_dir
+        self.pool = ThreadPoolExecutor(max_workers=trabalhadores)
+        self.vagas = threading.BoundedSemaphore(trabalhadores * 2)
+        self.pendentes = []
+    
+    def submeter(self, filename: str, data):
+        if isinstance(data, dict) and any(isinstance(v, Iterator) for v in data.values()):
+            self.pendentes.append(gravar(self.output_dir, filename, data))
+            return
+        self.vagas.acquire()
+        futuro = self.pool.submit(gravar, self.output_dir, filename, data)
+        futuro.add_done_callback(lambda _: self.vagas.release())
+        self.pendentes.append(futuro)
+    
+    def resultados(self) -> list[dict]:
+        """Espera pelas escritas em curso e devolve os resultados por ordem de submissão."""
+        self.pool.shutdown(wait=True)
+        return [r.result() if isinstance(r, Future) else r for r in self.pendentes]
+
+def imprimir_relatorio(resultados, tempos):
+    """Tempo de cálculo e de escrita e tamanho por ficheiro (ficheiros por deputado agregados)."""
+    linhas = {}
+    for r in resultados:
+        por_deputado = r['ficheiro'].startswith(f'{DIR_DETALHES}/')
+        chave = f'{DIR_DETALHES}/*.json' if por_deputado else r['ficheiro']
+        linha = linhas.setdefault(chave, {'n': 0, 'escritos': 0, 'bytes': 0, 'segundos': 0.0, 'comprimidos': {}})
+        linha['n'] += 1
+        linha['escritos'] += r['escrito']
+        linha['bytes'] += r['bytes']
+        linha['segundos'] += r['segundos']
+        for formato, tamanho in r['comprimidos'].items():
+            linha['comprimidos'][formato] = linha['comprimidos'].get(formato, 0) + tamanho
+    
+    print(f"{'ficheiro':<32} {'calcular':>10} {'escrever':>10} {'tamanho':>11}")
+    for chave, linha in linhas.items():
+        nome = f"{chave} ({linha['n']})" if linha['n'] > 1 else chave
+        calcular = f"{tempos[chave] * 1000:.1f} ms" if chave in tempos else "—"
+        if not linha['escritos']:
+            estado = "⏭️  sem alterações"
+        elif linha['n'] > 1:
+            estado = f"✅ {linha['escritos']} escrito(s)"
+        else:
+            estado = "✅"
+        extra = "".join(f" {formato} {tamanho / 1024:.1f} KB" for formato, tamanho in linha['comprimidos'].items())
+        print(f"{nome:<32} {calcular:>10} {linha['segundos'] * 1000:>7.1f} ms {linha['bytes'] / 1024:>8.1f} KB  {estado}{extra}")
+
+def exportar(output_dir: Path, completo: bool = False, compacto: bool = False, trabalhadores: int = TRABALHADORES) -> list[dict]:
+    """
+    Export (incremental, salvo `completo`) para `output_dir`. Lê tudo de um só snapshot;
+    cada ficheiro é escrito (em paralelo, ou em fluxo a partir do cursor) logo que calculado.
+    Devolve o resultado de `gravar` por ficheiro.
+    """
+    (output_dir / DIR_DETALHES).mkdir(parents=True, exist_ok=True)
     
     # Conectar à BD
+    inicializar_bd()
     engine, SessionLocal = get_engine_and_session()
     session = SessionLocal()
     
     try:
-        # Exportar cada tipo de dados
-        arquivos = {
-            'deputados.json': exportar_deputados(session),
-            'sessoes.json': exportar_sessoes(session),
-            'estatisticas_sessoes.json': exportar_estatisticas_sessoes(session),
-            'atividades.json': exportar_atividades(session),
-            'agenda.json': exportar_agenda(session),
-            'deputados_detalhes.json': exportar_detalhes_deputados(session),
-            'substituicoes.json': exportar_substituicoes(session)
+        # BD anterior às tabelas de resumo/intervalos: preenchê-las antes de exportar
+        if reconstruir_se_vazio(session):
+            session.commit()
+            print("🧮 Tabelas de resumo reconstruídas\n")
+        if reconstruir_intervalos_se_vazio(session):
+            session.commit()
+            print("🧮 Intervalos partidários reconstruídos\n")
+        
+        t0 = time.perf_counter()
+        dados = Instantaneo(session)
+        estado_bd = dados.estado
+        geracao = estado_bd.geracao if estado_bd else 0
+        estado = None if completo else carregar_estado_export(output_dir)
+        # BD substituída por uma mais antiga (ou sem geração): não há como comparar
+        if estado is not None and (estado.get('geracao', 0) > geracao or estado_bd is None):
+            estado = None
+        # Mudou o modo de saída: os ficheiros colunares têm de ser (re)gerados ou removidos
+        if estado is not None and estado.get('compacto', False) != compacto:
+            estado = None
+        if estado is None:
+            print("🔁 Export completo\n")
+        else:
+            print(f"➕ Export incremental desde a geração {estado['geracao']} (atual: {geracao})\n")
+        
+        def mudou(tipos) -> bool:
+            return any((getattr(estado_bd, f'geracao_{tipo}') or 0) > estado['geracao'] for tipo in tipos)
+        
+        exportadores = {
+            'sessoes.json': exportar_sessoes,
+            'estatisticas_sessoes.json': exportar_estatisticas_sessoes,
+            'atividades.json': exportar_atividades,
+            'agenda.json': exportar_agenda,
+            'substituicoes.json': exportar_substituicoes,
         }
         
-        # Salvar cada arquivo
-        print()
-        for filename, data in arquivos.items():
-            filepath = output_dir / filename
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # Mostrar tamanho do arquivo
-            size = filepath.stat().st_size
-            size_kb = size / 1024
-            print(f"✅ {filename} - {size_kb:.1f} KB")
+        # Calcular cada conjunto a partir do snapshot (saltando os que não mudaram)
+        # e entregá-lo logo à escrita, sem acumular todos os ficheiros em memória
+        escrita = Escrita(output_dir, trabalhadores)
+        tempos = {}
+        recalculados = 0
+        ids = None if estado is None else dados.alterados_desde(estado['geracao'])
+        por_deputado_intactos = all(
+            ficheiro_intacto(output_dir, f, estado) for f in ('deputados.json', INDICE_DETALHES)
+        )
+        remover = set()
+        try:
+            if ids is None or ids or not por_deputado_intactos:
+                remover = exportar_por_deputado(dados, output_dir, estado, ids, escrita, tempos)
+            if (output_dir / LEGADO_DETALHES).exists():
+                remover.add(LEGADO_DETALHES)
+            for filename, exportador in exportadores.items():
+                if estado is None or mudou(DEPENDENCIAS[filename]) or not ficheiro_intacto(output_dir, filename, estado):
+                    t1 = time.perf_counter()
+                    data = exportador(dados)
+                    chave = COLUNARES.get(filename) if compacto else None
+                    if chave is not None:
+                        # O formato colunar precisa de todas as linhas: materializar a lista
+                        data[chave] = list(data[chave])
+                    escrita.submeter(filename, data)
+                    tempos[filename] = time.perf_counter() - t1
+                    recalculados += 1
+                    if chave is not None:
+                        t1 = time.perf_counter()
+                        escrita.submeter(nome_colunar(filename), colunar(data, chave))
+                        tempos[nome_colunar(filename)] = time.perf_counter() - t1
+                    del data
+            # Tudo lido: terminar a transação de leitura
+            session.rollback()
+        finally:
+            resultados = escrita.resultados()
+        if not compacto:
+            remover.update(p.name for p in output_dir.glob('*.col.json*'))
+        
+        hashes = dict((estado or {}).get('ficheiros', {}))
+        hashes.update((r['ficheiro'], r['hash']) for r in resultados)
+        if resultados:
+            imprimir_relatorio(resultados, tempos)
         
-        print(f"\n🎉 Exportação concluída! {len(arquivos)} arquivos criados.")
+        for filename in sorted(remover):
+            (output_dir / filename).unlink(missing_ok=True)
+            hashes.pop(filename, None)
+            if not filename.startswith(f'{DIR_DETALHES}/'):
+                print(f"🗑️  {filename} - removido")
+        removidos_por_deputado = sum(f.startswith(f'{DIR_DETALHES}/') for f in remover)
+        if removidos_por_deputado:
+            print(f"🗑️  {DIR_DETALHES}/*.json - {removidos_por_deputado} removido(s)")
+        
+        (output_dir / ESTADO_EXPORT).write_text(json.dumps({
+            'geracao': geracao,
+            'compacto': compacto,
+            'ficheiros': hashes,
+        }, ensure_ascii=False), encoding='utf-8')
+        
+        escritos = sum(r['escrito'] for r in resultados)
+        print(f"\n🎉 Exportação concluída em {(time.perf_counter() - t0) * 1000:.0f} ms! "
+              f"{escritos} arquivo(s) reescritos, {recalculados} conjunto(s) recalculados.")
+        return resultados
         
     finally:
         session.close()
 
+def main():
+    print("🚀 Iniciando exportação de dados para JSON...")
+    
+    # Configurar caminho de saída
+    output_dir = Path(__file__).parent / 'data'
+    print(f"📁 Diretório de saída: {output_dir}\n")
+    
+    exportar(
+        output_dir,
+        completo='--completo' in sys.argv[1:],
+        compacto='--compacto' in sys.argv[1:],
+    )
+
 if __name__ == '__main__':
     main()
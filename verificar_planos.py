@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Regressão de planos de execução (SQLite EXPLAIN QUERY PLAN).
+
+Cria uma BD sintética grande, chama cada endpoint da API com o cliente de testes
+do Flask, captura o SQL gerado e falha (exit 1) se alguma query quente fizer
+um full table scan ("SCAN tabela" sem índice) a uma tabela que deveria ser
+servida por índice.
+
+Uso: python3 verificar_planos.py [n_sessoes]   (por omissão: 1000)
+"""
+
+import base64
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BACKEND = Path(__file__).parent / 'backend'
+
+
+def cursor(listagem: str, valor, id_: int) -> str:
+    """Cursor de paginação (paginacao.Listagem.cursor) para uma posição fixa."""
+    texto = json.dumps([listagem, False, valor, id_], separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+# (endpoint, tabelas que não podem ser percorridas por inteiro)
+CASOS = [
+    ("/deputados", {"assiduidade"}),
+    ("/deputados?legislatura=XVII", {"assiduidade", "resumo_deputados"}),
+    ("/deputados/filtrados?legislatura=XVII", {"assiduidade", "resumo_deputados"}),
+    ("/deputados/filtrados?data_inicio=2016-01-01&data_fim=2016-03-01", {"assiduidade", "sessoes"}),
+    ("/deputados/filtrados?tipo=EXTRAORDIN%C3%81RIA", {"assiduidade", "sessoes"}),
+    ("/sessoes", {"assiduidade", "sessoes"}),
+    ("/estatisticas/sessoes", {"assiduidade", "sessoes", "resumo_sessoes"}),
+    ("/estatisticas/sessoes?legislatura=XVII&data_inicio=2016-01-01", {"assiduidade", "sessoes", "resumo_sessoes"}),
+    ("/estatisticas/sessoes?tipo=EXTRAORDIN%C3%81RIA", {"assiduidade", "sessoes", "resumo_sessoes"}),
+    ("/estatisticas/analise-avancada", {"assiduidade", "sessoes", "resumo_sessoes"}),
+    ("/deputados/Deputado%2017/detalhes", {"assiduidade", "sessoes"}),
+    # Resolução do nome: exato (sem acentos/maiúsculas), prefixo de palavra (ambíguo → 409), FTS5
+    ("/deputados/deputado%2017/detalhes", {"assiduidade", "sessoes", "deputados"}),
+    ("/deputados/Deput/detalhes", {"deputados", "tokens_deputados"}),
+    ("/deputados/putado%2017/detalhes", {"deputados", "tokens_deputados"}),
+    ("/substituicoes", {"assiduidade"}),
+    ("/atividade/deputados?legislatura=XVII&tipo=Iniciativas", {"deputado_atividades"}),
+    ("/atividade/deputados?tipo=Requerimentos", {"deputado_atividades"}),
+    ("/atividade/estatisticas?legislatura=XVII", {"deputado_atividades"}),
+    ("/atividade/agenda", {"agenda_items"}),
+    ("/atividade/agenda?legislatura=XVII", {"agenda_items"}),
+    ("/atividade/agenda?section=Plen%C3%A1rio", {"agenda_items"}),
+    ("/atividade/agenda?theme=Sa%C3%BAde", {"agenda_items"}),
+    ("/atividade/agenda?data_inicio=2016-02-01&data_fim=2016-03-01", {"agenda_items"}),
+    # Pesquisa FTS5: junção por id, sem percorrer as tabelas de origem
+    ("/atividade/agenda/pesquisa?q=even", {"agenda_items"}),
+    ("/atividade/agenda/pesquisa?q=evento%201&legislatura=XVII&limit=5", {"agenda_items"}),
+    ("/atividade/deputados/pesquisa?q=ini&tipo=Iniciativas", {"deputado_atividades", "deputados"}),
+    # Séries por período: poucas linhas de resumo_periodos, sem reler a assiduidade
+    ("/estatisticas/series", {"assiduidade", "resumo_periodos"}),
+    ("/estatisticas/series?granularidade=semana&partido=P&data_inicio=2016-01-01&data_fim=2016-06-30", {"assiduidade", "resumo_periodos"}),
+    ("/estatisticas/series?granularidade=dia_semana", {"assiduidade", "resumo_periodos"}),
+    # Classificações pré-calculadas: top-K e posição num intervalo do índice
+    ("/classificacoes/assiduidade", {"classificacoes", "resumo_deputados"}),
+    ("/classificacoes/atividade?legislatura=XVII&partido=P&limit=10", {"classificacoes", "deputado_atividades"}),
+    ("/classificacoes/faltas_penalizadoras?ordem=inversa&limit=10", {"classificacoes"}),
+    (f"/classificacoes/assiduidade?limit=20&cursor={cursor('classificacao', 40, 12)}", {"classificacoes"}),
+    ("/classificacoes/assiduidade/deputado/Deputado%2017?legislatura=XVII", {"classificacoes", "deputados"}),
+    ("/estatisticas/partidos?legislatura=XVII", {"medias_partidos", "resumo_deputados"}),
+    # Paginação keyset: a página seguinte é um intervalo no índice, sem OFFSET
+    ("/sessoes?limit=20&fields=data,tipo", {"sessoes"}),
+    (f"/sessoes?limit=20&cursor={cursor('sessoes', '2015-06-01', 150)}", {"sessoes"}),
+    (f"/atividade/deputados?tipo=Iniciativas&limit=20&cursor={cursor('atividades', 40, 5000)}", {"deputado_atividades"}),
+    (f"/atividade/deputados?legislatura=XVII&tipo=Iniciativas&limit=20&cursor={cursor('atividades', 40, 5000)}", {"deputado_atividades"}),
+    (f"/atividade/agenda?theme=Sa%C3%BAde&cursor={cursor('agenda', '2016-01-01T00:00:00', 100)}", {"agenda_items"}),
+]
+
+TIPOS_ATIVIDADE = ["Iniciativas", "Intervenções", "Requerimentos", "Audições", "Audiências", "Atos Parlamentares", "Comissões"]
+
+SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def popular_atividade_agenda(engine, n_agenda: int):
+    from sqlalchemy import insert
+    from models import DeputadoAtividade, AgendaItem
+
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(DeputadoAtividade), [
+            {"deputado_id": d, "tipo": tipo, "legislatura": leg, "total": rnd.randint(0, 80),
+             "detalhes": f"{tipo} do deputado {d} ({leg})"}
+            for d in range(1, 231) for tipo in TIPOS_ATIVIDADE for leg in ("XV", "XVI", "XVII")
+        ])
+        inicio = datetime(2015, 1, 5, 10)
+        conn.execute(insert(AgendaItem), [
+            {"externo_id": i, "titulo": f"Evento {i}", "tema": rnd.choice(["Saúde", "Educação", "Habitação"]),
+             "secao": rnd.choice(["Plenário", "Comissões", "Grupos Parlamentares"]), "leg_des": rnd.choice(["XVI", "XVII"]),
+             "inicio": inicio + timedelta(hours=6 * i), "fim": inicio + timedelta(hours=6 * i + 2)}
+            for i in range(n_agenda)
+        ])
+
+
+def planos(db_path: Path, statement: str, params) -> list[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        return [linha[3] for linha in conn.execute(f"EXPLAIN QUERY PLAN {statement}", params or ())]
+    finally:
+        conn.close()
+
+
+def main():
+    n_sessoes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'planos.db'
+        os.environ["ASSIDUIDADE_DB_URL"] = f"sqlite:///{db_path}"
+        sys.path.insert(0, str(BACKEND))
+        os.chdir(BACKEND)
+
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        from sqlalchemy.orm import sessionmaker
+
+        import app as api
+        from models import get_engine_and_session
+        from resumos import reconstruir_resumos
+        from mandatos import reconstruir_intervalos
+        from nomes import indexar_em_falta
+        from classificacoes import reconstruir_classificacoes
+        from series import reconstruir_series
+        from benchmark_estatisticas import popular
+
+        engine, _ = get_engine_and_session()
+        print(f"🏗️  A criar BD sintética ({n_sessoes} sessões × 230 deputados)...")
+        popular(engine, n_sessoes)
+        popular_atividade_agenda(engine, n_sessoes * 5)
+        s = sessionmaker(bind=engine)()
+        reconstruir_resumos(s)
+        reconstruir_series(s)
+        reconstruir_intervalos(s)
+        indexar_em_falta(s)
+        reconstruir_classificacoes(s)
+        s.commit()
+        s.close()
+
+        capturadas = []
+
+        def capturar(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                capturadas.append((statement, parameters))
+
+        event.listen(Engine, "before_cursor_execute", capturar)
+        cliente = api.app.test_client()
+        falhas = 0
+        for url, proibidas in CASOS:
+            capturadas.clear()
+            resposta = cliente.get(url)
+            # Respostas em streaming só executam as queries ao serem lidas
+            resposta.get_data()
+            resposta.close()
+            problemas = []
+            for statement, params in capturadas:
+                for detalhe in planos(db_path, statement, params):
+                    m = SCAN_RE.match(detalhe)
+                    if m and m.group(1) in proibidas:
+                        problemas.append(f"{detalhe}  ←  {' '.join(statement.split())[:140]}")
+            estado = "✅" if not problemas and resposta.status_code < 500 else "❌"
+            print(f"{estado} {url} ({len(capturadas)} queries, HTTP {resposta.status_code})")
+            for p in problemas:
+                print(f"     {p}")
+            if estado == "❌":
+                falhas += 1
+        event.remove(Engine, "before_cursor_execute", capturar)
+
+    if falhas:
+        print(f"\n❌ {falhas} endpoint(s) com full table scan em queries quentes.")
+        sys.exit(1)
+    print("\n🎉 Todos os planos usam índices nas tabelas quentes.")
+
+
+if __name__ == '__main__':
+    main()